@@ -13,9 +13,6 @@
 #  - Will crash if a file being ftp'ed is deleted prior to end of transfer being completed
 #  - currently does not validate remote directory (if one is supplied)
 # 
-# TODO:
-#   - add the source directory option for Multi-processing mode (no reverts to sequential)
-#
 #  V2:
 # Program defaults to Passive FTP mode, but may still generate excessive TIME_WAIT port states.
 # The OS default WAIT closures can be reduced on Linus systems by setting
@@ -33,37 +30,215 @@
 #
 #  V6:
 #  consolidated FTP setup into function
+#
+#  V7:
+#  Pooled sessions in Multi-processing mode. Each pool worker logs in once (pool initializer)
+#  and reuses that session for every file it is handed, reconnecting on its own if the session
+#  drops. Use -k to get the old per-file connect/login/quit behaviour.
+#
+#  V8:
+#  Asynchronous engine (-e). All sessions (control and data channels) run in a single process
+#  under one asyncore/poll event loop instead of one process per session, so a single client box
+#  can hold thousands of concurrent sessions. (asyncio is not available under python 2.x, hence
+#  asyncore.) -l then sets the number of concurrent sessions.
+#
+#  V9:
+#  Hybrid mode (-c). -l worker processes each run -c threads with their own session, for
+#  -l x -c concurrent sessions without paying a whole process per session.
+#
+#  V10:
+#  In-memory payload (-i load|mmap, -z size). The source file is loaded (or mmap'ed) once before
+#  the workers are forked and every transfer streams views of that shared read-only buffer
+#  instead of re-opening and re-reading the file. -z sends generated data, no source file needed.
+#
+#  V11:
+#  Every transfer's duration is recorded on a monotonic nanosecond clock into a log-bucketed
+#  histogram kept by each worker. The workers' histograms are merged at the end of the run and
+#  reported as p50/p90/p99/p99.9/max latency plus files/s and MB/s (-o also writes it as JSON).
+#
+#  V12:
+#  Per-phase timing (-b). Each protocol step of a session (connect+banner, login, CWD, TYPE,
+#  PASV/PORT, data connection, STOR until the 150, the data transfer itself and the wait from the
+#  last byte to the 226) is timed separately and reported as a breakdown across all workers, so
+#  server-side bottlenecks (slow auth, slow data channel setup, slow 226) can be told apart.
+#
+#  V13:
+#  Open-loop arrivals (-r, -y). Instead of sending as fast as the sessions allow, transfers are
+#  due at a fixed (or Poisson distributed) rate given in files/s or bytes/s, whatever the
+#  server does. Latency is measured from the time a transfer was due and the dispatch lag (how
+#  late transfers actually started) is reported, so results reflect the offered load rather
+#  than suffering from coordinated omission.
+#
+#  V14:
+#  Source directory (-m) in multi-processing (and hybrid) mode, optionally recursive (-w).
+#  The directory is scanned once, the files are queued largest first and each worker takes the
+#  next one as soon as it is free, so a few big files do not end up finishing last on one
+#  session. With -w the remote directory tree is created before the uploads start.
+#
+#  V15:
+#  Mixed workloads (-g). Instead of uploads only, the -n operations are a weighted mix of STOR,
+#  RETR, LIST, DELE and SIZE (eg. -g stor=60,retr=25,list=10,dele=3,size=2, or the name of a
+#  file with one 'op = weight' per line) run over the usual sessions against the files the run
+#  itself uploaded. Throughput and latency are reported per operation as well as overall.
+#
+#  V16:
+#  Segmented download (-j N). One remote file (-f) is split into N byte ranges, each fetched
+#  over its own session and data connection (REST offset + RETR, aborted once the range is in)
+#  and written in place into a preallocated local copy, to compare single and multi stream
+#  throughput over long fat links.
+#
+#  V17:
+#  -t accepts host:port, eg. to run against the local sink server (ftp-sink.py, which listens
+#  on 127.0.0.1:2121) for self-contained benchmarks of the client side.
+#
+#  V18:
+#  Worker processes no longer print (per file lines only with -v). Each keeps live file, byte,
+#  error and retry counts in a row of shared memory that the parent reads to print progress
+#  once a second and, at the end, the spread across workers. Failed transfers are reported
+#  by reason in the final statistics, and a worker that never delivered its statistics shows.
+#
+#  V19:
+#  Live dashboard for long (soak) runs: -L replaces the progress output with one status line,
+#  rewritten every second, of the current and moving average files/s and MB/s, the transfers
+#  in flight, the error rate and the ETA; -T logs the same samples to a CSV time series. Both
+#  read the shared counters (serial and asynchronous runs get one too), so the transfers
+#  themselves pay nothing for them.
+#
+#  V20:
+#  Distributed runs. ftp-gen.py -C N (coordinator) waits for N agents, ftp-gen.py --agent host
+#  (-A, run on each load host with its usual options) connects to it. The coordinator splits
+#  the -n files (and the -r rate) between the agents, starts them all at the same time, shows
+#  the cluster-wide progress from the counters they stream back and, at the end, merges their
+#  statistics (histograms included) into one report, plus a line per agent.
+#
+#  V21:
+#  FTPS (-S): AUTH TLS on the control channel and PROT P (TLS) data channels. Each worker (or
+#  worker thread) keeps one TLS context and offers the session of its control channel to every
+#  data channel, and its last session to its next login (reconnects, -k), so the server can
+#  resume it instead of doing a full handshake every time. The handshakes are timed apart from
+#  the transfers and reported per channel, with how many were resumed.
+#
+#  V22:
+#  Load profiles (-R). Instead of starting all -l sessions at once, the run goes through
+#  stages, eg. warmup=30s:2,ramp=2m:2-10,steady=10m:10,cooldown=30s:2, each a number of
+#  concurrent sessions (stepped over the stage for a from-to ramp) or an arrival rate (/s),
+#  and ends with the last one. Sessions log in when they are first needed, so there is no
+#  login storm at the start. Every step is reported on its own and the warm-up is left out
+#  of the headline figures.
+#
+#  V23:
+#  Saturation search (-K). Finds the capacity of a server instead of re-running with one -l
+#  after the other: short trials at a growing number of sessions (or arrival rate), each
+#  checked against an SLO (p99 latency, error rate), doubling then bisecting (or a golden-
+#  section search) down to the knee: the highest level that still meets it. Prints every
+#  trial, then the measured curve and the knee.
+#
+#  V24:
+#  Generated files (-G). Unique files, named and sized the way RandomFileMaker.py makes them
+#  (LoremFile___N_.txt, -G size or size,step), are generated while they are sent: the Lorem
+#  Ipsum generator feeds storbinary directly, so there is no staging directory to fill first
+#  and no local disk in the way. -f sets the name prefix.
+#
+#  V25:
+#  Integrity-tagged uploads (-H). Every upload is hashed (MD5, or any hashlib digest) block by
+#  block as it is sent, then renamed (RNFR/RNTO) to <digest>-<name>, the names MD5checker.py
+#  checks. An in-memory payload (-i, -z) is hashed once up front and stored under its final
+#  name straight away. Either way the data is read once.
+#
+#  V26:
+#  Multi-processing mode hands its tasks to the pool as they are made, in chunks (up to
+#  taskChunk files per task) and with at most taskWindow chunks per worker outstanding,
+#  instead of queueing one task per file up front: the parent's memory no longer grows with
+#  -n, even for millions of files.
 # ---------------------------------------------------------------------------------------------------
 
-from ftplib import FTP
+from ftplib import FTP, FTP_TLS, all_errors, error_temp, error_perm, error_reply, error_proto, parse227
+import socket
+import ssl
+import asyncore, asynchat
+import heapq
 import datetime
 import time
 import os, sys
 import time
 import resource
-from multiprocessing import Process, Pool
+from multiprocessing import Process, Pool, Value, Queue
+import threading
+from multiprocessing.util import Finalize
 import argparse
 import math
+import hashlib
+from genlib import PayloadBuffer, TransferStats, StatsCollector, ArrivalSchedule, WorkloadMix, parseRate, scanTree, \
+                   WorkerCounters, ProgressMonitor, AgentLink, Coordinator, TLSSessions, LoadProfile, SaturationSearch, \
+                   LoremFiles, HashingReader, digestOf, hashedName, TaskWindow, chunked, splitHostPort, monotonicNs, writeJSON
 
-ver = "V6.01"
+ver = "V26.00"
 
 # defaults/controls  (Most/all of these can be changed via command line arguments to the program)
 # ---------------------------------------------------------------------------------------------------
 
 targethost    = '192.168.60.44'      # ftp server host name or IP (this one is F5 Server VM)
+targetport    = 21              # ftp server control port
 ftpuser       = 'ftpuser'       # ftp destination userid
 ftpuserpw     = 'fractal'       # ftp destination password for userid
 sourcedir     = ''              # directory from which all files will be ftp'ed (overrides 'testfile') 
+recursive     = False           # with sourcedir: also send the files of its subdirectories
 remoteDir     = ''              # ftp session will 'cd' into this directory.
 testfile      = '1MbFile.txt'   # This is the file that will be ftp'ed over and over (but with new name)
 fast          = False           # Fast mode skips all loop prints and time calculations
 verbose       = False           # verbose mode toggle. default off
 filecnt       = 15              # total number of transfers
 maxConcurrent = 10              # max number of concurrent (multiprocessing) ftp connections/sessions
+taskChunk     = 32              # multi-processing: most files handed to a pool worker in one task
+taskWindow    = 4               # multi-processing: tasks handed out and not finished, per worker
 multiprocess  = True            # Multiprocess flag default
 passive       = True            # passive or active ftp mode
 unique        = False           # use a unique (new) connection for every file transferred.
 delay         = 0               # delay between sends (seconds)
+sessionRetries = 1              # pooled mode: reconnect attempts when a worker's session has dropped
+asyncEngine   = False           # use the single process asynchronous (event loop) engine
+asyncBlockSize = 65536          # async engine: bytes read from the source file per data channel write
+asyncTimeout  = 60              # async engine: seconds a session may wait on the server before giving up
+
+threadsPerProc = 1              # hybrid mode: threads (each with its own session) per worker process
+payloadMode   = ''              # '' (read source file per transfer), 'load', 'mmap' or 'synthetic'
+payloadSize   = 0               # synthetic payload: bytes per file
+payloadBlockSize = 65536        # in-memory payload: bytes handed to the data connection per write
+payload       = None            # the shared PayloadBuffer when payloadMode is set
+statsFile     = ''              # write the run summary (JSON) to this file
+phaseTiming   = False           # time each protocol phase (connect, login, PASV, STOR, 226...) separately
+arrivalRate   = 0               # open-loop mode: transfers due per second (or bytes per second), 0 = off
+arrivalBytes  = False           # arrivalRate is in bytes per second rather than files per second
+arrivalPoisson = False          # Poisson (exponential gaps) rather than evenly spaced arrivals
+arrivals      = None            # the ArrivalSchedule when arrivalRate is set
+sourceFiles   = []              # with sourcedir: (relative path, size) of the files to send, largest first
+workload      = None            # WorkloadMix of a mixed operation run (-g), None = uploads only
+segments      = 0               # segmented download mode: number of parallel ranges (0 = off)
+
+workerSession = threading.local()  # pooled/hybrid mode: .ftp is this worker's persistent session
+workerStats   = TransferStats() # transfers made by this process (merged into the parent's at the end)
+workerCounters = None           # multi-processing modes: the workers' live counts (WorkerCounters)
+fileLog       = True            # print a line per transfer (not from worker processes, unless -v)
+liveStatus    = False           # -L: one status line, rewritten every second, instead of progress lines
+seriesFile    = ''              # -T: write the progress samples to this CSV file
+sampleInterval = 1.0            # seconds between progress samples
+agentOf       = ''              # agent mode (-A): the coordinator's host[:port]
+agentLink     = None            # agent mode: the AgentLink to the coordinator
+fileOffset    = 0               # agent mode: files are numbered from here on (this agent's slice)
+coordAgents   = 0               # coordinator mode (-C): number of agents to wait for (0 = off)
+coordPort     = 7070            # coordinator port (-P)
+coordJoin     = 300             # coordinator mode: seconds to wait for every agent to join (-J)
+coordinator   = None            # coordinator mode: the Coordinator
+secure        = False           # -S: FTPS (explicit TLS: AUTH TLS, then PROT P data channels)
+loadProfile   = None            # -R: the LoadProfile (stages of sessions or of rates), None = off
+search        = None            # -K: the SaturationSearch (trials, each run under its own LoadProfile), None = off
+lorem         = None            # -G: the LoremFiles generated while they are sent (RandomFileMaker style), None = off
+hashAlgorithm = ''              # -H: name every upload <digest>-<name> (a hashlib algorithm), '' = off
+payloadDigest = None            # -H with an in-memory payload: its digest, worked out once up front
+sessionLostErrors = (EOFError, socket.error, error_temp)  # errors that mean the session is gone
+phaseOrder    = ['connect', 'tls', 'login', 'cwd', 'type', 'pasv', 'port', 'dataconnect', 'stor', 'datatls', 'data',
+                 'complete', 'rename']
+workloadOps   = ('stor', 'retr', 'list', 'dele', 'size')  # operations a mixed workload (-g) can use
  
 frontPadLen = int(math.log(filecnt+1,10))+3   # we add three (not 2) to allow for the fractional log return
 #frontPadLen   =       # the length of the entire string to be created (eg "______100_" )
@@ -80,8 +255,53 @@ longdescription = "This is a simple prototype program to test ftp servers. It pe
                   "looping sequence of 'puts' of a sample file, appending an incremental numeric new " + \
                   "filename extension to the destination file each time. The program can be used in " + \
                   "either serial mode or multi-processing mode. Note that -m (which is an mput command) " + \
-                  "will override -f (or the default file) and -n (or the default number of files). The " + \
-                  "delay option only works in serial mode."
+                  "will override -f (or the default file) and -n (or the default number of files); in " + \
+                  "multi-processing mode its files are sent largest first by whichever worker is free and " + \
+                  "-w includes subdirectories (the remote tree is created first; sftp-gen.py takes -D for " + \
+                  "that, its -w pipelines writes, and --recursive works in both). The " + \
+                  "delay option only works in serial mode. In multi-processing mode each worker process " + \
+                  "keeps one logged-in session for all of its transfers unless -k (unique) is used. The " + \
+                  "asynchronous engine (-e) runs all -l sessions in a single process and event loop, which " + \
+                  "allows thousands of concurrent sessions; it supports -f, -n, -d, -a and -k. With -c, " + \
+                  "multi-processing mode becomes hybrid: -l processes each running -c threads (sessions). " + \
+                  "-i keeps the source file in memory (load or mmap) for all transfers and -z sends " + \
+                  "generated data of the given size instead of a source file (-f then only names the files). " + \
+                  "At the end of a run the latency percentiles and throughput of all transfers are reported; " + \
+                  "-o also writes them to a JSON file. -b adds a breakdown of the time spent in each protocol " + \
+                  "phase (connect, login, PASV/PORT, STOR, data transfer, 226 completion). -r switches to " + \
+                  "open-loop mode: transfers are started at the given rate (files/s, or bytes/s with a " + \
+                  "B/KB/MB/GB suffix; -y for Poisson arrivals) no matter how long earlier ones take, latency " + \
+                  "is measured from when each transfer was due and the dispatch lag is reported. -g runs a " + \
+                  "weighted mix of operations instead of uploads only (eg. stor=60,retr=25,list=10,dele=3," + \
+                  "size=2, or a file of 'op = weight' lines) against the files the run uploads itself, with " + \
+                  "statistics per operation. -j N downloads the remote file -f instead, in N byte ranges over " + \
+                  "N parallel sessions (REST + RETR), into a local file named after it with a .download " + \
+                  "extension. Worker processes print nothing (per file lines need -v): the parent prints " + \
+                  "their progress once a second and, at the end, the errors by reason and the work done " + \
+                  "per worker. -L turns the progress into one live status line (current and average " + \
+                  "files/s and MB/s, transfers in flight, error rate, ETA) and -T logs it to a CSV file. " + \
+                  "For a distributed run start a coordinator (-C number of agents, with -n, -r, -o) and " + \
+                  "one agent (--agent coordinator host) with the usual options on each load host: the " + \
+                  "coordinator splits the files and the rate between the agents, starts them together and " + \
+                  "reports their merged statistics (the hosts' clocks should be in sync); it gives up if " + \
+                  "they have not all joined within -J seconds. -S uses FTPS " + \
+                  "(explicit TLS on the control and data channels, not with -e): each session resumes " + \
+                  "its worker's TLS session where the server allows it and the handshakes are reported " + \
+                  "on their own, per channel. The server's certificate is not verified. -R runs a load " + \
+                  "profile: stages of concurrent sessions (they set the number of workers, so no -l) or of arrival rates, " + \
+                  "eg. warmup=30s:2,ramp=2m:2-10,steady=10m:10,cooldown=30s:2 (or 5/s, 5-50/s@10, 40MB/s), " + \
+                  "until the last stage ends or -n files are sent, so give -n room. Each step is reported " + \
+                  "on its own; a stage named warmup is left out of the headline figures. -K searches for " + \
+                  "the knee of the server: short trials at more and more sessions (or a higher rate) until " + \
+                  "an SLO breaks, eg. p99=250ms,errors=1,sessions=1-64 (or rate=10-500/s), with trial=, " + \
+                  "warmup= and method=binary|golden; each trial runs until its time is up or -n files are " + \
+                  "sent (100000 by default with -K). Every trial is printed, then the curve and the knee. " + \
+                  "-G sends unique files generated on the fly instead of a source file, as " + \
+                  "RandomFileMaker.py would write them (-G size, or size,step for random multiples of " + \
+                  "step below size; -f sets the name prefix, LoremFile by default): no disk is involved. " + \
+                  "-H hashes every upload while it is sent (md5 by default, or sha1, sha256, ...) and " + \
+                  "renames it (RNFR/RNTO) to <digest>-<name>, the form MD5checker.py checks; an in-memory " + \
+                  "payload (-i, -z) is hashed once and stored under that name directly."
 
 # ------------------------------------------------------------------------------------------
 # makePadExt(numToEmbed)
@@ -105,6 +325,7 @@ longdescription = "This is a simple prototype program to test ftp servers. It pe
 def makePadExt(numToEmbed):
 
    frontPadChar = "_"
+   numToEmbed = numToEmbed + fileOffset   # (agent mode: the numbers of this agent's slice)
 
    # check if being ask to embed a number too big to fit the pad length
    maxPossible = (10**(frontPadLen-2)) - 1
@@ -127,47 +348,326 @@ def makePadExt(numToEmbed):
    return fname
 
 # ------------------------------------------------------------------------------------------
-# sendFileProc(sourceFile, destFile) 
+# sendFileProc(sourceFile, destFile, dueNs, op) 
 #
-# Initiates an ftp connection and calls the generic ftp sendFile function. 
+# Initiates an ftp connection and calls the generic ftp sendFile function (or, for a mixed
+# workload, runs operation op). dueNs is the time the transfer was due in open-loop mode
+# (None otherwise).
 #
 # Note that this version is intended to be called as a Child process.
 #
 # ------------------------------------------------------------------------------------------
 
-def sendFileProc(sourceFile, destFile):
+def sendFileProc(sourceFile, destFile, dueNs=None, op=None):
 
     if (not fast):
         vprint("In sub-process. Source:", sourceFile, " Dest:", destFile)
 
+    dispatchLag(dueNs)
     try:
-        ftp = FTPsetup()
-        rc = sendFile(ftp, sourceFile, destFile)
+        ftp = FTPconnect()
+        rc = transfer(ftp, sourceFile, destFile, dueNs, op)
         ftp.quit()
 
     except Exception, e:
-        print "Exception encountered while processing file [Multi mode]:", destFile, " Exception=", str(e)
+        workerStats.error(op, str(e))
+        vprint("Exception encountered while processing file [Multi mode]:", destFile, " Exception=", str(e))
 
 # ------------------------------------------------------------------------------------------
-# sendFile(Connection, sourceFile, destFile) 
+# poolWorkerInit(statsQueue, counters)
 #
-# Initiates an ftp transfer given a pre-existing ftp Connection.
+# Pool initializer, runs once in each worker process. Claims the worker's row of the shared
+# counters and arranges for the worker's statistics to be sent to the parent (statsQueue)
+# when it exits. In pooled-session mode (no -k) it also
+# logs in the session that every task handed to that worker will reuse (with a load profile
+# the first task does). A failed login here is not fatal; the first transfer will simply
+# try again.
 # ------------------------------------------------------------------------------------------
 
-def sendFile(ftp, sourceFile, destFile):
+def poolWorkerInit(statsQueue, counters):
 
-    confirmed = True
+    global workerStats
+    workerStats = TransferStats()   # (not whatever the parent had recorded when it forked us)
+    workerStats.share(counters)
+    Finalize(None, statsQueue.put, args=(workerStats,), exitpriority=5)
+    if (unique):
+        return
+
+    # QUIT the session when the worker exits (pool.close/join), before the stats are sent
+    Finalize(None, poolWorkerTeardown, exitpriority=10)
+
+    # with a load profile the session only logs in once its first task comes (no login storm)
+    if (loadProfile):
+        workerSession.ftp = None
+        return
+
+    try:
+        workerSession.ftp = FTPconnect()
+    except all_errors, e:
+        vprint("Exception during pooled FTP setup (will retry on first transfer). Exception=", str(e))
+        workerSession.ftp = None
+
+# ------------------------------------------------------------------------------------------
+# poolWorkerTeardown()
+#
+# Politely closes the worker's (or worker thread's) pooled session, if any, as it exits.
+# ------------------------------------------------------------------------------------------
+
+def poolWorkerTeardown():
+
+    ftp = getattr(workerSession, 'ftp', None)
+    if ftp is not None:
+        try:
+            ftp.quit()
+        except all_errors:
+            ftp.close()
+        workerSession.ftp = None
+
+# ------------------------------------------------------------------------------------------
+# sendFilePooled(sourceFile, destFile, dueNs, op)
+#
+# Pooled-session version of sendFileProc. Sends the file over the worker's persistent
+# session (one per process in the pool, one per thread in hybrid mode). If the session turns
+# out to have dropped (server timeout, reset, 421, ...) it is discarded and a new one is
+# logged in, up to sessionRetries times for this file.
+# ------------------------------------------------------------------------------------------
+
+def sendFilePooled(sourceFile, destFile, dueNs=None, op=None):
 
     if (not fast):
+        vprint("In pooled sub-process. Source:", sourceFile, " Dest:", destFile)
+
+    dispatchLag(dueNs)
+    for attempt in range(sessionRetries + 1):
+        try:
+            if getattr(workerSession, 'ftp', None) is None:
+                vprint("(Re)connecting pooled FTP session")
+                workerSession.ftp = FTPconnect()
+            return transfer(workerSession.ftp, sourceFile, destFile, dueNs, op)
+
+        except sessionLostErrors, e:
+            vprint("Pooled FTP session lost:", str(e))
+            if workerSession.ftp is not None:
+                workerSession.ftp.close()
+            workerSession.ftp = None
+            lastError = e
+            if (attempt < sessionRetries):
+                workerStats.retry(op)
+
+        except Exception, e:
+            workerStats.error(op, str(e))
+            vprint("Exception encountered while processing file [Pooled mode]:", destFile, " Exception=", str(e))
+            return None
+
+    workerStats.error(op, str(lastError))
+    vprint("Exception encountered while processing file [Pooled mode]:", destFile, " Exception=", str(lastError))
+    return None
+
+# ------------------------------------------------------------------------------------------
+# hybridProc(procNum, nextFileNum, statsQueue, counters)
+#
+# Hybrid mode (-c): worker process procNum (0 based) of the -l. Runs threadsPerProc threads,
+# each with its own ftp session, and waits for them to run out of files. The socket I/O of
+# the transfers releases the GIL, so the threads of one process really do send concurrently.
+# The process's statistics (shared by its threads, as is its row of the shared counters) go
+# back to the parent on statsQueue.
+# ------------------------------------------------------------------------------------------
+
+def hybridProc(procNum, nextFileNum, statsQueue, counters):
+
+    global workerStats
+    workerStats = TransferStats()   # (not whatever the parent had recorded when it forked us)
+    workerStats.share(counters)
+    threads = []
+    for loop in range(0, threadsPerProc):
+        # sessions are numbered across the processes first, so a profile's first levels
+        # spread over them
+        thread = threading.Thread(target=hybridThread, args=(nextFileNum, loop * maxConcurrent + procNum))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    statsQueue.put(workerStats)
+
+# ------------------------------------------------------------------------------------------
+# hybridThread(nextFileNum, sessionNum)
+#
+# Hybrid mode: takes the next file number from the counter shared by every thread of every
+# worker process and sends it, until filecnt files have been handed out. File naming is the
+# same as the multi-processing loop (see taskFor). Uses the thread's own persistent session
+# unless -k. With a load profile of sessions, session number sessionNum only runs while the
+# profile's level is above it (logged out while it is not) and stops with the profile.
+# ------------------------------------------------------------------------------------------
+
+def hybridThread(nextFileNum, sessionNum):
+
+    workerSession.ftp = None
+    while True:
+        if (loadProfile) and (not loadProfile.isRate):
+            if not loadProfile.active(sessionNum):
+                poolWorkerTeardown()
+            if not loadProfile.waitActive(sessionNum):
+                break
+        with nextFileNum.get_lock():
+            loop = nextFileNum.value
+            if (loop >= filecnt):
+                break
+            nextFileNum.value = loop + 1
+
+        srcfile, destfile, op = taskFor(loop)
+        dueNs = arrivals.wait(loop) if arrivals else None
+        if (unique):
+            sendFileProc(srcfile, destfile, dueNs, op)
+        else:
+            sendFilePooled(srcfile, destfile, dueNs, op)
+
+    poolWorkerTeardown()
+
+# ------------------------------------------------------------------------------------------
+# taskFor(loop)
+#
+# Returns (source file, destination file, operation) of task number 'loop' (0 based) of a
+# multi-processing run: the next file of sourceFiles with -m, the planned operation with -g
+# (the destination then being the file it acts on) and otherwise an upload of testfile with
+# the numbered extension, or of the generated file of that number with -G (named as
+# RandomFileMaker.py names them; there is no source file). The operation is None for plain
+# uploads.
+# ------------------------------------------------------------------------------------------
+
+def taskFor(loop):
+
+    if (sourcedir):
+        destfile = sourceFiles[loop][0]
+        return os.path.join(sourcedir, destfile), destfile, None
+    if (workload):
+        op, target = workload.task(loop)
+        if (lorem):
+            return None, lorem.name(fileOffset + target), op
+        return testfile, testfile + "." + makePadExt(target), op
+    if (lorem):
+        return None, lorem.name(fileOffset + loop), None
+    return testfile, testfile + "." + makePadExt(loop+1), None
+
+# ------------------------------------------------------------------------------------------
+# transfer(Connection, sourceFile, destFile, dueNs, op)
+#
+# Runs one task over a pre-existing ftp Connection: an upload (sendFile) unless a mixed
+# workload operation other than STOR is given (runOp).
+# ------------------------------------------------------------------------------------------
+
+def transfer(ftp, sourceFile, destFile, dueNs=None, op=None):
+
+    if (op is None) or (op == 'stor'):
+        return sendFile(ftp, sourceFile, destFile, dueNs, op)
+    return runOp(ftp, op, destFile, dueNs)
+
+# ------------------------------------------------------------------------------------------
+# runOp(Connection, op, fname, dueNs)
+#
+# Mixed workload: performs a non-upload operation on fname (RETR, SIZE, DELE) or on the
+# current directory (LIST) and records it under op. Downloaded data (file or listing) is
+# counted and discarded.
+# ------------------------------------------------------------------------------------------
+
+def runOp(ftp, op, fname, dueNs=None):
+
+    if (fileLog):
 
         begintime = datetime.datetime.now()
         begintimestr =  (begintime.strftime("%d/%m/%Y") + ' ' + begintime.strftime("%H:%M:%S"))
-        print " > Initiating transfer of file: ", destFile, "Timestamp:[", begintimestr , "]"
+        print " > Initiating", op.upper(), "of file: ", fname, "Timestamp:[", begintimestr , "]"
+
+    received = [0]
+    def discard(data):
+        received[0] = received[0] + len(data)
+
+    starttime = monotonicNs() if dueNs is None else dueNs
+    if (op == 'retr'):
+        rc = ftp.retrbinary('RETR ' + fname, discard, payloadBlockSize)
+    elif (op == 'list'):
+        rc = ftp.retrbinary('LIST', discard)      # binary: keeps the session in TYPE I for SIZE
+    elif (op == 'size'):
+        rc = ftp.size(fname)
+    elif (op == 'dele'):
+        rc = ftp.delete(fname)
+    workerStats.record(monotonicNs() - starttime, received[0], op)
+
+    if (fileLog):
+        curtime = datetime.datetime.now()
+        proctime = (str(curtime - begintime))
+        print " < Completed", op.upper(), fname, " [Return Code:", rc, "] Duration:", proctime
 
-    dafile = open(sourceFile, 'rb')
-    rc = ftp.storbinary('STOR '+destFile, dafile)
+    if (delay > 0):
+        time.sleep(delay)
 
-    if (not fast):
+    return rc
+
+# ------------------------------------------------------------------------------------------
+# dispatchLag(dueNs)
+#
+# Called as every transfer starts: counts it as in flight (see ProgressMonitor) and, in
+# open-loop mode, records how late the transfer that was due at dueNs is being started
+# (closed-loop transfers have dueNs None).
+# ------------------------------------------------------------------------------------------
+
+def dispatchLag(dueNs):
+
+    workerStats.begin()
+    if dueNs is not None:
+        workerStats.recordLag(monotonicNs() - dueNs)
+
+# ------------------------------------------------------------------------------------------
+# sendFile(Connection, sourceFile, destFile, dueNs, op) 
+#
+# Initiates an ftp transfer given a pre-existing ftp Connection. In open-loop mode (dueNs
+# given) the latency recorded runs from the time the transfer was due, not from now. op is
+# 'stor' when the upload is part of a mixed workload. With -G the file is generated as it is
+# sent (sourceFile is not used). With -H the data is hashed as it is sent and the file then
+# renamed to <digest>-<name> (an in-memory payload, whose digest is known up front, is stored
+# under that name straight away); the rename is part of the transfer's time.
+# ------------------------------------------------------------------------------------------
+
+def sendFile(ftp, sourceFile, destFile, dueNs=None, op=None):
+
+    confirmed = True
+
+    if (fileLog):
+
+        begintime = datetime.datetime.now()
+        begintimestr =  (begintime.strftime("%d/%m/%Y") + ' ' + begintime.strftime("%H:%M:%S"))
+        print " > Initiating transfer of file: ", destFile, "Timestamp:[", begintimestr , "]"
+
+    starttime = monotonicNs() if dueNs is None else dueNs
+    if (payload is not None):
+        dafile = payload.reader()
+        nbytes = payload.size
+        blocksize = payloadBlockSize
+    elif (lorem is not None):
+        dafile = lorem.open(destFile)
+        nbytes = dafile.size
+        blocksize = payloadBlockSize
+    else:
+        dafile = open(sourceFile, 'rb')
+        nbytes = os.fstat(dafile.fileno()).st_size
+        blocksize = 8192
+    storeName = destFile
+    if (payloadDigest):
+        storeName = hashedName(destFile, payloadDigest)
+    elif (hashAlgorithm):
+        dafile = HashingReader(dafile, hashAlgorithm)
+    if (phaseTiming):
+        rc = storbinaryPhased(ftp, 'STOR '+storeName, dafile, blocksize)
+    else:
+        rc = ftp.storbinary('STOR '+storeName, dafile, blocksize)
+    dafile.close()
+    if (hashAlgorithm) and (not payloadDigest):
+        t = monotonicNs()
+        ftp.rename(destFile, hashedName(destFile, dafile.hexdigest()))
+        phaseMark(t, 'rename')
+    workerStats.record(monotonicNs() - starttime, nbytes, op)
+
+    if (fileLog):
         curtime = datetime.datetime.now()
         curtimestr = (curtime.strftime("%d/%m/%Y") + ' ' + curtime.strftime("%H:%M:%S"))
         #proctime = (str(curtime - begintime)).split(".")[0] #truncate the fractional seconds
@@ -180,6 +680,160 @@ def sendFile(ftp, sourceFile, destFile):
 
     return rc
 
+# ------------------------------------------------------------------------------------------
+# phaseMark(t0, phase)
+#
+# Records the time since t0 against the given protocol phase (when -b is on) and returns the
+# current time, so consecutive phases can be chained:  t = phaseMark(t, 'login')
+# ------------------------------------------------------------------------------------------
+
+def phaseMark(t0, phase):
+
+    now = monotonicNs()
+    if (phaseTiming):
+        workerStats.recordPhase(phase, now - t0)
+    return now
+
+# ------------------------------------------------------------------------------------------
+# storbinaryPhased(ftp, cmd, fp, blocksize)
+#
+# Same as ftplib's storbinary() but with every step timed on its own: TYPE, PASV (or PORT), the
+# data connection, the STOR command up to the server's 1xx, the data channel's TLS handshake
+# (FTPS), the data transfer and the wait from the last byte to the 226.
+# ------------------------------------------------------------------------------------------
+
+def storbinaryPhased(ftp, cmd, fp, blocksize):
+
+    t = monotonicNs()
+    ftp.voidcmd('TYPE I')
+    t = phaseMark(t, 'type')
+
+    sock = conn = None
+    try:
+        if ftp.passiveserver:
+            host, port = ftp.makepasv()
+            t = phaseMark(t, 'pasv')
+            conn = socket.create_connection((host, port), ftp.timeout)
+            t = phaseMark(t, 'dataconnect')
+            resp = ftp.sendcmd(cmd)
+            if resp[0] == '2':
+                resp = ftp.getresp()
+            if resp[0] != '1':
+                raise error_reply, resp
+        else:
+            sock = ftp.makeport()
+            t = phaseMark(t, 'port')
+            resp = ftp.sendcmd(cmd)
+            if resp[0] == '2':
+                resp = ftp.getresp()
+            if resp[0] != '1':
+                raise error_reply, resp
+            conn, sockaddr = sock.accept()
+            if ftp.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                conn.settimeout(ftp.timeout)
+        t = phaseMark(t, 'stor')
+        if (secure):
+            conn = ftp.secureData(conn)
+            t = phaseMark(t, 'datatls')
+
+        while 1:
+            buf = fp.read(blocksize)
+            if not buf: break
+            conn.sendall(buf)
+        if isinstance(conn, ssl.SSLSocket):
+            conn.unwrap()
+        conn.close()
+        conn = None
+        t = phaseMark(t, 'data')
+    finally:
+        if conn is not None:
+            conn.close()
+        if sock is not None:
+            sock.close()
+
+    rc = ftp.voidresp()
+    phaseMark(t, 'complete')
+    return rc
+
+# ------------------------------------------------------------------------------------------
+# FTPSecure(tls)
+#
+# FTPS session (-S): ftplib's FTP_TLS, but with its TLS connections made by the worker's
+# TLSSessions 'tls' (see workerTLS): the control channel (auth) resumes the session of the
+# worker's previous one, if any, and every PROT P data channel the current session of the
+# control channel. Each handshake is recorded in workerStats, apart from the transfer.
+# ------------------------------------------------------------------------------------------
+
+class FTPSecure(FTP_TLS):
+
+    def __init__(self, tls):
+
+        FTP_TLS.__init__(self, context=tls.context)
+        self.tls = tls
+
+    def auth(self):
+
+        resp = self.voidcmd('AUTH TLS')
+        self.sock, ns, resumed = self.tls.wrap(self.sock, self.host)
+        workerStats.recordHandshake('control', ns, resumed)
+        self.file = self.sock.makefile(mode='rb')
+        return resp
+
+    # the data connection conn, secured if the session is in PROT P
+    def secureData(self, conn):
+
+        if not self._prot_p:
+            return conn
+        conn, ns, resumed = self.tls.wrap(conn, self.host, resumeFrom=self.sock)
+        workerStats.recordHandshake('data', ns, resumed)
+        return conn
+
+    def ntransfercmd(self, cmd, rest=None):
+
+        conn, size = FTP.ntransfercmd(self, cmd, rest)
+        return self.secureData(conn), size
+
+    # ABOR without the urgent (OOB) byte, which a TLS connection cannot carry
+    def abort(self):
+
+        self.putcmd('ABOR')
+        resp = self.getmultiline()
+        if resp[:3] not in ('426', '225', '226'):
+            raise error_proto, resp
+        return resp
+
+    # closes data connection conn (the transfer is done, or aborted)
+    def closeData(self, conn):
+
+        if isinstance(conn, ssl.SSLSocket):
+            self.tls.quiet(conn)
+        conn.close()
+
+    def close(self):
+
+        if isinstance(self.sock, ssl.SSLSocket):
+            self.tls.keep(self.sock)        # the latest session, for this worker's next login
+            self.tls.quiet(self.sock)
+        FTP_TLS.close(self)
+
+# ------------------------------------------------------------------------------------------
+# workerTLS()
+#
+# The TLSSessions of this worker (or worker thread), made on first use: one client context,
+# and the session to offer, for all of its FTPS connections. Test servers seldom have a
+# certificate that would verify, so the server's certificate is not checked.
+# ------------------------------------------------------------------------------------------
+
+def workerTLS():
+
+    tls = getattr(workerSession, 'tls', None)
+    if tls is None:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        tls = workerSession.tls = TLSSessions(context)
+    return tls
+
 # ------------------------------------------------------------------------------------------
 #  FTPteardown(ftpinst)
 #
@@ -191,43 +845,1139 @@ def FTPteardown(ftpinst):
     vprint("Terminating FTP instance")
     ftpinst.quit()
 
+# ------------------------------------------------------------------------------------------
+#  FTPconnect
+#
+#  Returns an active (logged in) ftp instance, an FTPSecure one in FTPS mode. Any failure is
+#  raised to the caller.
+# ------------------------------------------------------------------------------------------
+
+def FTPconnect():
+
+    t = monotonicNs()
+    if (secure):
+        ftp = FTPSecure(workerTLS())
+    else:
+        ftp = FTP()
+    ftp.connect(targethost, targetport)
+    t = phaseMark(t, 'connect')        # TCP connect + 220 banner
+    vprint("FTP connection established.")
+    if (secure):
+        ftp.auth()
+        t = phaseMark(t, 'tls')        # AUTH TLS + handshake
+        vprint("FTP control channel secured:", ftp.sock.version())
+    vprint("Attempting FTP login. User:"+ftpuser+" Password:"+ftpuserpw)
+    ftp.login(ftpuser, ftpuserpw) 
+    if (secure):
+        ftp.prot_p()                   # PBSZ 0 + PROT P: data channels over TLS too
+    t = phaseMark(t, 'login')
+    vprint("FTP login  established.")
+    if passive:
+       ftp.set_pasv(True) # use active mode
+       vprint("Passive mode set to True")
+    else:
+       ftp.set_pasv(False) # use active mode
+       vprint("Passive mode set to False")
+    if remoteDir:
+        vprint("Attempting to change FTP directory: "+remoteDir)
+        ftp.cwd(remoteDir)
+        phaseMark(t, 'cwd')
+        vprint("FTP directory changed: "+remoteDir)
+    if (workload):
+        ftp.voidcmd('TYPE I')          # SIZE is refused in ASCII mode by some servers
+    return ftp
+
 # ------------------------------------------------------------------------------------------
 #  FTPsetup
 #
-#  Returns an active (logged in) ftp instance
+#  Returns an active (logged in) ftp instance. Terminates the program on failure.
 # ------------------------------------------------------------------------------------------
 
 def FTPsetup():
 
     try:
-        ftp = FTP(targethost)
-        vprint("FTP connection established.")
-        vprint("Attempting FTP login. User:"+ftpuser+" Password:"+ftpuserpw)
-        ftp.login(ftpuser, ftpuserpw) 
-        vprint("FTP login  established.")
-        if passive:
-           ftp.set_pasv(True) # use active mode
-           vprint("Passive mode set to True")
-        else:
-           ftp.set_pasv(False) # use active mode
-           vprint("Passive mode set to False")
-        if remoteDir:
-            vprint("Attempting to change FTP directory: "+remoteDir)
-            ftp.cwd(remoteDir)
-            vprint("FTP directory changed: "+remoteDir)
-        return ftp
+        return FTPconnect()
 
     except Exception, e:
         print "Exception during FTP setup. Exception=", str(e)
         exit(3)
 
+# ------------------------------------------------------------------------------------------
+# Asynchronous engine (-e)
+#
+# Every session is an AsyncFTPSession (control channel) driven by a small state machine:
+#
+#    220 -> USER -> PASS -> TYPE I -> [CWD] -> { PASV|PORT -> STOR -> 1xx -> data -> 226 }* -> QUIT
+#
+# Each STOR is carried by an AsyncDataChannel which either connects to the PASV address or is
+# accepted from an AsyncDataListener (active mode). Sessions pull the next file number from
+# asyncNextFile() whenever they become idle, so all files are shared out between whichever
+# sessions are free, exactly like the pool does in multi-processing mode. Everything runs in
+# one process under asyncore.loop() using poll (select() is limited to 1024 descriptors).
+# ------------------------------------------------------------------------------------------
+
+asyncIssued   = 0               # async engine: number of files handed out to sessions so far
+asyncTargetIP = ''              # async engine: targethost, resolved once for all sessions
+
+# ------------------------------------------------------------------------------------------
+# asyncNextFile()
+#
+# Returns the (1 based) number of the next file to send, or None once filecnt have been issued.
+# ------------------------------------------------------------------------------------------
+
+def asyncNextFile():
+
+    global asyncIssued
+
+    if (asyncIssued >= filecnt):
+        return None
+    asyncIssued = asyncIssued + 1
+    return asyncIssued
+
+# ------------------------------------------------------------------------------------------
+# asyncWaitFor(session)
+#
+# Open-loop mode: parks a session whose next transfer is not due yet (see asyncRunDue).
+# ------------------------------------------------------------------------------------------
+
+asyncWaiting  = []                # heap of (due time, session) of the sessions parked
+
+def asyncWaitFor(session):
+
+    heapq.heappush(asyncWaiting, (session.dueNs, session))
+
+# ------------------------------------------------------------------------------------------
+# asyncRunDue()
+#
+# Starts the transfers of the parked sessions that have come due. Returns the number of
+# seconds until the next one is due (None when none are waiting).
+# ------------------------------------------------------------------------------------------
+
+def asyncRunDue():
+
+    now = monotonicNs()
+    while asyncWaiting and asyncWaiting[0][0] <= now:
+        dueNs, session = heapq.heappop(asyncWaiting)
+        if session.state == 'wait':          # (not failed/closed in the meantime)
+            session.beginFile()
+    if asyncWaiting:
+        return (asyncWaiting[0][0] - now) / 1e9
+    return None
+
+# ------------------------------------------------------------------------------------------
+# AsyncDataListener(session)
+#
+# Active mode: listens on an ephemeral port of the control connection's local address and
+# hands the accepted data connection over to the session.
+# ------------------------------------------------------------------------------------------
+
+class AsyncDataListener(asyncore.dispatcher):
+
+    def __init__(self, session, localIP):
+        asyncore.dispatcher.__init__(self)
+        self.session = session
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.bind((localIP, 0))
+        self.listen(1)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is None:
+            return
+        self.close()
+        self.session.dataAccepted(pair[0])
+
+    def writable(self):
+        return False
+
+    def handle_error(self):
+        self.close()
+        self.session.fail(sys.exc_info()[1])
+
+# ------------------------------------------------------------------------------------------
+# AsyncDataChannel(session, sock)
+#
+# The data connection of one STOR. Sends the source file once the session says the server is
+# ready (1xx reply) and closes the connection at end of file, which is what makes the server
+# send its 226.
+# ------------------------------------------------------------------------------------------
+
+class AsyncDataChannel(asyncore.dispatcher):
+
+    def __init__(self, session, sock=None):
+        asyncore.dispatcher.__init__(self, sock)
+        self.session = session
+        self.source  = None       # open source file once sending has started
+        self.buf     = ''
+        self.sent    = 0          # bytes sent so far
+
+    def startSending(self, sourceFile):
+        if (payload is not None):
+            self.source = payload.reader()
+        else:
+            self.source = open(sourceFile, 'rb')
+
+    def readable(self):
+        return True               # only to notice the server dropping the connection
+
+    def writable(self):
+        return (not self.connected) or (self.source is not None)
+
+    def handle_connect(self):
+        self.session.dataConnected()
+
+    def handle_read(self):
+        self.recv(4096)           # nothing is expected from the server on an upload
+
+    def handle_write(self):
+        if self.source is None:   # connect completion, or waiting for the server's 1xx
+            return
+        if not self.buf:
+            self.buf = self.source.read(asyncBlockSize)
+            if not self.buf:
+                self.finish()
+                self.session.dataDone()
+                return
+        sent = self.send(self.buf)
+        self.buf = self.buf[sent:]
+        self.sent = self.sent + sent
+
+    def finish(self):
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+        self.close()
+
+    def handle_close(self):
+        self.finish()
+        self.session.fail("Data connection closed by server")
+
+    def handle_error(self):
+        self.finish()
+        self.session.fail(sys.exc_info()[1])
+
+# ------------------------------------------------------------------------------------------
+# AsyncFTPSession()
+#
+# One FTP control connection. Logs in, then sends files until asyncNextFile() runs dry. With
+# -k (unique) it logs out after every file and a fresh session takes over.
+# ------------------------------------------------------------------------------------------
+
+class AsyncFTPSession(asynchat.async_chat):
+
+    def __init__(self):
+        asynchat.async_chat.__init__(self)
+        self.set_terminator('\r\n')
+        self.ibuffer   = []
+        self.multiCode = None      # set while inside a multi-line reply
+        self.state     = 'connect'
+        self.loggedIn  = False
+        self.fileNum   = None
+        self.destFile  = None
+        self.data      = None      # AsyncDataChannel of the transfer in progress
+        self.listener  = None      # AsyncDataListener (active mode)
+        self.dataReady = False     # server has answered the STOR with a 1xx
+        self.lastHeard = time.time()
+        self.phaseNs   = monotonicNs() # start of the protocol phase in progress (-b)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect((asyncTargetIP, targetport))
+
+    # --- control channel plumbing ---
+
+    def collect_incoming_data(self, data):
+        self.ibuffer.append(data)
+        self.lastHeard = time.time()
+
+    def found_terminator(self):
+        line = ''.join(self.ibuffer)
+        self.ibuffer = []
+        if self.multiCode:
+            if line[:3] == self.multiCode and line[3:4] == ' ':
+                self.multiCode = None
+                self.handleReply(line[:3], line)
+            return
+        if line[3:4] == '-':
+            self.multiCode = line[:3]
+            return
+        self.handleReply(line[:3], line)
+
+    def sendCmd(self, cmd, state):
+        self.state = state
+        self.push(cmd + '\r\n')
+
+    def mark(self, phase):
+        self.phaseNs = phaseMark(self.phaseNs, phase)
+
+    def handle_connect(self):
+        pass
+
+    def handle_close(self):
+        if self.state == 'quit':
+            self.close()
+        else:
+            self.fail("Control connection closed by server")
+
+    def handle_error(self):
+        self.fail(sys.exc_info()[1])
+
+    # --- protocol state machine ---
+
+    def handleReply(self, code, line):
+
+        state = self.state
+
+        if code[0] == '1':                       # preliminary reply (data connection opening)
+            if state == 'stor':
+                self.mark('stor')
+                self.dataReady = True
+                self.startData()
+            return
+
+        if state == 'connect' and code == '220':
+            self.mark('connect')
+            self.sendCmd('USER ' + ftpuser, 'user')
+        elif state == 'user' and code == '230':
+            self.mark('login')
+            self.sendCmd('TYPE I', 'type')
+        elif state == 'user' and code == '331':
+            self.sendCmd('PASS ' + ftpuserpw, 'pass')
+        elif state == 'pass' and code[0] == '2':
+            self.mark('login')
+            self.sendCmd('TYPE I', 'type')
+        elif state == 'type' and code[0] == '2':
+            self.mark('type')
+            if remoteDir:
+                self.sendCmd('CWD ' + remoteDir, 'cwd')
+            else:
+                self.loggedIn = True
+                self.nextFile()
+        elif state == 'cwd' and code[0] == '2':
+            self.mark('cwd')
+            self.loggedIn = True
+            self.nextFile()
+        elif state == 'pasv' and code == '227':
+            self.mark('pasv')
+            host, port = parse227(line)
+            self.data = AsyncDataChannel(self)
+            self.data.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.data.connect((host, port))
+            self.state = 'dataconnect'            # STOR goes out once the data channel is up
+        elif state == 'port' and code[0] == '2':
+            self.mark('port')
+            self.sendCmd('STOR ' + self.destFile, 'stor')
+        elif state == 'stor' and code[0] == '2':  # 226 (or 250) transfer complete
+            self.mark('complete')
+            self.completed(line)
+        elif state == 'quit':
+            self.close()
+        elif state in ('pasv', 'port', 'stor') and code[0] in '45':
+            self.transferFailed(line)             # refused by the server, session still usable
+        else:
+            self.fail(line)
+
+    def nextFile(self):
+
+        self.fileNum = asyncNextFile()
+        if self.fileNum is None:
+            self.sendCmd('QUIT', 'quit')
+            return
+
+        self.destFile  = testfile + "." + makePadExt(self.fileNum)
+        self.dueNs     = None
+        if arrivals:
+            self.dueNs = arrivals.due(self.fileNum - 1)
+            if (self.dueNs > monotonicNs()):
+                self.state = 'wait'        # asyncMain calls beginFile() once it is due
+                asyncWaitFor(self)
+                return
+        self.beginFile()
+
+    def beginFile(self):
+
+        dispatchLag(self.dueNs)
+        self.dataReady = False
+        self.beginNs   = monotonicNs()
+        self.phaseNs   = self.beginNs
+        if self.dueNs is not None:
+            self.beginNs = self.dueNs
+        self.sentBytes = 0
+        if (not fast):
+            begintime = datetime.datetime.now()
+            begintimestr =  (begintime.strftime("%d/%m/%Y") + ' ' + begintime.strftime("%H:%M:%S"))
+            print " > Initiating transfer of file: ", self.destFile, "Timestamp:[", begintimestr , "]"
+
+        if passive:
+            self.sendCmd('PASV', 'pasv')
+        else:
+            localIP = self.socket.getsockname()[0]
+            self.listener = AsyncDataListener(self, localIP)
+            port = self.listener.socket.getsockname()[1]
+            self.sendCmd('PORT ' + localIP.replace('.', ',') + ',' + str(port >> 8) + ',' + str(port & 255), 'port')
+
+    def dataConnected(self):
+        self.mark('dataconnect')
+        self.sendCmd('STOR ' + self.destFile, 'stor')
+
+    def dataAccepted(self, sock):
+        self.listener = None
+        self.data = AsyncDataChannel(self, sock)
+        self.startData()
+
+    def startData(self):
+        # sending starts once the data connection exists AND the server said go (1xx)
+        if self.dataReady and self.data is not None and self.data.source is None:
+            self.data.startSending(testfile)
+
+    def dataDone(self):
+        self.mark('data')
+        self.sentBytes = self.data.sent
+        self.data = None
+
+    def completed(self, line):
+
+        duration = monotonicNs() - self.beginNs
+        workerStats.record(duration, self.sentBytes)
+        if (not fast):
+            proctime = str(datetime.timedelta(microseconds=duration / 1000))
+            print " < Completed File ", self.destFile, " [Return Code:", line, "] Duration:", proctime
+        else: # THIS IS THE MINIMAL PRINT IN FAST MODE SO THAT USER KNOWS AT LEAST SOMETHING IS GOING ON!
+            print str(self.fileNum)+"a" ,
+            sys.stdout.flush()
+
+        if (unique):
+            self.sendCmd('QUIT', 'quit')
+            AsyncFTPSession()             # fresh connection for the next file
+        else:
+            self.nextFile()
+
+    def closeData(self):
+
+        if self.data is not None:
+            self.data.finish()
+        if self.listener is not None:
+            self.listener.close()
+        self.data = self.listener = None
+
+    def transferFailed(self, reason):
+
+        self.closeData()
+        workerStats.error(None, str(reason))
+        print "Exception encountered while processing file [Async mode]:", self.destFile, " Exception=", str(reason)
+        self.nextFile()
+
+    def fail(self, reason):
+
+        self.closeData()
+        self.close()
+
+        if self.state == 'quit':
+            return
+        self.state = 'quit'
+
+        if self.fileNum is not None:
+            workerStats.error(None, str(reason))
+            print "Exception encountered while processing file [Async mode]:", self.destFile, " Exception=", str(reason)
+        else:
+            print "Exception during FTP setup [Async mode]. Exception=", str(reason)
+
+        # a session that got logged in is replaced; one that never did gives up (server down,
+        # bad credentials, ...) rather than spinning on reconnects.
+        if self.loggedIn:
+            AsyncFTPSession()
+
+# ------------------------------------------------------------------------------------------
+# asyncCheckTimeouts()
+#
+# Fails any session that has not heard from the server for asyncTimeout seconds (a banner that
+# never comes, a lost 226, ...). A session busy pushing data, or waiting for its next transfer
+# to come due (open-loop mode), is not considered idle.
+# ------------------------------------------------------------------------------------------
+
+def asyncCheckTimeouts():
+
+    expired = time.time() - asyncTimeout
+    for channel in asyncore.socket_map.values():
+        if isinstance(channel, AsyncFTPSession) and channel.lastHeard < expired:
+            if (channel.data is not None and channel.data.source is not None) or channel.state == 'wait':
+                channel.lastHeard = time.time()
+            else:
+                channel.fail("Timed out waiting for server (state: " + channel.state + ")")
+
+# ------------------------------------------------------------------------------------------
+# asyncMain()
+#
+# Runs the asynchronous engine: starts maxConcurrent sessions and spins the event loop until
+# every session has logged out.
+# ------------------------------------------------------------------------------------------
+
+def asyncMain():
+
+    global asyncTargetIP
+
+    # every session needs a control socket and, while transferring, a data socket
+    softlimit, hardlimit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if (softlimit < hardlimit):
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hardlimit, hardlimit))
+    print "Open file limit: ", resource.getrlimit(resource.RLIMIT_NOFILE)
+
+    asyncTargetIP = socket.gethostbyname(targethost)
+    sessions = min(maxConcurrent, filecnt)
+    if (not fast):
+        print "FTP sessions throttled to ", sessions, " concurrent connections (asynchronous engine)"
+
+    for loop in range(0, sessions):
+        AsyncFTPSession()
+
+    nextcheck = time.time() + 1
+    while asyncore.socket_map:
+        timeout = 1.0
+        wait = asyncRunDue() if asyncWaiting else None
+        if wait is not None:
+            timeout = min(timeout, max(wait, 0.001))
+        asyncore.loop(timeout=timeout, use_poll=True, count=1)
+        if (asyncWaiting):
+            asyncRunDue()
+        if (time.time() >= nextcheck):
+            asyncCheckTimeouts()
+            nextcheck = time.time() + 1
+
+# ------------------------------------------------------------------------------------------
+# hybridMain()
+#
+# Hybrid mode: starts maxConcurrent worker processes of threadsPerProc threads each, all
+# drawing file numbers from one shared counter, waits for them to finish (printing their
+# progress) and returns their merged statistics.
+# ------------------------------------------------------------------------------------------
+
+def hybridMain():
+
+    global workerCounters
+
+    if (not fast) and (not search):
+        print "FTP sessions throttled to ", maxConcurrent, " processes x ", threadsPerProc, " threads = ", \
+              maxConcurrent * threadsPerProc, " concurrent connections"
+
+    nextFileNum = Value('l', 0)
+    workerCounters = WorkerCounters(maxConcurrent)
+    statsQueue = Queue()
+    collector = StatsCollector(statsQueue)
+    procs = []
+    for loop in range(0, maxConcurrent):
+        proc = Process(target=hybridProc, args=(loop, nextFileNum, statsQueue, workerCounters))
+        proc.start()
+        procs.append(proc)
+    monitor = startMonitor(workerCounters, filecnt)
+    for proc in procs:
+        proc.join()
+    if (monitor):
+        monitor.finish()
+
+    return collector.finish()
+
+# ------------------------------------------------------------------------------------------
+# poolMain()
+#
+# Multi-processing mode: a pool of maxConcurrent worker processes, handed one task per file
+# (or operation) in order (largest first with -m); each worker takes the next as soon as it is
+# done with its last one. A load profile of sessions only lets as many tasks run at once as
+# its current level, until it ends. Returns the workers' merged statistics.
+# ------------------------------------------------------------------------------------------
+
+def poolMain():
+
+    global workerCounters
+
+    workerCounters = WorkerCounters(maxConcurrent)
+    statsQueue = Queue()
+    collector = StatsCollector(statsQueue)
+    pool = Pool(processes=maxConcurrent, initializer=poolWorkerInit, initargs=(statsQueue, workerCounters))
+    if (unique):
+        taskfunc = sendFileProc     # new connection for every file
+    else:
+        taskfunc = sendFilePooled   # one persistent session per worker
+    if (not fast) and (not search):
+        print "FTP sessions throttled to ", maxConcurrent, " concurrent connections",
+        if (unique):
+            print "(new connection per file)"
+        else:
+            print "(pooled sessions)"
+
+    # tasks are made as they are handed out and only so many are out at a time (a load profile
+    # of sessions: as many as its level), so the parent's memory does not grow with filecnt
+    monitor = startMonitor(workerCounters, filecnt)
+    if (loadProfile is not None) and (not loadProfile.isRate):
+        window = loadProfile
+    else:
+        window = TaskWindow(taskWindow * maxConcurrent)
+    for tasks in chunked(taskStream(), taskChunkSize()):
+        if not window.enter():
+            break
+        res = pool.apply_async(runTasks, (taskfunc, tasks), callback=window.leave)
+
+    pool.close()
+    pool.join()
+    if (monitor):
+        monitor.finish()
+    return collector.finish()
+
+# ------------------------------------------------------------------------------------------
+# taskStream()
+#
+# Multi-processing mode: the tasks of the run, (source, destination, dueNs, op) each, made one
+# at a time as they are asked for (see taskFor). In open-loop mode a task is only made once it
+# is due.
+# ------------------------------------------------------------------------------------------
+
+def taskStream():
+
+    for loop in xrange(filecnt):
+        srcfile, destfile, op = taskFor(loop)
+        dueNs = arrivals.wait(loop) if arrivals else None
+        vprint("Starting process for ", destfile)
+        yield srcfile, destfile, dueNs, op
+
+# ------------------------------------------------------------------------------------------
+# taskChunkSize()
+#
+# Files per pool task: one when every task has to start at its own time (open-loop arrivals)
+# or be let in by a load profile, otherwise up to taskChunk, but few enough that every worker
+# gets several chunks (a chunk of the largest files first, with -m, should not hold up the
+# end of the run).
+# ------------------------------------------------------------------------------------------
+
+def taskChunkSize():
+
+    if (arrivals) or (loadProfile is not None):
+        return 1
+    return max(1, min(taskChunk, filecnt // (maxConcurrent * taskWindow * 2)))
+
+# ------------------------------------------------------------------------------------------
+# runTasks(taskfunc, tasks)
+#
+# Pool task: runs a chunk of tasks, (source, destination, dueNs, op) each, one after the other
+# with taskfunc (sendFileProc or sendFilePooled, which account for their own errors). Whatever
+# escapes them is counted against that task: the pool task must always return, or its
+# callback never gives its place in the task window (or load profile) back.
+# ------------------------------------------------------------------------------------------
+
+def runTasks(taskfunc, tasks):
+
+    for srcfile, destfile, dueNs, op in tasks:
+        try:
+            taskfunc(srcfile, destfile, dueNs, op)
+        except Exception, e:
+            workerStats.error(op, str(e))
+            vprint("Exception encountered while processing file:", destfile, " Exception=", str(e))
+
+# ------------------------------------------------------------------------------------------
+# searchMain()
+#
+# Saturation search (-K): runs one short trial after the other (in hybrid mode with -c, pool
+# mode otherwise), each under a load profile of its own (a warm-up, then the trial at the
+# level the search asks for), until the search has found the knee. Prints a line per trial,
+# then the measured curve and the knee (and writes them to statsFile as JSON if -o was given).
+# ------------------------------------------------------------------------------------------
+
+def searchMain():
+
+    global loadProfile, arrivals, filecnt, maxConcurrent
+
+    print "Saturation search:", search.describe()
+    cap = filecnt
+    while True:
+        level = search.next()
+        if level is None:
+            break
+
+        # a fresh profile (and pool) for every trial, set before the workers are forked
+        loadProfile = search.profile(level)
+        TransferStats.profile = loadProfile
+        if (search.isRate):
+            filecnt = cap
+            arrivals = makeArrivals(filecnt, fileSizes())
+            filecnt = arrivals.count
+        else:
+            maxConcurrent = (level + threadsPerProc - 1) // threadsPerProc
+        loadProfile.start(arrivals.startNs if arrivals else None)
+
+        starttime = monotonicNs()
+        if (threadsPerProc > 1):
+            trialStats = hybridMain()
+        else:
+            trialStats = poolMain()
+        print search.result(level, trialStats.summary(monotonicNs() - starttime))
+        sys.stdout.flush()
+
+    print
+    for line in search.report():
+        print line
+
+    if (statsFile):
+        summary = { 'tool'     : os.path.basename(__file__),
+                    'version'  : ver,
+                    'target'   : targethost + ":" + str(targetport),
+                    'engine'   : 'hybrid' if threadsPerProc > 1 else 'pool',
+                    'threads'  : threadsPerProc,
+                    'unique'   : unique,
+                    'ftps'     : secure,
+                    'payload'  : payloadMode or ('generated' if lorem else 'file'),
+                    'workload' : workload.describe() if workload else 'stor',
+                    'search'   : search.toDict() }
+        writeJSON(statsFile, summary)
+        print "Summary written to", statsFile
+
+# ------------------------------------------------------------------------------------------
+# FTPmakeDirs(dirs)
+#
+# -m with -w: creates the remote directories (relative to remoteDir, parents listed before
+# their children) over one session before any file is sent. Directories that already exist
+# are fine.
+# ------------------------------------------------------------------------------------------
+
+def FTPmakeDirs(dirs):
+
+    ftp = FTPsetup()
+    for dirname in dirs:
+        try:
+            ftp.mkd(dirname)
+            vprint("Created remote directory: " + dirname)
+        except error_perm, e:
+            vprint("Remote directory " + dirname + ": " + str(e))  # (most likely exists already)
+    FTPteardown(ftp)
+
+# ------------------------------------------------------------------------------------------
+# segmentedMain()
+#
+# Segmented download mode (-j): fetches remote file testfile in 'segments' byte ranges, one
+# process and session per range, into a local file of the same (base) name plus .download,
+# created at its full size beforehand so every range can be written in place. Returns the
+# merged statistics (one transfer per range) and the size of the file.
+# ------------------------------------------------------------------------------------------
+
+def segmentedMain():
+
+    global workerCounters
+
+    try:
+        ftp = FTPconnect()
+        ftp.voidcmd('TYPE I')
+        size = ftp.size(testfile)
+        FTPteardown(ftp)
+    except all_errors, e:
+        print "Remote file " + testfile + " cannot be sized:", str(e)
+        sys.exit(2)
+    if (size is None) or (size == 0):
+        print "Remote file is empty or its size is unknown (SIZE):", testfile
+        sys.exit(2)
+
+    localfile = os.path.basename(testfile) + ".download"
+    fh = open(localfile, 'wb')
+    fh.truncate(size)
+    fh.close()
+
+    count = min(segments, size)
+    print "Downloading", testfile, "(" + str(size), "bytes) in", count, "segments to", localfile
+
+    workerCounters = WorkerCounters(count)
+    statsQueue = Queue()
+    collector = StatsCollector(statsQueue)
+    procs = []
+    for loop in range(0, count):
+        offset = size * loop / count
+        length = size * (loop + 1) / count - offset
+        proc = Process(target=segmentProc, args=(localfile, offset, length, offset + length == size, statsQueue,
+                                                 workerCounters))
+        proc.start()
+        procs.append(proc)
+    monitor = startMonitor(workerCounters, count)
+    for proc in procs:
+        proc.join()
+    monitor.finish()
+
+    return collector.finish(), size
+
+# ------------------------------------------------------------------------------------------
+# segmentProc(localfile, offset, length, last, statsQueue, counters)
+#
+# Segmented download: one of the range processes. Fetches its range (counted in its row of
+# the shared counters) and sends its statistics back to the parent.
+# ------------------------------------------------------------------------------------------
+
+def segmentProc(localfile, offset, length, last, statsQueue, counters):
+
+    global workerStats
+    workerStats = TransferStats()   # (not whatever the parent had recorded when it forked us)
+    workerStats.share(counters)
+    try:
+        fetchRange(localfile, offset, length, last)
+    except Exception, e:
+        workerStats.error(None, str(e))
+        vprint("Exception encountered while fetching range", offset, "-", offset + length - 1, "Exception=", str(e))
+    statsQueue.put(workerStats)
+
+# ------------------------------------------------------------------------------------------
+# fetchRange(localfile, offset, length, last)
+#
+# Opens a session, restarts the RETR of testfile at 'offset' (REST) and writes the 'length'
+# bytes that follow at the same offset of localfile, through a descriptor of its own (python
+# 2.x has no os.pwrite; a descriptor per range gives the same positioned writes). Unless the
+# range runs to the end of the file ('last') the transfer is aborted (ABOR) as soon as the
+# range is in, rather than letting the server send the rest of the file.
+# ------------------------------------------------------------------------------------------
+
+def fetchRange(localfile, offset, length, last):
+
+    workerStats.begin()
+    starttime = monotonicNs()
+    ftp = FTPconnect()
+    ftp.voidcmd('TYPE I')
+
+    fh = open(localfile, 'r+b')
+    fh.seek(offset)
+    conn = ftp.transfercmd('RETR ' + testfile, offset or None)
+    remaining = length
+    try:
+        while remaining > 0:
+            data = conn.recv(min(payloadBlockSize, remaining))
+            if not data:
+                break
+            fh.write(data)
+            remaining = remaining - len(data)
+    finally:
+        if (secure):
+            ftp.closeData(conn)
+        else:
+            conn.close()
+        fh.close()
+
+    if (last) and (remaining == 0):
+        rc = ftp.voidresp()
+        FTPteardown(ftp)
+    else:
+        try:
+            ftp.abort()
+            rc = "aborted"
+        except all_errors, e:
+            rc = str(e)
+        ftp.close()
+    if (remaining > 0):
+        raise EOFError("data connection closed " + str(remaining) + " bytes short of the range")
+
+    workerStats.record(monotonicNs() - starttime, length)
+    if (fileLog):
+        print " < Completed range", offset, "-", offset + length - 1, " [Return Code:", rc, "]"
+
+# ------------------------------------------------------------------------------------------
+# startMonitor(counters, total)
+#
+# Starts the ProgressMonitor of a run of 'total' transfers counted in 'counters': progress
+# lines (or fast mode markers), or the -L status line, and the -T time series. None during
+# the trials of a saturation search (unless -L).
+# ------------------------------------------------------------------------------------------
+
+def startMonitor(counters, total):
+
+    if (search) and (not liveStatus):
+        return None                 # saturation search: a line per trial is enough
+    return ProgressMonitor(counters, total, fast, sampleInterval, liveStatus, seriesFile)
+
+# ------------------------------------------------------------------------------------------
+# fileSizes()
+#
+# The sizes makeArrivals needs for a bytes/s rate: a list of the size of each file (-m, -G)
+# or the size of every one.
+# ------------------------------------------------------------------------------------------
+
+def fileSizes():
+
+    if (sourcedir):
+        return [size for name, size in sourceFiles]
+    if (lorem):
+        return [lorem.size(fileOffset + loop) for loop in xrange(filecnt)] if arrivalBytes else 0
+    return payload.size if payload else os.stat(testfile).st_size
+
+# ------------------------------------------------------------------------------------------
+# makeArrivals(count, sizes)
+#
+# Open-loop mode: returns the (started) ArrivalSchedule of 'count' transfers at arrivalRate,
+# or at the rates of the load profile (then fewer, if the profile ends before). 'sizes' (one
+# size for every file or a list of them) is only used for a bytes/s rate.
+# ------------------------------------------------------------------------------------------
+
+def makeArrivals(count, sizes):
+
+    schedule = ArrivalSchedule(arrivalRate, count, arrivalPoisson, sizes if arrivalBytes else None,
+                               profile=loadProfile)
+    if (not search):
+        print "Open-loop arrivals:", schedule.describe()
+    schedule.start()
+    return schedule
+
+# ------------------------------------------------------------------------------------------
+# reportStats(runStats, starttime, unit)
+#
+# Prints the latency percentiles and throughput of the run (and writes them to statsFile as
+# JSON if -o was given). starttime is the monotonicNs() at which the run began; unit names
+# what was transferred (files, or the ranges of a segmented download).
+# ------------------------------------------------------------------------------------------
+
+def reportStats(runStats, starttime, unit='files'):
+
+    elapsed = monotonicNs() - starttime
+    print
+    for line in runStats.report(elapsed, phaseOrder, unit):
+        print line
+    if (workerCounters):
+        for line in workerCounters.report(runStats, unit):
+            print line
+    if (coordinator):
+        print "Agents:                    first      files   errors       MB/s   p50(ms)   p99(ms)"
+        for agent in coordinator.agents:
+            print "  %-22s %8d %10d %8d %10.3f %9.3f %9.3f" % agentLine(agent)
+
+    # agent mode: the coordinator gets the statistics too
+    if (agentLink):
+        agentLink.finish(runStats, elapsed)
+
+    if (statsFile):
+        if (coordinator):
+            engine = 'distributed'
+        elif (segments):
+            engine = 'segmented'
+        elif (asyncEngine):
+            engine = 'async'
+        elif (not multiprocess):
+            engine = 'serial'
+        elif (threadsPerProc > 1):
+            engine = 'hybrid'
+        else:
+            engine = 'pool'
+        summary = runStats.summary(elapsed)
+        summary.update({ 'tool'        : os.path.basename(__file__),
+                         'version'     : ver,
+                         'target'      : targethost + ":" + str(targetport),
+                         'engine'      : engine,
+                         'processes'   : maxConcurrent,
+                         'threads'     : threadsPerProc,
+                         'unique'      : unique,
+                         'ftps'        : secure,
+                         'hash'        : hashAlgorithm or 'none',
+                         'profile'     : loadProfile.describe() if loadProfile else 'none',
+                         'payload'     : payloadMode or ('generated' if lorem else 'file'),
+                         'arrivals'    : arrivals.describe() if arrivals else 'closed-loop',
+                         'workload'    : workload.describe() if workload else 'stor' })
+        if (workerCounters):
+            summary['workers'] = workerCounters.rows()
+        if (coordinator):
+            summary['agents'] = [dict(zip(('host', 'first', 'files', 'errors', 'mb_per_sec', 'p50_ms', 'p99_ms'),
+                                          agentLine(agent))) for agent in coordinator.agents]
+        writeJSON(statsFile, summary)
+        print "Summary written to", statsFile
+
+# ------------------------------------------------------------------------------------------
+# agentLine(agent)
+#
+# Coordinator mode: (host, first file, files, errors, MB/s, p50, p99) of one agent's part of
+# the run, from its final statistics (all zero if it never sent them).
+# ------------------------------------------------------------------------------------------
+
+def agentLine(agent):
+
+    stats = agent['stats']
+    if stats is None:
+        return (agent['host'], agent['first'] + 1, 0, 0, 0.0, 0.0, 0.0)
+    summ = stats.summary(agent['elapsed_ns'])
+    return (agent['host'], agent['first'] + 1, summ['files'], summ['errors'], summ['mb_per_sec'],
+            summ['latency_ms']['p50'], summ['latency_ms']['p99'])
+
+# ------------------------------------------------------------------------------------------
+# coordinatorMain()
+#
+# Coordinator mode (-C): waits for coordAgents agents, gives each its slice of the filecnt
+# files (and of the arrival rate), shows the progress of the whole cluster while they run
+# and reports their merged statistics. Sends nothing itself.
+# ------------------------------------------------------------------------------------------
+
+def coordinatorMain():
+
+    global coordinator, workerCounters
+
+    print "Coordinator waiting for", coordAgents, "agents on port", coordPort
+    sys.stdout.flush()
+    try:
+        coordinator = Coordinator('', coordPort, coordAgents, agentJoined, coordJoin)
+    except socket.timeout, e:
+        print "Coordinator giving up:", e
+        exit(1)
+    start = coordinator.dispatch(filecnt, arrivalRate, arrivalBytes, arrivalPoisson)
+    for agent in coordinator.agents:
+        print "Agent", agent['host'], "(" + agent['addr'] + "): files", agent['first'] + 1, "to", \
+              agent['first'] + agent['count']
+    if (arrivalRate):
+        print "Open-loop arrivals:", arrivalRate, "files/s" if not arrivalBytes else "bytes/s", \
+              "(poisson)" if arrivalPoisson else "(fixed)", "shared by the agents"
+
+    time.sleep(max(start - time.time(), 0))
+    starttime = monotonicNs()
+    workerCounters = coordinator.counters
+    monitor = startMonitor(workerCounters, filecnt)
+    runStats = coordinator.collect()
+    monitor.finish()
+    reportStats(runStats, starttime)
+
+def agentJoined(agent):
+
+    print "Agent joined:", agent['host'], "(" + agent['addr'] + ")"
+    sys.stdout.flush()
+
+# ------------------------------------------------------------------------------------------
+# joinCoordinator()
+#
+# Agent mode (-A): connects to the coordinator and takes on the slice it hands out: the
+# number of files to send and the number of the first one, and the share of the arrival rate
+# (which replaces -n and -r). The run itself is started by main, at the coordinator's time.
+# ------------------------------------------------------------------------------------------
+
+def joinCoordinator():
+
+    global agentLink, filecnt, fileOffset, frontPadLen, arrivalRate, arrivalBytes, arrivalPoisson
+
+    host, port = splitHostPort(agentOf, coordPort)
+    print "Joining coordinator", host + ":" + str(port)
+    sys.stdout.flush()
+    agentLink = AgentLink(host, port, os.path.basename(__file__), ver)
+    slice = agentLink.slice
+    filecnt     = slice['count']
+    fileOffset  = slice['first']
+    frontPadLen = int(math.log(slice['total']+1,10))+3     # same names as a run of all the files
+    if (lorem):
+        lorem.setCount(slice['total'])
+    arrivalRate, arrivalBytes, arrivalPoisson = slice['rate'], slice['bytes'], slice['poisson']
+    print "Agent slice: files", fileOffset + 1, "to", fileOffset + filecnt, "of", slice['total']
+
 # ------------------------------------------------------------------------------------------
 # main
 # ------------------------------------------------------------------------------------------
 
 def main():
     
+    global payload, arrivals, sourceFiles, filecnt, workerCounters, fileLog, payloadDigest
+
+    # worker processes keep quiet (unless -v): the parent prints their progress instead
+    fileLog = (not fast) and (verbose or asyncEngine or not (multiprocess or segments))
+
+    if (coordAgents):
+        coordinatorMain()
+        print "All done!"
+        return
+    if (agentOf):
+        joinCoordinator()
+
     vprint("Targest host:" + targethost + "  User:" + ftpuser + "  Password:" + ftpuserpw )
+
+    # load the payload once, before any worker is forked, so that they all share it
+    if (payloadMode):
+        payload = PayloadBuffer(testfile, payloadMode, payloadSize)
+        print "Payload:", payload.size, "bytes held in memory (" + payloadMode + ")"
+    if (lorem):
+        print "Generated files:", lorem.describe()
+
+    # hashed names: the payload is the same for every file, so its digest is worked out once
+    if (hashAlgorithm):
+        if (payload):
+            payloadDigest = digestOf(payload.reader(), hashAlgorithm)
+            print "Payload " + hashAlgorithm + ":", payloadDigest + ", files stored as", hashedName("<name>", payloadDigest)
+        else:
+            print "Uploads are hashed (" + hashAlgorithm + ") as they are sent and renamed to <digest>-<name>"
+
+    # source directory: scanned once, up front, so the workers forked below inherit the list
+    if (sourcedir):
+        vprint("Acquiring files from directory "+sourcedir) 
+        sourceFiles, sourceDirs = scanTree(sourcedir, recursive)
+        if not sourceFiles:
+            print "Abort: No files found in source directory: " + sourcedir
+            sys.exit(2)
+        filecnt = len(sourceFiles)
+        print "Source directory:", filecnt, "files,", sum([size for name, size in sourceFiles]), "bytes"
+        if (sourceDirs):
+            FTPmakeDirs(sourceDirs)
+
+    # mixed workload: plan every task's operation and target before any worker is forked. A
+    # file is only picked as a target once twice as many tasks as can run at once have been
+    # started since it was uploaded.
+    if (workload):
+        if (multiprocess):
+            window = 2 * maxConcurrent * threadsPerProc
+        else:
+            window = 1
+        workload.plan(filecnt, window)
+        print "Workload mix:", workload.describe()
+
+    # saturation search: a run of its own, trial after trial
+    if (search):
+        searchMain()
+        print "All done!"
+        return
+
+    # open-loop mode: fix the arrival times before any worker is forked
+    if (arrivalRate) or (loadProfile and loadProfile.isRate):
+        arrivals = makeArrivals(filecnt, fileSizes())
+        filecnt = arrivals.count
+
+    # load profile: its clock starts with the arrivals (or now) and the workers forked below
+    # account their transfers per step
+    if (loadProfile):
+        loadProfile.start(arrivals.startNs if arrivals else None)
+        TransferStats.profile = loadProfile
+        print "Load profile:", loadProfile.describe()
+
+    # agent mode: every agent starts at the time set by the coordinator, then streams its
+    # counters back to it
+    if (agentLink):
+        agentLink.waitStart()
+        if (arrivals):
+            arrivals.start()
+        agentLink.startSnapshots(lambda: workerCounters or workerStats.counters)
+
+    starttime = monotonicNs()
+    runStats = workerStats          # serial and asynchronous modes account in this process
+
+    # serial and asynchronous modes: the dashboard (and coordinator) read this process's own counters
+    monitor = None
+    if (liveStatus or seriesFile or agentLink) and (asyncEngine or not (multiprocess or segments)):
+        workerStats.share(WorkerCounters(1))
+        if (liveStatus or seriesFile):
+            monitor = startMonitor(workerStats.counters, filecnt)
+
+    if (segments):
+
+        #----------------------#
+        #  Segmented download  #
+        #----------------------#
+
+        runStats, size = segmentedMain()
+        elapsed = monotonicNs() - starttime
+        print
+        print "Segmented download: %d bytes in %d streams, %.3f MB/s" % \
+              (size, min(segments, size), size / (max(elapsed, 1) / 1e9) / (1024 * 1024))
+        reportStats(runStats, starttime, 'ranges')
+        print "All done!"
+        return
+
+    if (asyncEngine):
+
+        #----------------------#
+        #  Asynchronous engine #
+        #----------------------#
+
+        print "Asynchronous engine is ON"
+        asyncMain()
+        if (monitor):
+            monitor.finish()
+        reportStats(runStats, starttime)
+        print "All done!"
+        return
+
     print "Current process spawn limit: ", resource.getrlimit(resource.RLIMIT_NPROC)
 
     print "Multi processing is ",
@@ -239,21 +1989,13 @@ def main():
 
         print "ON"
 
-        pool = Pool(processes=maxConcurrent)
-        if (not fast):
-            print "FTP sessions throttled to ", maxConcurrent, " concurrent connections"
-   
-        for loop in range (0, filecnt):
-            destfile = testfile + "." + makePadExt(loop+1)
-
-            vprint("Starting process for ", destfile)
-            if ( fast ): # THIS IS THE MINIMAL PRINT IN FAST MODE SO THAT USER KNOWS AT LEAST SOMETHING IS GOING ON!
-                print str(loop)+"m" ,
-                sys.stdout.flush()
-            res = pool.apply_async(sendFileProc, (testfile, destfile))
-        
-        pool.close()
-        pool.join()
+        if (threadsPerProc > 1):
+            runStats = hybridMain()
+            reportStats(runStats, starttime)
+            print "All done!"
+            return
+
+        runStats = poolMain()
        
     else:
 
@@ -271,26 +2013,22 @@ def main():
         # ----------------------
 
         if (sourcedir):
-            vprint("Acquiring files from directory "+sourcedir) 
-            filelist=os.listdir(sourcedir)
-            filecount = len(filelist)
-            if filecount == 0:
-                print "Abort: No files found in source directory: " + sourcedir
-                sys.exit(2)
-            for file in filelist:
+            for loop, (file, size) in enumerate(sourceFiles):
                  print " FILE:", file
+                 dueNs = arrivals.wait(loop) if arrivals else None
+                 dispatchLag(dueNs)
                  try:
                      if ( unique ):
                          ftp = FTPsetup()
-                         rc = sendFile(ftp, sourcedir+"/"+file, file)
-                         if ( fast ): # THIS IS THE MINIMAL PRINT IN FAST MODE SO THAT USER KNOWS AT LEAST SOMETHING IS GOING ON!
+                         rc = sendFile(ftp, os.path.join(sourcedir, file), file, dueNs)
+                         if ( fast ) and ( not monitor ): # THIS IS THE MINIMAL PRINT IN FAST MODE SO THAT USER KNOWS AT LEAST SOMETHING IS GOING ON!
                              print str(loop)+"s" ,
                              sys.stdout.flush()
                          FTPteardown(ftp)
 
                      if ( not unique ):
-                         rc = sendFile(ftp, sourcedir+"/"+file, file)
-                         if ( fast ): # THIS IS THE MINIMAL PRINT IN FAST MODE SO THAT USER KNOWS AT LEAST SOMETHING IS GOING ON!
+                         rc = sendFile(ftp, os.path.join(sourcedir, file), file, dueNs)
+                         if ( fast ) and ( not monitor ): # THIS IS THE MINIMAL PRINT IN FAST MODE SO THAT USER KNOWS AT LEAST SOMETHING IS GOING ON!
                              print str(loop)+"s" ,
                              sys.stdout.flush()
 
@@ -302,14 +2040,19 @@ def main():
            
         else: # not using source dir
             try:
-                for loop in range (0, filecnt):
-                    destfile = testfile + "." + makePadExt(loop)
+                for loop in xrange(filecnt):
+                    if (workload) or (lorem):
+                        srcfile, destfile, op = taskFor(loop)
+                    else:
+                        srcfile, destfile, op = testfile, testfile + "." + makePadExt(loop), None
+                    dueNs = arrivals.wait(loop) if arrivals else None
+                    dispatchLag(dueNs)
 
                     if ( unique ):
                         ftp = FTPsetup()
 
-                    rc = sendFile(ftp, testfile, destfile)
-                    if ( fast ): # THIS IS THE MINIMAL PRINT IN FAST MODE SO THAT USER KNOWS AT LEAST SOMETHING IS GOING ON!
+                    rc = transfer(ftp, srcfile, destfile, dueNs, op)
+                    if ( fast ) and ( not monitor ): # THIS IS THE MINIMAL PRINT IN FAST MODE SO THAT USER KNOWS AT LEAST SOMETHING IS GOING ON!
                         print str(loop)+"s" ,
                         sys.stdout.flush()
                     if ( unique ):
@@ -322,6 +2065,10 @@ def main():
                 print "Exception encountered while processing file:", destfile, " Exception=", str(e)
                 exit(2)
 
+        if (monitor):
+            monitor.finish()
+
+    reportStats(runStats, starttime)
     print "All done!"
 
 # ------------------------------------------------------------------------------------------
@@ -347,19 +2094,41 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(epilog=longdescription)
 #    Note that '-h'is automatically applied by argparse
     parser.add_argument('-v', help='verbose mode [Default: False]', action="store_true") # make it a True/False flag
-    parser.add_argument('-t', help='target ftp server: IP or hostname. [Default: ' + targethost + "]")
+    parser.add_argument('-t', help='target ftp server: IP or hostname, optionally :port. [Default: ' + targethost + "]")
     parser.add_argument('-u', help='remote ftp username. [Default: ' + ftpuser + "]")
     parser.add_argument('-p', help='remote ftp password. [Default: ' + ftpuserpw + "]")
     parser.add_argument('-f', help='Source file to be sent (with numerical incrementing extension). [Default:  ' + testfile + "]")
     parser.add_argument('-m', help='Directory from which to send all files. ')
+    parser.add_argument('-w', '--recursive', help='With -m, also send the files in all subdirectories (recreated remotely) (-D in sftp-gen.py) [Default: False]', action="store_true")
     parser.add_argument('-n', help='Number of files to send [Default: ' + str(filecnt) + "]")
     parser.add_argument('-d', help='Remote directory [Default: none ]')
     parser.add_argument('-s', help='Serial-processing mode [Default: Multiprocessing]', action="store_true")
     parser.add_argument('-l', help='Maximum concurrent process limit [Default: ' + str(maxConcurrent) + ']')
+    parser.add_argument('-c', help='Threads (connections) per process in multi-processing mode [Default: ' + str(threadsPerProc) + ']')
     parser.add_argument('-a', help='Active mode [Default=Passive mode]', action="store_true")
     parser.add_argument('-q', help='Quick (fast) mode. Less info than non-verbose mode. No timestamping calculations. [Default: False]', action="store_true") # make it a True/False flag 
-    parser.add_argument('-k', help='Use unique (new) connection for every transfer [Default: False]', action="store_true")
+    parser.add_argument('-k', help='Use unique (new) connection for every transfer. Without it, each multi-processing worker reuses one session [Default: False]', action="store_true")
     parser.add_argument('-x', help='Delay (seconds) between each file [Default: ' + str(delay) + "]")
+    parser.add_argument('-i', help='In-memory payload: read the source file once (load) or map it (mmap) [Default: read per transfer]', choices=['load', 'mmap'])
+    parser.add_argument('-z', help='Send Z bytes of generated data per file instead of a source file [Default: none]')
+    parser.add_argument('-H', help='Hash every upload while it is sent and name it <digest>-<name> (RNFR/RNTO, or directly for -i/-z), as MD5checker.py expects: md5, sha1, sha256, ... [Default: off, md5 if no algorithm given]', nargs='?', const='md5')
+    parser.add_argument('-G', help='Send unique Lorem Ipsum files generated on the fly, as RandomFileMaker.py makes them: size, or size,step for random multiples of step below size; -f is the name prefix [Default: none]')
+    parser.add_argument('-o', help='Write the run summary (throughput, latency percentiles, histogram) to this JSON file [Default: none]')
+    parser.add_argument('-r', help='Open-loop arrival rate: files/s (eg 2.5) or bytes/s with a B/KB/MB/GB suffix (eg 40MB) [Default: none, send as fast as possible]')
+    parser.add_argument('-y', help='Poisson arrivals (exponentially distributed gaps) at the -r rate [Default: evenly spaced]', action="store_true")
+    parser.add_argument('-g', help='Mixed workload: weights of stor, retr, list, dele and size, eg. stor=60,retr=25,list=10,dele=3,size=2, or a file of "op = weight" lines [Default: uploads only]')
+    parser.add_argument('-j', help='Segmented download: fetch remote file -f in J byte ranges over J parallel sessions (REST+RETR) [Default: upload mode]')
+    parser.add_argument('-b', help='Time each protocol phase (connect, login, PASV/PORT, STOR, data, 226) separately and report the breakdown [Default: False]', action="store_true")
+    parser.add_argument('-e', help='Asynchronous engine: all -l sessions in one process/event loop [Default: Multiprocessing]', action="store_true")
+    parser.add_argument('-R', help='Load profile: stages of concurrent sessions or of rates (/s), eg. warmup=30s:2,ramp=2m:2-10,steady=10m:10, or a file of them, one per line; the run ends with it [Default: none]')
+    parser.add_argument('-K', help='Saturation search: trials at more and more sessions (or a higher rate) until an SLO breaks, eg. p99=250ms,errors=1,sessions=1-64 (or rate=10-500/s), trial=10s, warmup=2s, method=binary|golden; reports the knee and the curve [Default: none]')
+    parser.add_argument('-S', help='FTPS: explicit TLS (AUTH TLS) control channel and TLS (PROT P) data channels, resuming the TLS session where the server allows [Default: plain ftp]', action="store_true")
+    parser.add_argument('-L', help='Live status line: files/s, MB/s, in flight, error rate and ETA, every second [Default: progress lines]', action="store_true")
+    parser.add_argument('-T', help='Write the progress samples (every second) to this CSV file [Default: none]')
+    parser.add_argument('-C', '--coordinator', help='Coordinate a distributed run: wait for C agents, split the -n files (and -r rate) between them and merge their statistics [Default: off]')
+    parser.add_argument('-A', '--agent', help='Run as an agent of the coordinator at this host[:port]: it sets -n, -r and the start time [Default: off]')
+    parser.add_argument('-P', help='Coordinator port (-C listens on it, -A connects to it) [Default: ' + str(coordPort) + ']')
+    parser.add_argument('-J', help='Coordinator: seconds to wait for all the -C agents to join before giving up [Default: ' + str(coordJoin) + ']')
 
     args = parser.parse_args()
 
@@ -370,8 +2139,8 @@ if __name__ == "__main__":
 
     # target Host/IP?
     if args.t:
-        targethost = args.t
-        vprint("Target host: ", targethost)
+        targethost, targetport = splitHostPort(args.t, targetport)
+        vprint("Target host: ", targethost, " port: ", targetport)
 
     # destination userid?
     if args.u:
@@ -399,6 +2168,14 @@ if __name__ == "__main__":
         if not filesinsrc:
            print "Source directory " + sourcedir +" (-m) is empty"
            exit(1)
+
+        if args.recursive:
+           recursive = True
+           vprint("Recursive: ON")
+
+    elif args.recursive:
+        print "-w (recursive) requires a source directory (-m)"
+        exit(1)
    
     # source file?
     if args.f:
@@ -422,16 +2199,17 @@ if __name__ == "__main__":
     if args.s:
         multiprocess = False
         vprint("Serial-processing mode: ON")
-    else: # intended to use default multi-process mode
-        if args.m:     # source directory provided?
-            print"Defaulting to serial mode due to use of -m (Source directory)"
-            multiprocess = False
 
     # Maximum concurrent processes
     if args.l:
         maxConcurrent = int(args.l)
         vprint("Maximum concurrent process: " + args.l)
 
+    # Threads per process (hybrid mode)
+    if args.c:
+        threadsPerProc = int(args.c)
+        vprint("Threads per process: " + args.c)
+
     # active or passive mode?
     if args.a:
         passive = False
@@ -452,12 +2230,205 @@ if __name__ == "__main__":
         delay = int(args.x)
         vprint("Delay (sec) between files: " + args.x)
  
+    # in-memory payload?
+    if args.i or args.z:
+        if args.m:
+           print "Cannot use -i or -z (in-memory payload) with -m (source directory)"
+           exit(1)
+        if args.z:
+            payloadMode = 'synthetic'
+            payloadSize = int(args.z)
+            vprint("Synthetic payload (bytes): " + args.z)
+        else:
+            payloadMode = args.i
+            vprint("In-memory payload: " + payloadMode)
+
+    # generated (Lorem Ipsum) files?
+    if args.G:
+        if args.m or args.i or args.z or args.j or args.e:
+           print "Cannot use -G (generated files) with -m, -i, -z, -j or -e"
+           exit(1)
+        try:
+            sizes = [int(part) for part in args.G.split(',')]
+            if (min(sizes) < 1):
+                raise ValueError(args.G)
+            lorem = LoremFiles(filecnt, sizes[0], sizes[1] if len(sizes) > 1 else None, args.f or 'LoremFile')
+        except (ValueError, IndexError), e:
+            print "Invalid generated file size (-G), expected size or size,step:", args.G
+            exit(1)
+        vprint("Generated files: " + lorem.describe())
+
+    # hashed (integrity-tagged) names?
+    if args.H:
+        if args.g or args.j or args.e:
+           print "Cannot use -H (hashed names) with -g (the workload acts on the plain names), -j or -e"
+           exit(1)
+        if args.H not in hashlib.algorithms:
+           print "Unknown digest (-H):", args.H, " Choose from:", ", ".join(hashlib.algorithms)
+           exit(1)
+        hashAlgorithm = args.H
+        if (lorem):
+            lorem.marked = True         # as RandomFileMaker.py -j: the pad first, for distinct digests
+        vprint("Hashed names: " + hashAlgorithm)
+
+    # JSON summary?
+    if args.o:
+        statsFile = args.o
+        vprint("JSON summary file: " + statsFile)
+
+    # open-loop arrival rate?
+    if args.r:
+        try:
+            arrivalRate, arrivalBytes = parseRate(args.r)
+        except ValueError, e:
+            print "Invalid arrival rate (-r):", args.r
+            exit(1)
+        vprint("Arrival rate: " + args.r)
+    if args.y:
+        if not (args.r or args.R or args.K):
+            print "-y (Poisson arrivals) requires an arrival rate (-r, or -R or -K with rates)"
+            exit(1)
+        arrivalPoisson = True
+        vprint("Poisson arrivals: ON")
+
+    # mixed workload?
+    if args.g:
+        if args.m or args.e:
+            print "Cannot use -g (mixed workload) with -m (source directory) or -e (asynchronous engine)"
+            exit(1)
+        try:
+            workload = WorkloadMix(args.g, workloadOps, 'stor', ('list',))
+        except ValueError, e:
+            print "Invalid workload (-g):", str(e)
+            exit(1)
+        vprint("Workload mix: " + workload.describe())
+
+    # segmented download?
+    if args.j:
+        if args.m or args.e or args.g or args.i or args.z or args.r:
+            print "Cannot use -m, -e, -g, -i, -z or -r with -j (segmented download)"
+            exit(1)
+        segments = int(args.j)
+        if (segments < 1):
+            print "Number of segments (-j) must be at least 1"
+            exit(1)
+        vprint("Segmented download, segments: " + args.j)
+
+    # per-phase timing?
+    if args.b:
+        phaseTiming = True
+        vprint("Per-phase timing: ON")
+
+    # asynchronous engine?
+    if args.e:
+        if args.s or args.m:
+           print "Cannot use -s (serial) or -m (source directory) with -e (asynchronous engine)"
+           exit(1)
+        asyncEngine = True
+        vprint("Asynchronous engine: ON")
+
+    # load profile?
+    if args.R:
+        if args.r or args.j or args.coordinator or args.agent:
+            print "Cannot use -R (load profile) with -r (its rates are in the profile), -j, -C or -A"
+            exit(1)
+        try:
+            loadProfile = LoadProfile(args.R)
+        except ValueError, e:
+            print "Invalid load profile (-R):", str(e)
+            exit(1)
+        if (loadProfile.isRate):
+            arrivalBytes = loadProfile.isBytes
+        else:
+            if args.s or args.e or args.y:
+                print "A load profile of sessions cannot be used with -s (serial), -e (asynchronous engine) or -y"
+                exit(1)
+            if args.l:
+                print "Cannot use -l with a load profile of sessions (-R): its highest level sets the number of workers"
+                exit(1)
+            # enough sessions for the highest level
+            maxConcurrent = (loadProfile.maxLevel() + threadsPerProc - 1) // threadsPerProc
+        vprint("Load profile: " + loadProfile.describe())
+
+    # saturation search?
+    if args.K:
+        if args.s or args.e or args.j or args.m or args.R or args.r or args.T or args.coordinator or args.agent:
+            print "Cannot use -K (saturation search) with -s, -e, -j, -m, -R, -r (the trials set the load), -T, -C or -A"
+            exit(1)
+        try:
+            search = SaturationSearch(args.K, maxConcurrent * threadsPerProc)
+        except ValueError, e:
+            print "Invalid saturation search (-K):", str(e)
+            exit(1)
+        if (search.isRate):
+            arrivalBytes = search.isBytes
+        elif args.y:
+            print "-y (Poisson arrivals) needs a search of rates (-K rate=...)"
+            exit(1)
+        # each trial ends with its time, unless it runs out of files first
+        if not args.n:
+            filecnt = 100000
+            frontPadLen = int(math.log(filecnt+1,10))+3
+            if (lorem):
+                lorem.setCount(filecnt)
+        vprint("Saturation search: " + search.describe())
+
+    # FTPS?
+    if args.S:
+        if args.e:
+           print "Cannot use -S (FTPS) with -e (asynchronous engine)"
+           exit(1)
+        secure = True
+        vprint("FTPS (explicit TLS): ON, TLS session resumption " + ("available" if TLSSessions.resumable() else "not available"))
+
+    # live status line?
+    if args.L:
+        liveStatus = True
+        vprint("Live status line: ON")
+
+    # progress time series?
+    if args.T:
+        seriesFile = args.T
+        vprint("Progress CSV file: " + seriesFile)
+
+    # coordinator port?
+    if args.P:
+        coordPort = int(args.P)
+        vprint("Coordinator port: " + args.P)
+    if args.J:
+        if not args.coordinator:
+            print "-J (agent join timeout) only applies to a coordinator (-C)"
+            exit(1)
+        coordJoin = float(args.J)
+        if (coordJoin <= 0):
+            print "Agent join timeout (-J) must be greater than zero"
+            exit(1)
+        vprint("Agent join timeout: " + args.J + " s")
+
+    # distributed run: coordinator or agent?
+    if args.coordinator or args.agent:
+        if args.coordinator and args.agent:
+            print "Cannot use -C (coordinator) with -A (agent)"
+            exit(1)
+        if args.m or args.j:
+            print "Cannot use -m (source directory) or -j (segmented download) in a distributed run (-C, -A)"
+            exit(1)
+    if args.coordinator:
+        coordAgents = int(args.coordinator)
+        if (coordAgents < 1) or (coordAgents > filecnt):
+            print "Number of agents (-C) must be between 1 and the number of files (-n)"
+            exit(1)
+        vprint("Coordinator for agents: " + args.coordinator)
+    if args.agent:
+        agentOf = args.agent
+        vprint("Agent of coordinator: " + agentOf)
+
     #
     #  Some quick sanity checks.
     #
 
     # make sure source file exists and is readable
-    if (not args.m):  # don't care if we're using a source directory
+    if (not args.m) and (not args.z) and (not args.G) and (not args.j) and (not args.coordinator):  # don't care if we're using a source directory, generated data, downloading or only coordinating
        if ( not os.access(testfile, os.R_OK)) or (os.stat(testfile).st_size == 0):
           print "Source file not valid, unreadable, or empty:" + testfile
           sys.exit(2)  
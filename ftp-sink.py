@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+
+# ftp-sink.py
+#
+#  see 'longdescription' string which appears with help (-h)
+#
+# Notes:
+#  - python 2.x compatible (not 3.x)
+#  - requires pyftpdlib (pip install pyftpdlib), and pyOpenSSL for FTPS (-S)
+#  - a stand-in for the real ftp server (192.168.60.44) so that ftp-gen.py can be run, and its
+#    engines compared, on a single box:   ftp-sink.py -x &   ftp-gen.py -t 127.0.0.1:2121 ...
+#
+# History
+#
+# V1.00 : Loopback ftp sink: disk or discard mode, transfer counters.
+# V1.01 : FTPS (-S): explicit TLS required on control and data channels, self-signed
+#         certificate generated on first use.
+#
+# ---------------------------------------------------------------------------------------------------
+
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import FTPServer
+from pyftpdlib.filesystems import AbstractedFS
+from pyftpdlib.log import config_logging
+try:
+    from pyftpdlib.handlers import TLS_FTPHandler     # only there if pyOpenSSL is installed
+    from OpenSSL import crypto
+except ImportError:
+    TLS_FTPHandler = None
+import logging
+import os, sys
+import errno
+import stat
+import time
+import signal
+import resource
+import threading
+import argparse
+from genlib import SinkStore
+
+ver = "V1.01"
+
+# defaults/controls  (Most/all of these can be changed via command line arguments to the program)
+# ---------------------------------------------------------------------------------------------------
+
+bindaddr      = '127.0.0.1'     # address to listen on (loopback only by default)
+port          = 2121            # ftp control port
+ftpuser       = 'ftpuser'       # the login accepted (same default as ftp-gen.py)
+ftpuserpw     = 'fractal'       # its password (same default as ftp-gen.py)
+rootdir       = 'ftpsink'       # files (and, in discard mode, directories only) go under this directory
+discard       = False           # discard the data received instead of writing it to disk
+reportInterval = 0              # print the counters every so many seconds (0 = only on exit)
+secure        = False           # FTPS: require explicit TLS (AUTH TLS, PROT P)
+certFile      = 'ftpsink.pem'   # FTPS: certificate and key (PEM), generated on first use
+verbose       = False           # verbose mode toggle. default off
+
+fillBlock     = os.urandom(65536)  # discard mode: the data sent back for a download
+sinkStore     = None            # the SinkStore (counters, discarded files)
+
+# used as 'help' by argparse:
+longdescription = "This is a minimal local ftp server to run ftp-gen.py against, so that the client " + \
+                  "side (its engines, payload modes, ...) can be measured and regression tested without " + \
+                  "the remote test server and its disk. It listens on 127.0.0.1 and accepts the same " + \
+                  "login as ftp-gen.py's defaults. Uploads are written under the root directory (-r) " + \
+                  "unless -x (discard) is given, in which case only their names and sizes are kept " + \
+                  "(enough for SIZE, LIST, DELE and RETR, which then sends generated data) and the data " + \
+                  "itself is thrown away. Files and bytes received and sent are counted and reported on " + \
+                  "exit (Ctrl-C or SIGTERM) and, with -i, periodically. -S makes it an FTPS server " + \
+                  "(explicit TLS, required on the control and data channels) with the certificate of -c, " + \
+                  "a self-signed one being generated if that file does not exist."
+
+# ------------------------------------------------------------------------------------------
+# SinkWriter(name, mode)
+#
+# Discard mode: the file object an upload is written to. Keeps the size, drops the data.
+# ------------------------------------------------------------------------------------------
+
+class SinkWriter(object):
+
+    def __init__(self, name, mode):
+
+        self.name   = name
+        self.closed = False
+        self.pos    = 0
+        self.size   = 0
+        if ('a' in mode) or ('+' in mode):          # APPE, or STOR after REST
+            self.size = sinkStore.getSize(name) or 0
+        if ('a' in mode):
+            self.pos = self.size
+        sinkStore.setSize(name, self.size)          # visible from the start, like a file on disk
+
+    def write(self, data):
+
+        self.pos  = self.pos + len(data)
+        self.size = max(self.size, self.pos)
+
+    def seek(self, offset):
+
+        self.pos = offset
+
+    def close(self):
+
+        if not self.closed:
+            self.closed = True
+            sinkStore.setSize(self.name, self.size)
+
+# ------------------------------------------------------------------------------------------
+# SinkReader(name, size)
+#
+# Discard mode: the file object a download of a discarded file reads from. Produces 'size'
+# bytes of fillBlock.
+# ------------------------------------------------------------------------------------------
+
+class SinkReader(object):
+
+    def __init__(self, name, size):
+
+        self.name   = name
+        self.closed = False
+        self.pos    = 0
+        self.size   = size
+
+    def read(self, size=-1):
+
+        remaining = self.size - self.pos
+        if (size < 0) or (size > remaining):
+            size = remaining
+        size = min(size, len(fillBlock))
+        self.pos = self.pos + size
+        return fillBlock[:size]
+
+    def seek(self, offset):
+
+        self.pos = offset
+
+    def close(self):
+
+        self.closed = True
+
+# ------------------------------------------------------------------------------------------
+# SinkFS
+#
+# Discard mode file system: directories are real (under rootdir), files are the ones
+# remembered by sinkStore. Files that really exist under rootdir are still served as well.
+# ------------------------------------------------------------------------------------------
+
+class SinkFS(AbstractedFS):
+
+    def open(self, filename, mode):
+
+        if ('w' in mode) or ('a' in mode) or ('+' in mode):
+            if not os.path.isdir(os.path.dirname(filename)):
+                raise IOError(errno.ENOENT, os.strerror(errno.ENOENT))
+            return SinkWriter(filename, mode)
+        size = sinkStore.getSize(filename)
+        if size is None:
+            return AbstractedFS.open(self, filename, mode)
+        return SinkReader(filename, size)
+
+    def virtualStat(self, size):
+
+        now = int(time.time())
+        return os.stat_result((stat.S_IFREG | 0644, 0, 0, 1, os.getuid(), os.getgid(), size, now, now, now))
+
+    def stat(self, path):
+
+        size = sinkStore.getSize(path)
+        if size is None:
+            return AbstractedFS.stat(self, path)
+        return self.virtualStat(size)
+
+    def lstat(self, path):
+
+        size = sinkStore.getSize(path)
+        if size is None:
+            return AbstractedFS.lstat(self, path)
+        return self.virtualStat(size)
+
+    def getsize(self, path):
+
+        size = sinkStore.getSize(path)
+        if size is None:
+            return AbstractedFS.getsize(self, path)
+        return size
+
+    def getmtime(self, path):
+
+        if sinkStore.getSize(path) is None:
+            return AbstractedFS.getmtime(self, path)
+        return time.time()
+
+    def isfile(self, path):
+
+        return (sinkStore.getSize(path) is not None) or AbstractedFS.isfile(self, path)
+
+    def lexists(self, path):
+
+        return (sinkStore.getSize(path) is not None) or AbstractedFS.lexists(self, path)
+
+    def listdir(self, path):
+
+        return AbstractedFS.listdir(self, path) + sinkStore.names(path)
+
+    def remove(self, path):
+
+        if not sinkStore.remove(path):
+            AbstractedFS.remove(self, path)
+
+    def rename(self, src, dst):
+
+        if not sinkStore.rename(src, dst):
+            AbstractedFS.rename(self, src, dst)
+
+# ------------------------------------------------------------------------------------------
+# SinkHandler (SinkTLSHandler for FTPS)
+#
+# The ftp session handler: counts every data transfer of a file (complete or not) as it ends.
+# ------------------------------------------------------------------------------------------
+
+def countTransfer(receive, completed, bytes):
+
+    if (receive):
+        sinkStore.received(bytes, completed)
+    else:
+        sinkStore.sent(bytes, completed)
+
+class SinkHandler(FTPHandler):
+
+    def log_transfer(self, cmd, filename, receive, completed, elapsed, bytes):
+
+        countTransfer(receive, completed, bytes)
+        FTPHandler.log_transfer(self, cmd, filename, receive, completed, elapsed, bytes)
+
+if TLS_FTPHandler is not None:
+
+    class SinkTLSHandler(TLS_FTPHandler):
+
+        tls_control_required = True
+        tls_data_required    = True
+
+        def log_transfer(self, cmd, filename, receive, completed, elapsed, bytes):
+
+            countTransfer(receive, completed, bytes)
+            TLS_FTPHandler.log_transfer(self, cmd, filename, receive, completed, elapsed, bytes)
+
+# ------------------------------------------------------------------------------------------
+# makeCertificate()
+#
+# FTPS: writes a self-signed certificate (and its key) for bindaddr to certFile, the first
+# time, so that the sink can be started without any setup. Clients cannot verify it, which
+# ftp-gen.py does not try to.
+# ------------------------------------------------------------------------------------------
+
+def makeCertificate():
+
+    if os.path.exists(certFile):
+        return
+    print "Generating certificate:", certFile
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+    cert = crypto.X509()
+    cert.get_subject().CN = bindaddr
+    cert.set_serial_number(int(time.time()))
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(10 * 365 * 24 * 3600)
+    cert.set_issuer(cert.get_subject())
+    cert.set_pubkey(key)
+    cert.sign(key, 'sha256')
+    fh = open(certFile, 'wb')
+    fh.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+    fh.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
+    fh.close()
+
+# ------------------------------------------------------------------------------------------
+# reporter()
+#
+# Prints the counters every reportInterval seconds (runs as a daemon thread).
+# ------------------------------------------------------------------------------------------
+
+def reporter():
+
+    while True:
+        time.sleep(reportInterval)
+        print sinkStore.report()
+        sys.stdout.flush()
+
+# ------------------------------------------------------------------------------------------
+# sigterm(signum, frame)
+#
+# Treats SIGTERM like Ctrl-C, so that the counters still get printed.
+# ------------------------------------------------------------------------------------------
+
+def sigterm(signum, frame):
+
+    raise KeyboardInterrupt
+
+# ------------------------------------------------------------------------------------------
+# main
+# ------------------------------------------------------------------------------------------
+
+def main():
+
+    global sinkStore
+
+    sinkStore = SinkStore(discard)
+    if not os.path.isdir(rootdir):
+        os.makedirs(rootdir)
+
+    if (secure):
+        makeCertificate()
+        handler = SinkTLSHandler
+        handler.certfile = certFile
+    else:
+        handler = SinkHandler
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_user(ftpuser, ftpuserpw, rootdir, perm='elradfmwMT')
+    handler.authorizer = authorizer
+    if (discard):
+        handler.abstracted_fs = SinkFS
+
+    # every session needs a control socket and, while transferring, a data socket
+    softlimit, hardlimit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if (softlimit < hardlimit):
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hardlimit, hardlimit))
+
+    if (verbose):
+        config_logging(level=logging.INFO)
+    else:
+        config_logging(level=logging.WARNING)
+
+    server = FTPServer((bindaddr, port), handler)
+    server.max_cons = 0             # no limits: the load generator decides
+    server.max_cons_per_ip = 0
+    print "FTP sink listening on", bindaddr + ":" + str(port), " User:", ftpuser, " Root:", rootdir, \
+          " Mode:", "discard" if discard else "disk", " FTPS" if secure else ""
+    sys.stdout.flush()
+
+    if (reportInterval > 0):
+        thread = threading.Thread(target=reporter)
+        thread.daemon = True
+        thread.start()
+
+    signal.signal(signal.SIGTERM, sigterm)
+    try:
+        server.serve_forever(handle_exit=False)
+    except KeyboardInterrupt:
+        pass
+    server.close_all()
+    print
+    print sinkStore.report()
+
+# ------------------------------------------------------------------------------------------
+# vprint(args)
+#
+# prints args only if verbose mode is ON
+# ------------------------------------------------------------------------------------------
+
+def vprint(*args):
+
+    if verbose:
+       for arg in args:
+           print arg,
+       print
+
+# ------------------------------------------------------------------------------------------
+# Main
+# ------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    print "Running", os.path.basename(__file__), ver
+    parser = argparse.ArgumentParser(epilog=longdescription)
+#    Note that '-h'is automatically applied by argparse
+    parser.add_argument('-v', help='verbose mode (logs every command) [Default: False]', action="store_true")
+    parser.add_argument('-a', help='Address to listen on [Default: ' + bindaddr + ']')
+    parser.add_argument('-l', help='Port to listen on [Default: ' + str(port) + ']')
+    parser.add_argument('-u', help='ftp username accepted [Default: ' + ftpuser + ']')
+    parser.add_argument('-p', help='ftp password accepted [Default: ' + ftpuserpw + ']')
+    parser.add_argument('-r', help='Root directory [Default: ' + rootdir + ']')
+    parser.add_argument('-x', help='Discard mode: keep only the names and sizes of uploaded files, not their data [Default: False]', action="store_true")
+    parser.add_argument('-S', help='FTPS: require explicit TLS on the control and data channels [Default: plain ftp]', action="store_true")
+    parser.add_argument('-c', help='FTPS certificate and key (PEM), generated if it does not exist [Default: ' + certFile + ']')
+    parser.add_argument('-i', help='Print the transfer counters every I seconds [Default: only on exit]')
+
+    args = parser.parse_args()
+
+    # verbose?
+    if args.v:
+        verbose = True
+        vprint("Verbose mode ON")
+
+    # listen address?
+    if args.a:
+        bindaddr = args.a
+        vprint("Listen address: " + bindaddr)
+
+    # listen port?
+    if args.l:
+        port = int(args.l)
+        vprint("Listen port: " + args.l)
+
+    # userid?
+    if args.u:
+        ftpuser = args.u
+        vprint("ftp userid: " + ftpuser)
+
+    # password?
+    if args.p:
+        ftpuserpw = args.p
+        vprint("ftp password: " + ftpuserpw)
+
+    # root directory?
+    if args.r:
+        rootdir = args.r
+        vprint("Root directory: " + rootdir)
+
+    # discard mode?
+    if args.x:
+        discard = True
+        vprint("Discard mode: ON")
+
+    # FTPS?
+    if args.S:
+        if TLS_FTPHandler is None:
+            print "-S (FTPS) requires pyOpenSSL (pip install pyopenssl)"
+            exit(1)
+        secure = True
+        vprint("FTPS: ON")
+    if args.c:
+        certFile = args.c
+        vprint("Certificate file: " + certFile)
+
+    # periodic report?
+    if args.i:
+        reportInterval = int(args.i)
+        vprint("Report interval (sec): " + args.i)
+
+    main()
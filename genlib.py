@@ -0,0 +1,2464 @@
+#!/usr/bin/env python
+
+# genlib.py
+#
+#  Helpers shared by the load generators (ftp-gen.py and sftp-gen.py). Not a program in its
+#  own right: keep it in the same directory as the generators, which simply 'import genlib'.
+#
+# Notes:
+#  - python 2.x compatible (not 3.x)
+#
+# History
+#
+# V1.00 : In-memory payload source (PayloadBuffer / PayloadReader).
+# V1.01 : Latency histograms and run statistics (monotonicNs, LatencyHistogram, TransferStats).
+# V1.02 : Per protocol phase timings in TransferStats.
+# V1.03 : Open-loop arrivals (ArrivalSchedule, parseRate) and dispatch lag in TransferStats.
+# V1.04 : Source directory scan (scanTree).
+# V1.05 : Mixed operation workloads (WorkloadMix) and per operation statistics in TransferStats.
+# V1.06 : Sink server bookkeeping (SinkStore), host:port targets (splitHostPort).
+# V1.07 : Live per worker counters in shared memory (WorkerCounters, ProgressMonitor), retries
+#         and error reasons in TransferStats.
+# V1.08 : Live status line and CSV time series in ProgressMonitor, transfers in flight.
+# V1.09 : Distributed runs (Coordinator, AgentLink), TransferStats and LatencyHistogram to and
+#         from plain dictionaries (JSON).
+# V1.10 : TLS session resumption (TLSSessions) and TLS handshake times in TransferStats.
+# V1.11 : Load profiles (LoadProfile) and per step statistics in TransferStats.
+# V1.12 : Saturation search (SaturationSearch).
+# V1.13 : RandomFileMaker style files generated on the fly, no disk (LoremFiles, LoremReader).
+# V1.14 : Digests computed while uploading (HashingReader, digestOf, hashedName).
+# V1.15 : Bounded, chunked hand out of pool tasks (TaskWindow, chunked).
+# V1.16 : Byte counts with units (parseSize).
+# V1.17 : TLSSessions checks the _ssl object layout on every connection instead of probing the
+#         SSL pointer once; libssl must match the ssl module's OpenSSL version.
+#
+# ---------------------------------------------------------------------------------------------------
+
+import os, sys
+import mmap
+import socket
+import math
+import time
+import ctypes, ctypes.util
+import threading
+import json
+import random
+import hashlib
+import posixpath
+import itertools
+from array import array
+import stat
+import bisect
+from collections import deque
+from multiprocessing import Value
+from multiprocessing.sharedctypes import RawArray
+
+try:
+    from scandir import scandir     # os.scandir back-port (python 2.x), optional
+except ImportError:
+    scandir = None
+
+ver = "V1.17"
+
+# ------------------------------------------------------------------------------------------
+# PayloadBuffer(sourceFile, mode, size)
+#
+# A read-only payload that is prepared once (before the worker processes are forked, so they
+# all share the same pages) and then sent over and over without touching the disk again.
+#
+#   mode 'load'      : sourceFile is read into memory once.
+#   mode 'mmap'      : sourceFile is mapped read-only; pages come straight from the page cache.
+#   mode 'synthetic' : no file at all. 'size' bytes are produced by cycling over one 1MB block
+#                      of generated (random) data, so memory use does not grow with size.
+#
+# Every transfer gets its own PayloadReader (see reader()) which hands out slices of the
+# shared data. Slices are views, not copies: memoryview for data held in memory and buffer()
+# for an mmap (under python 2.x an mmap only offers the old buffer interface, which
+# memoryview cannot wrap).
+# ------------------------------------------------------------------------------------------
+
+class PayloadBuffer(object):
+
+    syntheticBlockSize = 1024 * 1024
+
+    def __init__(self, sourceFile=None, mode='load', size=0):
+
+        self.mode = mode
+        self.mm   = None
+
+        if (mode == 'synthetic'):
+            self.data = os.urandom(min(size, self.syntheticBlockSize))
+            self.view = memoryview(self.data)
+            self.size = size
+
+        elif (mode == 'mmap'):
+            fh = open(sourceFile, 'rb')
+            self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            fh.close()                       # the mapping stays valid once the file is closed
+            self.view = None
+            self.size = len(self.mm)
+
+        else:
+            fh = open(sourceFile, 'rb')
+            self.data = fh.read()
+            fh.close()
+            self.view = memoryview(self.data)
+            self.size = len(self.data)
+
+    # returns a view of up to 'length' bytes of the data starting at 'offset'
+    def slice(self, offset, length):
+
+        if self.mm is not None:
+            return buffer(self.mm, offset, length)
+        return self.view[offset:offset+length]
+
+    # returns a new file-like reader positioned at the start of the payload
+    def reader(self):
+
+        return PayloadReader(self)
+
+# ------------------------------------------------------------------------------------------
+# PayloadReader(payload)
+#
+# File-like object (read/close) over a PayloadBuffer, suitable for ftplib's storbinary and
+# paramiko's putfo. Each read() returns a view of the shared data rather than a copy. For a
+# synthetic payload the reader wraps around the generated block until 'size' bytes are out.
+# ------------------------------------------------------------------------------------------
+
+class PayloadReader(object):
+
+    def __init__(self, payload):
+
+        self.payload = payload
+        self.pos     = 0
+
+    def read(self, size=-1):
+
+        remaining = self.payload.size - self.pos
+        if (size < 0) or (size > remaining):
+            size = remaining
+        if (size <= 0):
+            return ''
+
+        if (self.payload.mode == 'synthetic'):
+            blocklen = len(self.payload.data)
+            offset = self.pos % blocklen
+            size = min(size, blocklen - offset)  # a read never wraps; the caller just reads again
+        else:
+            offset = self.pos
+
+        self.pos = self.pos + size
+        return self.payload.slice(offset, size)
+
+    def close(self):
+
+        self.pos = self.payload.size
+
+# ------------------------------------------------------------------------------------------
+# LoremFiles(count, maxsize, step, prefix, seed)
+#
+# The files RandomFileMaker.py would write, generated on the fly instead: nothing goes to
+# disk, every transfer reads its file straight from the generator. Same rules as
+# RandomFileMaker.main(): file 'index' (0 based) is named prefix + pad + '.txt' (the pad
+# sized for 'count' files), is 'maxsize' bytes, or a random multiple of 'step' below it when
+# a step smaller than maxsize-1 is given, and holds the Lorem Ipsum words of
+# RandomFileMaker.fdata() rotated by a random seed of its own.
+#
+# Sizes and seeds come from a random.Random of (seed, index), so every process (forked after
+# the LoremFiles is made) agrees on them and open(name) gives the same bytes every time.
+# With 'marked' set every file starts with the pad of its name, as RandomFileMaker.py -j
+# writes them, so two files of the same size and seed still have different digests.
+# ------------------------------------------------------------------------------------------
+
+class LoremFiles(object):
+
+    padChar = '_'
+
+    def __init__(self, count, maxsize, step=None, prefix='LoremFile', seed=None, marked=False):
+
+        self.maxsize = maxsize
+        self.step    = step if (step is not None) and (step < maxsize - 1) else maxsize - 1
+        self.prefix  = prefix
+        self.seed    = seed if seed is not None else random.randint(1, 2 ** 31)
+        self.marked  = marked
+        self.words   = loremWords()
+        self.setCount(count)
+
+    # the pad (and so the names) of a run of 'count' files
+    def setCount(self, count):
+
+        self.padLen = int(math.log(count + 1, 10)) + 3
+
+    def describe(self):
+
+        if (self.step >= self.maxsize - 1):
+            size = str(self.maxsize) + " bytes"
+        else:
+            size = "%d to %d bytes in steps of %d" % (self.step, self.step * ((self.maxsize - 1) // self.step), self.step)
+        return self.name(0) + " ..., " + size + " each (generated)"
+
+    def name(self, index):
+
+        number = str(index)
+        return self.prefix + self.padChar * (self.padLen - len(number) - 1) + number + self.padChar + ".txt"
+
+    # the number of the file of that name (see name)
+    def index(self, name):
+
+        return int(name[len(self.prefix):-len(".txt")].strip(self.padChar))
+
+    # (size, seed) of file 'index', drawn as RandomFileMaker.main() draws them
+    def draw(self, index):
+
+        rng = random.Random((self.seed, index))
+        if (self.step >= self.maxsize - 1):
+            size = self.maxsize
+        else:
+            size = rng.randrange(self.step, self.maxsize, self.step)
+        return size, str(rng.randint(1, 65535))
+
+    def size(self, index):
+
+        return self.draw(index)[0]
+
+    # a file-like reader of the file of that name
+    def open(self, name):
+
+        size, randseed = self.draw(self.index(name))
+        chunks = loremChunks(randseed, self.words)
+        if (self.marked):
+            chunks = itertools.chain([name[len(self.prefix):-len(".txt")]], chunks)
+        return LoremReader(chunks, size)
+
+_loremWords = []
+
+# the words of RandomFileMaker.py's Lorem Ipsum text (imported on first use)
+def loremWords():
+
+    if not _loremWords:
+        from RandomFileMaker import randtext
+        _loremWords.extend(randtext.split())
+    return _loremWords
+
+# ------------------------------------------------------------------------------------------
+# loremChunks(randseed, words)
+#
+# The same chunks as RandomFileMaker.fdata(): the words joined by spaces, the list rotated
+# right by the next digit of randseed after every chunk. When there are fewer than 1024 words
+# (fdata's chunk length), every chunk is the whole rotated list, so it is cut from one joined
+# copy of the text with two slices instead of a join over the deque each time.
+# ------------------------------------------------------------------------------------------
+
+def loremChunks(randseed, words):
+
+    if (len(words) > 1024):
+        from RandomFileMaker import fdata
+        for chunk in fdata(randseed, words):
+            yield chunk
+        return
+
+    joined = ' '.join(words)
+    starts = [0]
+    for word in words[:-1]:
+        starts.append(starts[-1] + len(word) + 1)
+    count, digits = len(words), [int(digit) for digit in randseed]
+    rotation, turn = 0, 0
+    while True:
+        first = (count - rotation) % count        # the word the rotated list starts with
+        if (first == 0):
+            yield joined
+        else:
+            yield joined[starts[first]:] + ' ' + joined[:starts[first] - 1]
+        rotation = (rotation + digits[-turn % len(digits)]) % count
+        turn = turn + 1
+
+# ------------------------------------------------------------------------------------------
+# LoremReader(chunks, size)
+#
+# File-like reader (read, close) of the first 'size' bytes of a stream of chunks (strings),
+# eg. a LoremFiles file, for storbinary or an sftp putfo. Nothing is kept but the part of the
+# last chunk not read yet.
+# ------------------------------------------------------------------------------------------
+
+class LoremReader(object):
+
+    def __init__(self, chunks, size):
+
+        self.chunks = chunks
+        self.size   = size
+        self.pos    = 0
+        self.rest   = ''
+
+    def read(self, size=-1):
+
+        remaining = self.size - self.pos
+        if (size < 0) or (size > remaining):
+            size = remaining
+        if (size <= 0):
+            return ''
+
+        pieces, have = [self.rest], len(self.rest)
+        while (have < size):
+            chunk = self.chunks.next()
+            pieces.append(chunk)
+            have = have + len(chunk)
+        data = ''.join(pieces)
+        self.rest = data[size:]
+        self.pos = self.pos + size
+        return data[:size]
+
+    def close(self):
+
+        self.pos  = self.size
+        self.rest = ''
+
+# ------------------------------------------------------------------------------------------
+# HashingReader(reader, algorithm)
+#
+# File-like wrapper (read, close) that feeds every block read through it to a hashlib digest
+# ('md5', 'sha1', 'sha256', ...), so an upload has the digest of its data as soon as the last
+# block is sent, without reading the source a second time: hexdigest().
+# ------------------------------------------------------------------------------------------
+
+class HashingReader(object):
+
+    def __init__(self, reader, algorithm='md5'):
+
+        self.reader = reader
+        self.hash   = hashlib.new(algorithm)
+
+    def read(self, size=-1):
+
+        data = self.reader.read(size)
+        self.hash.update(data)
+        return data
+
+    def close(self):
+
+        self.reader.close()
+
+    def hexdigest(self):
+
+        return self.hash.hexdigest()
+
+# the hex digest of everything a reader has left to read (1MB at a time)
+def digestOf(reader, algorithm='md5'):
+
+    hashing = HashingReader(reader, algorithm)
+    while hashing.read(1024 * 1024):
+        pass
+    hashing.close()
+    return hashing.hexdigest()
+
+# 'dir/name' -> 'dir/<digest>-name', the names MD5checker.py checks uploads by
+def hashedName(name, digest):
+
+    head, tail = posixpath.split(name)
+    return posixpath.join(head, digest + "-" + tail)
+
+# ------------------------------------------------------------------------------------------
+# monotonicNs()
+#
+# Monotonic clock in nanoseconds (not affected by wall clock changes). python 2.x has no
+# time.monotonic, so this calls clock_gettime(CLOCK_MONOTONIC) through ctypes, falling back
+# to time.time() where that is not available.
+# ------------------------------------------------------------------------------------------
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+try:
+    _clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c')).clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+except (OSError, AttributeError, TypeError):
+    _clock_gettime = None
+
+CLOCK_MONOTONIC = 1
+
+def monotonicNs():
+
+    if _clock_gettime is None:
+        return int(time.time() * 1000000000)
+    ts = _timespec()
+    _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts))
+    return ts.tv_sec * 1000000000 + ts.tv_nsec
+
+# ------------------------------------------------------------------------------------------
+# splitHostPort(target, defaultPort)
+#
+# Splits a 'host' or 'host:port' target given on the command line. Returns (host, port).
+# ------------------------------------------------------------------------------------------
+
+def splitHostPort(target, defaultPort):
+
+    if (target.count(':') == 1):
+        host, port = target.split(':')
+        return host, int(port)
+    return target, defaultPort
+
+# ------------------------------------------------------------------------------------------
+# TLSSessions(context)
+#
+# TLS session resumption for the connections of one worker (or worker thread), all made with
+# the same ssl.SSLContext. python 2.x's ssl module cannot hand the session of one connection
+# to the next (3.6 added SSLSocket.session for that), so the libssl that _ssl is linked with
+# is called directly (ctypes) on the SSL of each connection: wrap() offers the session kept
+# from an earlier connection (or, given 'resumeFrom', the current session of that one, eg. the
+# control channel of an ftp session for its data channels) to a new connection before its
+# handshake and tells whether the server resumed the session. The SSL
+# pointer sits in the _ssl object (CPython 2.7.9+) between the reference to the socket and the
+# one to the SSLContext; it is only used when both of those hold the ids of the connection's
+# socket and context (plain integer compares, the pointer itself is never followed to find
+# out) and when libssl is the OpenSSL version the ssl module reports. Otherwise no session is
+# ever offered and every connection simply gets a full handshake (as it does for a run that
+# does not ask for resumption). Tested with CPython 2.7.18 on OpenSSL 1.1.1. Only sessions the
+# server can resume are kept (a TLS 1.3 session only becomes one once its ticket is in).
+# ------------------------------------------------------------------------------------------
+
+class TLSSessions(object):
+
+    libssl    = None                # libssl's functions, once loaded (None: not available)
+    loaded    = False
+    loadLock  = threading.Lock()    # (worker threads of a hybrid run start their sessions together)
+    isResumable = None
+    SSL_SENT_SHUTDOWN     = 1
+    SSL_RECEIVED_SHUTDOWN = 2
+    # PySSLSocket: PyObject_HEAD, Socket, ssl_sock (weakref), ssl, ctx
+    sockOffset = object.__basicsize__
+    sslOffset  = object.__basicsize__ + 2 * ctypes.sizeof(ctypes.c_void_p)
+    ctxOffset  = object.__basicsize__ + 3 * ctypes.sizeof(ctypes.c_void_p)
+
+    def __init__(self, context):
+
+        self.context = context
+        self.session = None         # SSL_SESSION kept for the next connection (our reference)
+        TLSSessions.load()
+
+    @classmethod
+    def load(cls):
+
+        with cls.loadLock:
+            if not cls.loaded:
+                cls.loadLibssl()
+                cls.loaded = True
+
+    @classmethod
+    def loadLibssl(cls):
+
+        if (sys.version_info[0] != 2) or (sys.version_info < (2, 7, 9)):
+            return
+        try:
+            import _ssl
+            libssl = ctypes.CDLL(_ssl.__file__)     # resolves to the libssl it was linked with
+            libssl.SSL_get1_session.restype  = ctypes.c_void_p
+            libssl.SSL_get1_session.argtypes = [ctypes.c_void_p]
+            libssl.SSL_set_session.argtypes  = [ctypes.c_void_p, ctypes.c_void_p]
+            libssl.SSL_session_reused.argtypes = [ctypes.c_void_p]
+            libssl.SSL_SESSION_free.argtypes = [ctypes.c_void_p]
+            libssl.SSL_set_shutdown.argtypes = [ctypes.c_void_p, ctypes.c_int]
+            version = getattr(libssl, 'OpenSSL_version_num', None) or libssl.SSLeay
+            version.restype = ctypes.c_ulong
+            if version() != _ssl.OPENSSL_VERSION_NUMBER:
+                return                              # some other libssl: leave it alone
+        except (ImportError, OSError, AttributeError):
+            return
+        try:
+            libssl.SSL_SESSION_is_resumable.argtypes = [ctypes.c_void_p]
+            cls.isResumable = libssl.SSL_SESSION_is_resumable
+        except AttributeError:
+            cls.isResumable = None                  # (OpenSSL before 1.1.1: no TLS 1.3 either)
+        cls.libssl = libssl
+
+    # True if sessions can be resumed (as far as is known before the first connection)
+    @classmethod
+    def resumable(cls):
+
+        cls.load()
+        return cls.libssl is not None
+
+    # the SSL of an ssl.SSLSocket (None if there is none, or if the _ssl object is not laid
+    # out as expected: its socket and context slots must hold the ids of those two objects)
+    def sslOf(self, sslsock):
+
+        sslobj = getattr(sslsock, '_sslobj', None)
+        if (sslobj is None) or (self.libssl is None):
+            return None
+        if type(sslobj).__basicsize__ < self.ctxOffset + ctypes.sizeof(ctypes.c_void_p):
+            return None
+        slot = lambda offset: ctypes.c_void_p.from_address(id(sslobj) + offset).value
+        if (slot(self.sockOffset) != id(getattr(sslsock, '_sock', None))) or \
+           (slot(self.ctxOffset) != id(sslsock.context)):
+            return None
+        return slot(self.sslOffset)
+
+    # TLS connection over the (connected) socket sock: returns (ssl socket, handshake ns, resumed)
+    def wrap(self, sock, hostname=None, resumeFrom=None):
+
+        sslsock = self.context.wrap_socket(sock, server_hostname=hostname, do_handshake_on_connect=False)
+        if resumeFrom is not None:
+            self.keep(resumeFrom)
+        ssl = self.sslOf(sslsock)
+        if (ssl is not None) and (self.session is not None):
+            self.libssl.SSL_set_session(ssl, self.session)
+        t0 = monotonicNs()
+        sslsock.do_handshake()
+        ns = monotonicNs() - t0
+
+        if ssl is None:
+            return sslsock, ns, False
+        if resumeFrom is None:
+            self.keep(sslsock)
+        return sslsock, ns, bool(self.libssl.SSL_session_reused(ssl))
+
+    # keeps the current session of connection sslsock for the next ones
+    def keep(self, sslsock):
+
+        ssl = self.sslOf(sslsock)
+        if ssl is None:
+            return
+        session = self.libssl.SSL_get1_session(ssl)
+        if not session:
+            return
+        if (self.isResumable is not None) and (not self.isResumable(session)):
+            self.libssl.SSL_SESSION_free(session)
+            return
+        self.forget()
+        self.session = session
+
+    # connection sslsock is about to be closed without a TLS shutdown (python 2.x's close()
+    # never sends one, and an aborted data channel or a session after QUIT gets none either):
+    # marks it as shut down, or OpenSSL would take its session for a failed one and drop it
+    def quiet(self, sslsock):
+
+        ssl = self.sslOf(sslsock)
+        if ssl is not None:
+            self.libssl.SSL_set_shutdown(ssl, self.SSL_SENT_SHUTDOWN | self.SSL_RECEIVED_SHUTDOWN)
+
+    def forget(self):
+
+        if self.session is not None:
+            self.libssl.SSL_SESSION_free(self.session)
+            self.session = None
+
+# ------------------------------------------------------------------------------------------
+# SinkStore(discard)
+#
+# Bookkeeping of the local sink servers (ftp-sink.py, sftp-sink.py): counts the files and
+# bytes received and sent (and the transfers that did not complete), and, in discard mode,
+# stands in for the files themselves. Discarded files are only remembered by name and size
+# (per directory, keyed by their path on disk), which is all the generators need to check an
+# upload (stat/SIZE), list, delete or download them again; a download sends generated data of
+# the remembered size. Shared by the server's threads, hence the lock.
+# ------------------------------------------------------------------------------------------
+
+class SinkStore(object):
+
+    def __init__(self, discard=False):
+
+        self.discard    = discard
+        self.dirs       = {}           # discard mode: directory -> {file name: size}
+        self.filesIn    = 0
+        self.bytesIn    = 0
+        self.filesOut   = 0
+        self.bytesOut   = 0
+        self.incomplete = 0
+        self.started    = time.time()
+        self.lock       = threading.Lock()
+
+    # --- discarded files ---
+
+    def setSize(self, path, size):
+
+        dirname, name = os.path.split(path)
+        with self.lock:
+            self.dirs.setdefault(dirname, {})[name] = size
+
+    # size of a discarded file, None if there is no such file
+    def getSize(self, path):
+
+        dirname, name = os.path.split(path)
+        with self.lock:
+            return self.dirs.get(dirname, {}).get(name)
+
+    # forgets a discarded file, returns False if there was no such file
+    def remove(self, path):
+
+        dirname, name = os.path.split(path)
+        with self.lock:
+            return self.dirs.get(dirname, {}).pop(name, None) is not None
+
+    def rename(self, oldpath, newpath):
+
+        size = self.getSize(oldpath)
+        if size is None:
+            return False
+        self.remove(oldpath)
+        self.setSize(newpath, size)
+        return True
+
+    # names of the discarded files in a directory
+    def names(self, dirname):
+
+        with self.lock:
+            return self.dirs.get(dirname, {}).keys()
+
+    # --- counters ---
+
+    def received(self, nbytes, completed=True):
+
+        with self.lock:
+            self.bytesIn = self.bytesIn + nbytes
+            if (completed):
+                self.filesIn = self.filesIn + 1
+            else:
+                self.incomplete = self.incomplete + 1
+
+    def sent(self, nbytes, completed=True):
+
+        with self.lock:
+            self.bytesOut = self.bytesOut + nbytes
+            if (completed):
+                self.filesOut = self.filesOut + 1
+            else:
+                self.incomplete = self.incomplete + 1
+
+    def report(self):
+
+        seconds = max(time.time() - self.started, 0.001)
+        return "Received: %d files, %d bytes (%.3f MB/s)  Sent: %d files, %d bytes (%.3f MB/s)  Incomplete: %d" % \
+               (self.filesIn, self.bytesIn, self.bytesIn / seconds / (1024 * 1024),
+                self.filesOut, self.bytesOut, self.bytesOut / seconds / (1024 * 1024), self.incomplete)
+
+# ------------------------------------------------------------------------------------------
+# scanTree(top, recursive)
+#
+# Lists the regular files in directory 'top' (and, if recursive, in all its subdirectories).
+# Returns (files, dirs): files is a list of (path relative to top, size), largest first, and
+# dirs the relative paths of the subdirectories in parent-before-child order (empty unless
+# recursive). Symbolic links are not followed. Uses scandir when it is installed (it gets the
+# file types from the directory listing itself instead of one stat() per entry), otherwise
+# os.listdir + os.lstat.
+# ------------------------------------------------------------------------------------------
+
+def scanTree(top, recursive=False):
+
+    files = []
+    dirs  = []
+    pending = ['']
+    while pending:
+        reldir = pending.pop(0)
+        path = os.path.join(top, reldir)
+
+        if scandir is not None:
+            for entry in scandir(path):
+                relpath = os.path.join(reldir, entry.name)
+                if entry.is_file(follow_symlinks=False):
+                    files.append((relpath, entry.stat(follow_symlinks=False).st_size))
+                elif recursive and entry.is_dir(follow_symlinks=False):
+                    dirs.append(relpath)
+                    pending.append(relpath)
+        else:
+            for name in os.listdir(path):
+                relpath = os.path.join(reldir, name)
+                st = os.lstat(os.path.join(top, relpath))
+                if stat.S_ISREG(st.st_mode):
+                    files.append((relpath, st.st_size))
+                elif recursive and stat.S_ISDIR(st.st_mode):
+                    dirs.append(relpath)
+                    pending.append(relpath)
+
+    files.sort(key=lambda f: f[1], reverse=True)
+    return files, dirs
+
+# ------------------------------------------------------------------------------------------
+# WorkloadMix(spec, validOps, createOp, noFileOps)
+#
+# A weighted mix of operations, eg. 'stor=60,retr=25,list=10,dele=3,size=2'. 'spec' is either
+# that string or the name of a file holding one 'op = weight' per line (# starts a comment).
+# Raises ValueError for unknown operations or bad weights.
+#
+# plan(count, window) then decides, up front, the operation and target file of each of the
+# 'count' tasks, so that every process draws from the same plan (see task()). createOp
+# (upload) tasks create file number index+1; the other operations act on a file created by an
+# earlier task, except noFileOps (eg. a directory listing) which need no file. A file only
+# becomes a target once it was created at least 'window' tasks earlier (by then it is all but
+# certainly complete, even with 'window' tasks running at once) and is never a target again
+# once deleted. While no file is available, a task that needs one becomes an upload.
+# ------------------------------------------------------------------------------------------
+
+class WorkloadMix(object):
+
+    def __init__(self, spec, validOps, createOp='stor', noFileOps=()):
+
+        if os.path.isfile(spec):
+            fh = open(spec)
+            items = [line.split('#')[0].strip() for line in fh]
+            fh.close()
+        else:
+            items = [item.strip() for item in spec.split(',')]
+
+        weights = {}
+        for item in items:
+            if not item:
+                continue
+            if '=' not in item:
+                raise ValueError("expected op=weight: " + item)
+            op, weight = [part.strip().lower() for part in item.split('=', 1)]
+            if op not in validOps:
+                raise ValueError("unknown operation '" + op + "' (valid: " + ", ".join(validOps) + ")")
+            weights[op] = float(weight)
+            if weights[op] < 0:
+                raise ValueError("negative weight for " + op)
+
+        self.ops = [op for op in validOps if weights.get(op, 0) > 0]
+        if not self.ops:
+            raise ValueError("no operation has a weight")
+        self.weights   = [weights[op] for op in self.ops]
+        self.total     = sum(self.weights)
+        self.createOp  = createOp
+        self.noFileOps = noFileOps
+        self.opIndex   = None
+        self.targets   = None
+        self.names     = None
+
+    def describe(self):
+
+        return ",".join(["%s=%g" % (op, weight) for op, weight in zip(self.ops, self.weights)])
+
+    # weighted random choice of an operation
+    def pick(self, rng):
+
+        point = rng.random() * self.total
+        for op, weight in zip(self.ops, self.weights):
+            point = point - weight
+            if (point < 0):
+                return op
+        return self.ops[-1]
+
+    def plan(self, count, window=1, seed=None):
+
+        rng = random.Random(seed)
+        names = self.ops + [self.createOp]     # (an upload may be planned even with no weight)
+        self.opIndex = array('b')
+        self.targets = array('l')
+        settled = []                # file numbers that can be used as targets
+        pending = deque()           # (task, file number) created too recently
+
+        for index in xrange(count):
+            while pending and pending[0][0] <= index - window:
+                settled.append(pending.popleft()[1])
+
+            op = self.pick(rng)
+            if (op != self.createOp) and (op not in self.noFileOps) and (not settled):
+                op = self.createOp
+
+            if (op == self.createOp):
+                target = index + 1
+                pending.append((index, target))
+            elif (op in self.noFileOps):
+                target = 0
+            else:
+                pos = rng.randrange(len(settled))
+                target = settled[pos]
+                if (op == 'dele'):
+                    settled[pos] = settled[-1]
+                    settled.pop()
+
+            self.opIndex.append(names.index(op))
+            self.targets.append(target)
+        self.names = names
+
+    # (operation, file number) of task 'index' (0 based)
+    def task(self, index):
+
+        return self.names[self.opIndex[index]], self.targets[index]
+
+# ------------------------------------------------------------------------------------------
+# parseRate(text)
+#
+# Parses an arrival rate given on the command line: a plain number is files per second
+# ('2.5'), a number with a B, KB, MB or GB suffix is bytes per second ('40MB' = 40 * 2**20).
+# Returns (rate, isBytes). Raises ValueError on anything else.
+# ------------------------------------------------------------------------------------------
+
+rateUnits = (('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024), ('B', 1))
+
+def parseRate(text):
+
+    text = text.strip().upper()
+    for suffix, multiplier in rateUnits:
+        if text.endswith(suffix):
+            rate = float(text[:-len(suffix)]) * multiplier
+            isBytes = True
+            break
+    else:
+        rate = float(text)
+        isBytes = False
+    if (rate <= 0):
+        raise ValueError("rate must be greater than zero: " + text)
+    return rate, isBytes
+
+# ------------------------------------------------------------------------------------------
+# parseSize(text)
+#
+# Parses a size in bytes: a number, optionally with a B, KB, MB or GB suffix (eg. 256KB).
+# Returns the whole number of bytes. Raises ValueError on anything else.
+# ------------------------------------------------------------------------------------------
+
+def parseSize(text):
+
+    text = text.strip().upper()
+    for suffix, multiplier in rateUnits:
+        if text.endswith(suffix):
+            size = int(float(text[:-len(suffix)]) * multiplier)
+            break
+    else:
+        size = int(text)
+    if (size <= 0):
+        raise ValueError("size must be greater than zero: " + text)
+    return size
+
+# ------------------------------------------------------------------------------------------
+# ArrivalSchedule(rate, count, poisson, sizes, seed)
+#
+# Open-loop arrival times for 'count' transfers. Transfers are due at fixed times decided up
+# front, independently of how fast earlier ones complete, so a slow server makes transfers
+# queue up (and their latency, measured from the time they were due, grow) instead of quietly
+# lowering the offered load (coordinated omission).
+#
+# 'rate' is in files per second, or in bytes per second when 'sizes' is given (the size of
+# every file, or a list with the size of each file), in which case a file's gap to the next
+# one is its size / rate. The gaps are constant, or exponentially distributed around that
+# mean (a Poisson process) when 'poisson' is set. Offsets are only stored (8 bytes a file)
+# when they cannot be computed, ie. Poisson arrivals or files of different sizes.
+#
+# With a rate LoadProfile ('profile') the rate is the one of the profile's step each arrival
+# falls in, and the schedule ends with the profile: 'count' is then only an upper bound and
+# is lowered to the number of arrivals the profile has room for.
+#
+# Call start() once, before the workers are forked, then due(index) or wait(index) (0 based)
+# in whichever process sends that file: monotonicNs() is the same clock in every process.
+# ------------------------------------------------------------------------------------------
+
+class ArrivalSchedule(object):
+
+    def __init__(self, rate, count, poisson=False, sizes=None, seed=None, profile=None):
+
+        self.rate    = rate
+        self.count   = count
+        self.poisson = poisson
+        self.isBytes = sizes is not None
+        self.startNs = 0
+        self.offsets = None
+        self.profile = profile
+
+        if (not poisson) and (not isinstance(sizes, list)) and (profile is None):
+            self.interval = (sizes or 1) * 1e9 / rate
+            return
+
+        rng = random.Random(seed)
+        self.offsets = array('l')
+        offset = 0.0
+        for index in xrange(count):
+            if profile is not None:
+                if (offset >= profile.duration):
+                    self.count = index
+                    break
+                rate = profile.levelAt(offset)
+            self.offsets.append(int(offset))
+            if sizes is None:
+                gap = 1e9 / rate
+            elif isinstance(sizes, list):
+                gap = sizes[index] * 1e9 / rate
+            else:
+                gap = sizes * 1e9 / rate
+            if (poisson):
+                gap = rng.expovariate(1.0 / gap) if gap > 0 else 0
+            offset = offset + gap
+
+    # sets time zero of the schedule (now, unless given)
+    def start(self, startNs=None):
+
+        if startNs is None:
+            startNs = monotonicNs()
+        self.startNs = startNs
+
+    # monotonicNs() time at which transfer 'index' is due
+    def due(self, index):
+
+        if self.offsets is None:
+            return self.startNs + int(index * self.interval)
+        return self.startNs + self.offsets[index]
+
+    # sleeps until transfer 'index' is due (not at all if already late) and returns its due time
+    def wait(self, index):
+
+        due = self.due(index)
+        delay = due - monotonicNs()
+        if (delay > 0):
+            time.sleep(delay / 1e9)
+        return due
+
+    def describe(self):
+
+        if (self.profile is not None):
+            rate = "profile " + self.profile.describe() + ", " + str(self.count) + " files"
+        elif (self.isBytes):
+            rate = ("%g" % (self.rate / (1024 * 1024))) + " MB/s"
+        else:
+            rate = ("%g" % self.rate) + " files/s"
+        return rate + (" (poisson)" if self.poisson else " (fixed)")
+
+# ------------------------------------------------------------------------------------------
+# LoadProfile(spec)
+#
+# A load that changes over time, as a list of stages, eg.
+#
+#    warmup=30s:2,ramp=2m:2-10,steady=10m:10,cooldown=30s:2
+#
+# each 'name=duration:level' (duration in s, m or h; plain seconds). A level is a number of
+# concurrent sessions, or an arrival rate when it ends in /s (files/s, or bytes/s with a
+# B/KB/MB/GB suffix, see parseRate: '20/s', '40MB/s'); all stages must use the same kind.
+# 'from-to' steps the level from one value to the other in equal steps over the stage,
+# one step per session by default (5 for rates), or in K steps with a trailing @K
+# ('2-10@3', '5-50/s@10'). 'spec' is either that string or the name of a file holding one
+# stage per line (# starts a comment). Raises ValueError on anything it cannot parse.
+#
+# Every step is accounted on its own (a stage of one step keeps its name, the steps of a
+# ramp are name.1, name.2, ...; see TransferStats.profile). A stage named warmup (or
+# warm-up) is left out of the headline figures. Time is counted from start(), called once
+# before the workers are forked (monotonicNs() is the same clock in every process).
+#
+# With session levels, enter()/leave() limit the transfers running at once to the current
+# level (for a parent handing out tasks) and waitActive(index) holds session 'index' (0
+# based) back while the level is at or below it (for sessions pulling their own).
+# ------------------------------------------------------------------------------------------
+
+class LoadProfile(object):
+
+    warmupNames = ('warmup', 'warm-up')
+    timeUnits   = (('ms', 1e6), ('s', 1e9), ('m', 60e9), ('h', 3600e9))
+
+    def __init__(self, spec):
+
+        if os.path.isfile(spec):
+            fh = open(spec)
+            items = [line.split('#')[0].strip() for line in fh]
+            fh.close()
+        else:
+            items = [item.strip() for item in spec.split(',')]
+
+        self.steps   = []           # (name, start offset ns, end offset ns, level, in headline)
+        self.isRate  = None
+        self.isBytes = False
+        self.specs   = []
+        offset = 0
+        for item in items:
+            if not item:
+                continue
+            if ('=' not in item) or (':' not in item):
+                raise ValueError("expected name=duration:level: " + item)
+            name, rest = [part.strip() for part in item.split('=', 1)]
+            duration, level = [part.strip() for part in rest.split(':', 1)]
+            durationNs = self.parseDuration(duration)
+            levels = self.parseLevels(level)
+            self.specs.append(name + "=" + duration + ":" + level)
+            for index, value in enumerate(levels):
+                start = offset + durationNs * index // len(levels)
+                end   = offset + durationNs * (index + 1) // len(levels)
+                stepName = name if len(levels) == 1 else name + "." + str(index + 1)
+                self.steps.append((stepName, start, end, value, name.lower() not in self.warmupNames))
+            offset = offset + durationNs
+        if not self.steps:
+            raise ValueError("no stages")
+
+        self.duration = offset
+        self.starts   = [step[1] for step in self.steps]
+        self.startNs  = 0
+        self.running  = 0
+        self.cond     = threading.Condition()
+
+    @staticmethod
+    def parseDuration(text):
+
+        text = text.lower()
+        for suffix, multiplier in sorted(LoadProfile.timeUnits, key=lambda unit: -len(unit[0])):
+            if text.endswith(suffix) and text[:-len(suffix)].replace('.', '', 1).isdigit():
+                value = float(text[:-len(suffix)]) * multiplier
+                break
+        else:
+            value = float(text) * 1e9
+        if (value <= 0):
+            raise ValueError("stage duration must be greater than zero: " + text)
+        return int(value)
+
+    # the level(s) of one stage: [value] or the values of its steps
+    def parseLevels(self, text):
+
+        steps = None
+        if '@' in text:
+            text, steps = text.split('@', 1)
+            steps = int(steps)
+            if (steps < 1):
+                raise ValueError("a stage needs at least one step: @" + str(steps))
+        isRate = text.lower().endswith('/s')
+        if isRate:
+            text = text[:-2]
+        if (self.isRate is not None) and (isRate != self.isRate):
+            raise ValueError("all stages must be sessions, or all rates (/s)")
+        self.isRate = isRate
+
+        ends = [part.strip() for part in text.split('-')]
+        if (len(ends) > 2):
+            raise ValueError("expected level or from-to: " + text)
+        values = []
+        for end in ends:
+            if isRate:
+                value, isBytes = parseRate(end)
+                if (values) and (isBytes != self.isBytes):
+                    raise ValueError("a ramp cannot go from files/s to bytes/s: " + text)
+                self.isBytes = isBytes
+            else:
+                value = int(end)
+                if (value < 1):
+                    raise ValueError("sessions must be at least 1: " + end)
+            values.append(value)
+        if (len(values) == 1):
+            return values
+        low, high = values
+        if steps is None:
+            steps = (abs(high - low) + 1) if not isRate else 5
+        if (steps == 1):
+            return [high]
+        levels = [low + (high - low) * index / float(steps - 1) for index in range(steps)]
+        if not isRate:
+            levels = [int(round(level)) for level in levels]
+        return levels
+
+    def describe(self):
+
+        return ",".join(self.specs)
+
+    # sets time zero of the profile (now, unless given)
+    def start(self, startNs=None):
+
+        if startNs is None:
+            startNs = monotonicNs()
+        self.startNs = startNs
+
+    # index of the step an offset (ns since start) falls in (the first before it, the last after it)
+    def stepIndex(self, offset):
+
+        index = bisect.bisect_right(self.starts, offset) - 1
+        return max(index, 0)
+
+    # the name of the step monotonicNs() time 'ns' falls in, and whether it is in the headline
+    def stepAt(self, ns):
+
+        name, start, end, level, headline = self.steps[self.stepIndex(ns - self.startNs)]
+        return name, headline
+
+    # the level (sessions or rate) at an offset (ns since start)
+    def levelAt(self, offset):
+
+        return self.steps[self.stepIndex(offset)][3]
+
+    def maxLevel(self):
+
+        return max([step[3] for step in self.steps])
+
+    def over(self):
+
+        return monotonicNs() - self.startNs >= self.duration
+
+    # time spent in steps left out of the headline, in a run of elapsedNs
+    def excludedNs(self, elapsedNs):
+
+        excluded = 0
+        for name, start, end, level, headline in self.steps:
+            if not headline:
+                excluded = excluded + max(0, min(end, elapsedNs) - start)
+        return excluded
+
+    # steps in order: (name, ns of it within a run of elapsedNs, level, in headline)
+    def stepList(self, elapsedNs):
+
+        return [(name, max(0, min(end, elapsedNs) - start), level, headline)
+                for name, start, end, level, headline in self.steps]
+
+    # a level as shown in reports
+    def levelText(self, level):
+
+        if not self.isRate:
+            return "%d sess" % level
+        if self.isBytes:
+            return "%g MB/s" % (level / (1024 * 1024))
+        return "%g/s" % level
+
+    # session levels: waits until fewer transfers than the level are running and counts one
+    # more in; False (and nothing counted) once the profile is over
+    def enter(self):
+
+        with self.cond:
+            while True:
+                offset = monotonicNs() - self.startNs
+                if (offset >= self.duration):
+                    return False
+                if (self.running < self.levelAt(offset)):
+                    self.running = self.running + 1
+                    return True
+                self.cond.wait(0.1)         # (level changes are seen within 0.1s)
+
+    # a transfer let in by enter() is done (any arguments are ignored: a pool callback)
+    def leave(self, *args):
+
+        with self.cond:
+            self.running = self.running - 1
+            self.cond.notify()
+
+    # session levels: True if session 'index' is wanted now
+    def active(self, index):
+
+        return index < self.levelAt(monotonicNs() - self.startNs)
+
+    # session levels: waits until session 'index' is wanted; False once the profile is over
+    def waitActive(self, index):
+
+        while True:
+            offset = monotonicNs() - self.startNs
+            if (offset >= self.duration):
+                return False
+            if (index < self.levelAt(offset)):
+                return True
+            time.sleep(0.1)
+
+# ------------------------------------------------------------------------------------------
+# SaturationSearch(spec, defaultHigh)
+#
+# Finds the knee of a server: the highest load at which short trials still meet a service
+# level objective (SLO). 'spec' is a comma separated list of
+#
+#    p50|p90|p99|p99.9=T  latency bound (ms, or with an ms/s suffix)       [none]
+#    errors=E             highest error rate, % of the transfers            [1]
+#    sessions=A-B         search concurrent sessions from A to B            [1-defaultHigh]
+#    rate=A-B/s           or search arrival rates (files/s, or B/KB/MB/GB/s, see parseRate)
+#    trial=T              length of a trial (seconds, or with a ms/s/m suffix)  [10s]
+#    warmup=T             start of a trial left out of its figures          [2s]
+#    method=M             binary: double the load until the SLO breaks, then bisect between
+#                         the last level that held and the first that did not (to one session,
+#                         or 5% of a rate); golden: golden-section search for the level with
+#                         the most throughput within the SLO                [binary]
+#    trials=N             stop after N trials whatever                      [20]
+#
+# eg. 'p99=250ms,errors=1,sessions=1-64'. Raises ValueError on anything it cannot parse.
+#
+# The caller runs the trials: next() gives the level of the next one (None when the search is
+# over), profile(level) the LoadProfile that runs it (a warmup stage, then a trial stage) and
+# result(level, summary) takes its TransferStats.summary and returns a line describing it.
+# A level is only ever tried once. report() and toDict() give the knee and the measured curve.
+# ------------------------------------------------------------------------------------------
+
+class SaturationSearch(object):
+
+    methods   = ('binary', 'golden')
+    precision = 0.05                # rates: bisect down to 5% of the level
+
+    def __init__(self, spec, defaultHigh):
+
+        self.latency   = None       # (percentile key, bound in ms)
+        self.maxErrors = 1.0
+        self.isRate    = False
+        self.isBytes   = False
+        self.low       = 1
+        self.high      = defaultHigh
+        self.trialNs   = int(10e9)
+        self.warmupNs  = int(2e9)
+        self.method    = 'binary'
+        self.maxTrials = 20
+
+        for item in [item.strip() for item in spec.split(',')]:
+            if not item:
+                continue
+            if '=' not in item:
+                raise ValueError("expected name=value: " + item)
+            name, value = [part.strip() for part in item.split('=', 1)]
+            name = name.lower()
+            if name in ['p' + str(percent) for percent in TransferStats.percentiles]:
+                if value.replace('.', '', 1).isdigit():
+                    bound = float(value)
+                else:
+                    bound = LoadProfile.parseDuration(value) / 1e6
+                self.latency = (name, bound)
+            elif name == 'errors':
+                self.maxErrors = float(value.rstrip('%'))
+            elif name == 'sessions':
+                self.low, self.high = self.parseRange(value, False)
+            elif name == 'rate':
+                self.isRate = True
+                self.low, self.high = self.parseRange(value, True)
+            elif name == 'trial':
+                self.trialNs = LoadProfile.parseDuration(value)
+            elif name == 'warmup':
+                self.warmupNs = 0 if value in ('0', 'none') else LoadProfile.parseDuration(value)
+            elif name == 'method':
+                if value not in self.methods:
+                    raise ValueError("method must be one of " + ", ".join(self.methods) + ": " + value)
+                self.method = value
+            elif name == 'trials':
+                self.maxTrials = int(value)
+            else:
+                raise ValueError("unknown setting: " + name)
+
+        if (self.low > self.high):
+            raise ValueError("the range must go from low to high: %s-%s" % (self.low, self.high))
+        self.points = {}            # level -> outcome of its trial
+        self.order  = []            # levels in the order they were tried
+        self.search = self.binary() if self.method == 'binary' else self.golden()
+
+    # 'A-B' (sessions), 'A-B/s' (rates): (low, high)
+    def parseRange(self, text, isRate):
+
+        if isRate and text.lower().endswith('/s'):
+            text = text[:-2]
+        ends = [part.strip() for part in text.split('-')]
+        if (len(ends) != 2):
+            raise ValueError("expected from-to: " + text)
+        if not isRate:
+            low, high = int(ends[0]), int(ends[1])
+            if (low < 1):
+                raise ValueError("sessions must be at least 1: " + ends[0])
+            return low, high
+        (low, lowBytes), (high, highBytes) = parseRate(ends[0]), parseRate(ends[1])
+        if (lowBytes != highBytes):
+            raise ValueError("a range cannot go from files/s to bytes/s: " + text)
+        self.isBytes = lowBytes
+        return low, high
+
+    def describe(self):
+
+        slo = []
+        if self.latency:
+            slo.append("%s <= %g ms" % self.latency)
+        slo.append("errors <= %g%%" % self.maxErrors)
+        return "%s search of %s to %s, SLO %s, trials of %gs after %gs warm-up" % \
+               (self.method, self.levelText(self.low), self.levelText(self.high), " and ".join(slo),
+                self.trialNs / 1e9, self.warmupNs / 1e9)
+
+    def levelText(self, level):
+
+        if not self.isRate:
+            return "%d sess" % level
+        if self.isBytes:
+            return "%g MB/s" % (level / (1024 * 1024))
+        return "%g/s" % level
+
+    # a level as the search would try it: whole sessions (rates to 4 digits, so that a level
+    # worked out twice is the same level), within the range
+    def clamp(self, level):
+
+        if not self.isRate:
+            level = int(round(level))
+        else:
+            level = float('%.4g' % level)
+        return min(max(level, self.low), self.high)
+
+    # rates are only told apart to self.precision, sessions to one
+    def close(self, low, high):
+
+        if not self.isRate:
+            return high - low <= 1
+        return high - low <= low * self.precision
+
+    # the next level to try, None once the search is over
+    def next(self):
+
+        if (len(self.order) >= self.maxTrials):
+            return None
+        try:
+            return self.search.next()
+        except StopIteration:
+            return None
+
+    # the LoadProfile of a trial at 'level'
+    def profile(self, level):
+
+        if not self.isRate:
+            text = "%d" % level
+        elif self.isBytes:
+            text = "%dB/s" % max(level, 1)
+        else:
+            text = "%g/s" % level
+        stages = ["trial=%dms:%s" % (self.trialNs // 1000000, text)]
+        if self.warmupNs:
+            stages.insert(0, "warmup=%dms:%s" % (self.warmupNs // 1000000, text))
+        return LoadProfile(",".join(stages))
+
+    # takes the TransferStats.summary of the trial at 'level'; returns a line describing it
+    def result(self, level, summary):
+
+        attempts = summary['files'] + summary['errors']
+        errorRate = 100.0 * summary['errors'] / max(attempts, 1)
+        broken = []
+        if (summary['files'] == 0):
+            broken.append("no transfer completed")
+        if self.latency:
+            key, bound = self.latency
+            if (summary['latency_ms'][key] > bound):
+                broken.append("%s %.1f ms > %g ms" % (key, summary['latency_ms'][key], bound))
+        if (errorRate > self.maxErrors):
+            broken.append("errors %.2f%% > %g%%" % (errorRate, self.maxErrors))
+
+        point = { 'level'         : level,
+                  'files'         : summary['files'],
+                  'errors'        : summary['errors'],
+                  'error_pct'     : errorRate,
+                  'files_per_sec' : summary['files_per_sec'],
+                  'mb_per_sec'    : summary['mb_per_sec'],
+                  'p50_ms'        : summary['latency_ms']['p50'],
+                  'p99_ms'        : summary['latency_ms']['p99'],
+                  'ok'            : not broken,
+                  'broken'        : broken }
+        if self.latency:
+            point[self.latency[0] + '_ms'] = summary['latency_ms'][self.latency[0]]
+        self.points[level] = point
+        self.order.append(level)
+        return "Trial %d: %-12s %s" % (len(self.order), self.levelText(level),
+                                       self.pointText(point) + ("  ok" if not broken else "  SLO broken: " + ", ".join(broken)))
+
+    def pointText(self, point):
+
+        return "%10.2f files/s %10.3f MB/s   p50 %9.3f ms   p99 %9.3f ms   errors %6.2f%%" % \
+               (point['files_per_sec'], point['mb_per_sec'], point['p50_ms'], point['p99_ms'], point['error_pct'])
+
+    def ok(self, level):
+
+        return self.points[level]['ok']
+
+    # binary: doubles the level until the SLO breaks (or the range ends), then bisects between
+    # the last level that held and the first that did not
+    def binary(self):
+
+        good, bad = None, None
+        level = self.low
+        while True:
+            if level not in self.points:
+                yield level
+            if not self.ok(level):
+                bad = level
+                break
+            good = level
+            if (level >= self.high):
+                return
+            level = self.clamp(level * 2)
+        if good is None:
+            return
+        while not self.close(good, bad):
+            level = self.clamp((good + bad) / 2.0)
+            if (level in (good, bad)):
+                return
+            if level not in self.points:
+                yield level
+            if self.ok(level):
+                good = level
+            else:
+                bad = level
+
+    # the value golden() maximises: throughput within the SLO, and past it the lower the level
+    # the better (so the search turns back towards the knee)
+    def score(self, level):
+
+        point = self.points[level]
+        if point['ok']:
+            return point['files_per_sec']
+        return -level
+
+    # golden: golden-section search of the range for the level with the highest score()
+    def golden(self):
+
+        invphi = (math.sqrt(5) - 1) / 2
+        low, high = self.low, self.high
+        while not self.close(low, high):
+            inner = [self.clamp(high - (high - low) * invphi), self.clamp(low + (high - low) * invphi)]
+            for level in inner:
+                if level not in self.points:
+                    yield level
+            previous = (low, high)
+            first, second = self.score(inner[0]), self.score(inner[1])
+            if (first > second) or ((first == second) and not self.ok(inner[0])):
+                high = inner[1]
+            else:
+                low = inner[0]
+            if (low, high) == previous:
+                break
+        for level in (low, high):
+            if level not in self.points:
+                yield level
+
+    # the highest level tried that met the SLO (None if none did)
+    def knee(self):
+
+        held = [level for level in self.points if self.points[level]['ok']]
+        return max(held) if held else None
+
+    # human readable report lines: the curve (every level tried, in order of level) and the knee
+    def report(self):
+
+        lines = ["Saturation search: " + self.describe() + ", " + str(len(self.order)) + " trials",
+                 "Curve:"]
+        for level in sorted(self.points):
+            point = self.points[level]
+            lines.append("  %-12s %s  %s" % (self.levelText(level), self.pointText(point),
+                                             "ok" if point['ok'] else "SLO broken"))
+        knee = self.knee()
+        if knee is None:
+            lines.append("Knee: none, the SLO is broken from " + self.levelText(min(self.points) if self.points else self.low))
+            return lines
+        point = self.points[knee]
+        lines.append("Knee: %s (%.2f files/s, %.3f MB/s, p99 %.3f ms)" %
+                     (self.levelText(knee), point['files_per_sec'], point['mb_per_sec'], point['p99_ms']))
+        above = [level for level in self.points if level > knee and not self.points[level]['ok']]
+        if above:
+            lines.append("  first level above it that broke the SLO: %s (%s)" %
+                         (self.levelText(min(above)), ", ".join(self.points[min(above)]['broken'])))
+        elif (knee >= self.high):
+            lines.append("  the SLO held over the whole range: the knee may be higher")
+        return lines
+
+    def toDict(self):
+
+        return { 'method'     : self.method,
+                 'kind'       : 'rate' if self.isRate else 'sessions',
+                 'bytes_rate' : self.isBytes,
+                 'range'      : [self.low, self.high],
+                 'slo'        : { 'latency_ms' : dict([self.latency]) if self.latency else {},
+                                  'errors_pct' : self.maxErrors },
+                 'trial_sec'  : self.trialNs / 1e9,
+                 'warmup_sec' : self.warmupNs / 1e9,
+                 'trials'     : [self.points[level] for level in self.order],
+                 'knee'       : self.knee() }
+
+# ------------------------------------------------------------------------------------------
+# TaskWindow(limit)
+#
+# Bounds the tasks a parent has handed to a multiprocessing Pool and not yet seen finish:
+# enter() before every apply_async (waits while 'limit' are out) and leave() as its callback.
+# The pool then never holds more than 'limit' pending tasks (nor the parent as many
+# AsyncResults), however many are handed out in all. Same interface as the session gate of
+# LoadProfile (enter, leave).
+# ------------------------------------------------------------------------------------------
+
+class TaskWindow(object):
+
+    def __init__(self, limit):
+
+        self.limit   = max(limit, 1)
+        self.running = 0
+        self.cond    = threading.Condition()
+
+    def enter(self):
+
+        with self.cond:
+            while (self.running >= self.limit):
+                self.cond.wait(0.1)         # (a timeout keeps the parent interruptible)
+            self.running = self.running + 1
+        return True
+
+    # a task let in by enter() is done (any arguments are ignored: a pool callback)
+    def leave(self, *args):
+
+        with self.cond:
+            self.running = self.running - 1
+            self.cond.notify()
+
+# the items of 'iterable' in lists of up to 'size', made as they are asked for
+def chunked(iterable, size):
+
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if (len(chunk) >= size):
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# ------------------------------------------------------------------------------------------
+# LatencyHistogram()
+#
+# Compact log-bucketed (HdrHistogram style) histogram of nanosecond values. Values are grouped
+# by their power of two and each power of two is split into 2**subBucketBits linear sub-
+# buckets, so any recorded value is known to within 1/32 (~3%) whatever its magnitude, while
+# the whole nanosecond..hours range fits in a few hundred buckets. Only buckets that have been
+# hit are stored (dict of bucket index -> count), so histograms are cheap to ship between
+# processes and to merge.
+# ------------------------------------------------------------------------------------------
+
+class LatencyHistogram(object):
+
+    subBucketBits = 6
+
+    def __init__(self):
+
+        self.counts = {}
+        self.total  = 0
+        self.minNs  = None
+        self.maxNs  = 0
+        self.sumNs  = 0
+
+    # Bucket index of a value. Values below 2**subBucketBits have a bucket each. Above that,
+    # a value is reduced to its top subBucketBits bits ('top', which therefore lies between
+    # half and all of 2**subBucketBits) and the number of bits dropped ('shift'), giving
+    # consecutive indexes shift * half + top.
+    def bucketOf(self, ns):
+
+        shift = ns.bit_length() - self.subBucketBits
+        if (shift <= 0):
+            return ns
+        return (shift << (self.subBucketBits - 1)) + (ns >> shift)
+
+    # highest value that falls in a bucket (the value reported for it)
+    def bucketHigh(self, index):
+
+        if (index < (1 << self.subBucketBits)):
+            return index
+        shift = (index >> (self.subBucketBits - 1)) - 1
+        top = index - (shift << (self.subBucketBits - 1))
+        return ((top + 1) << shift) - 1
+
+    def record(self, ns):
+
+        ns = max(int(ns), 0)
+        index = self.bucketOf(ns)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total = self.total + 1
+        self.sumNs = self.sumNs + ns
+        if (self.minNs is None) or (ns < self.minNs):
+            self.minNs = ns
+        if (ns > self.maxNs):
+            self.maxNs = ns
+
+    def merge(self, other):
+
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total = self.total + other.total
+        self.sumNs = self.sumNs + other.sumNs
+        if (other.minNs is not None) and ((self.minNs is None) or (other.minNs < self.minNs)):
+            self.minNs = other.minNs
+        self.maxNs = max(self.maxNs, other.maxNs)
+
+    def mean(self):
+
+        if (self.total == 0):
+            return 0
+        return self.sumNs / float(self.total)
+
+    # plain (JSON friendly) form of the histogram, see fromDict
+    def toDict(self):
+
+        return { 'counts' : sorted(self.counts.items()),
+                 'total'  : self.total,
+                 'minNs'  : self.minNs,
+                 'maxNs'  : self.maxNs,
+                 'sumNs'  : self.sumNs }
+
+    @classmethod
+    def fromDict(cls, state):
+
+        hist = cls()
+        hist.counts = dict([(int(index), count) for index, count in state['counts']])
+        hist.total  = state['total']
+        hist.minNs  = state['minNs']
+        hist.maxNs  = state['maxNs']
+        hist.sumNs  = state['sumNs']
+        return hist
+
+    # value (ns) at or below which 'percent' percent of the recorded values fall
+    def percentile(self, percent):
+
+        if (self.total == 0):
+            return 0
+        wanted = max(1, int(math.ceil(self.total * percent / 100.0)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen = seen + self.counts[index]
+            if (seen >= wanted):
+                return min(self.bucketHigh(index), self.maxNs)
+        return self.maxNs
+
+# ------------------------------------------------------------------------------------------
+# TransferStats()
+#
+# Per worker accounting of the transfers it made: a LatencyHistogram of the transfer
+# durations plus file, byte and error counts. Workers record into their own instance (threads
+# of one worker share it, hence the lock) and ship it to the parent when they finish, where
+# all of them are merged into one for the report. Instances pickle without their lock.
+#
+# Optionally, the time spent in each protocol phase (connect, login, data channel setup, ...)
+# is kept too, one LatencyHistogram per phase name (see recordPhase).
+#
+# In open-loop mode (see ArrivalSchedule) transfer durations are measured from the time the
+# transfer was due, and how late each one actually started is kept in a separate histogram
+# (see recordLag).
+#
+# With a mixed workload (see WorkloadMix) each record/error also names its operation, which
+# is then accounted in a TransferStats of its own for that operation as well (self.ops).
+#
+# TLS handshakes are kept apart from the transfers (see recordHandshake), per channel (eg.
+# control and data), with how many of them resumed an earlier session.
+#
+# Errors may come with a reason (the exception text), counted per distinct reason so that the
+# parent can report what went wrong without the workers printing it. Sessions re-established
+# to try a transfer again are counted as retries.
+#
+# A worker's instance can also be tied to a row of WorkerCounters (see share), which then
+# follows every record/error/retry live, for the parent to read while the run is going on.
+#
+# When a LoadProfile is set (TransferStats.profile, before the workers are forked) every
+# transfer and error is also accounted in a TransferStats of its own for the profile step it
+# started in (self.stages), and nothing from a step left out of the headline (warm-up) makes
+# it into the instance's own figures: those are the headline.
+# ------------------------------------------------------------------------------------------
+
+class TransferStats(object):
+
+    percentiles = (50, 90, 99, 99.9)
+    maxReasons  = 20                # distinct error reasons kept (the others are 'other')
+    profile     = None              # the LoadProfile of the run, if any (see stageOf)
+
+    def __init__(self):
+
+        self.hist    = LatencyHistogram()
+        self.files   = 0
+        self.bytes   = 0
+        self.errors  = 0
+        self.retries = 0
+        self.reasons = {}
+        self.phases  = {}
+        self.handshakes = {}            # channel -> LatencyHistogram of its TLS handshakes
+        self.resumed = {}               # channel -> handshakes that resumed a session
+        self.lag     = LatencyHistogram()
+        self.ops     = {}
+        self.stages  = {}               # profile step name -> TransferStats of that step
+        self.counters = None            # WorkerCounters (and row) shared with the parent, if any
+        self.slot    = None
+        self.lock    = threading.Lock()
+
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+        del state['lock']
+        state['counters'] = None        # shared memory: stays with the process that has it
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    # the TransferStats of operation 'op' (call with the lock held)
+    def opStats(self, op):
+
+        stats = self.ops.get(op)
+        if stats is None:
+            stats = self.ops[op] = TransferStats()
+            stats.profile = None
+        return stats
+
+    # the TransferStats of profile step 'name' (call with the lock held)
+    def stageStats(self, name):
+
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = TransferStats()
+            stats.profile = None
+        return stats
+
+    # with a profile: the TransferStats of the step monotonicNs() time 'ns' falls in, and
+    # whether that step is in the headline (call with the lock held). None, True without one.
+    def stageOf(self, ns):
+
+        if self.profile is None:
+            return None, True
+        name, headline = self.profile.stepAt(ns)
+        return self.stageStats(name), headline
+
+    # in a worker: claims a row of 'counters' and keeps it up to date from now on
+    def share(self, counters):
+
+        with self.lock:
+            self.counters = counters
+            self.slot     = counters.claim()
+
+    # one completed transfer (of operation 'op', if given) of nbytes that took ns nanoseconds
+    def record(self, ns, nbytes, op=None):
+
+        with self.lock:
+            if self.counters is not None:
+                self.counters.add(self.slot, files=1, nbytes=nbytes)
+            stage, headline = self.stageOf(monotonicNs() - ns)
+            if stage is not None:
+                stage.record(ns, nbytes)
+            if not headline:
+                return
+            self.hist.record(ns)
+            self.files = self.files + 1
+            self.bytes = self.bytes + nbytes
+            if op is not None:
+                self.opStats(op).record(ns, nbytes)
+
+    # ns nanoseconds spent in protocol phase 'phase'
+    def recordPhase(self, phase, ns):
+
+        with self.lock:
+            if not self.stageOf(monotonicNs())[1]:
+                return
+            hist = self.phases.get(phase)
+            if hist is None:
+                hist = self.phases[phase] = LatencyHistogram()
+            hist.record(ns)
+
+    # a TLS handshake on 'channel' that took ns nanoseconds (and resumed a session, or not)
+    def recordHandshake(self, channel, ns, resumed=False):
+
+        with self.lock:
+            if not self.stageOf(monotonicNs())[1]:
+                return
+            hist = self.handshakes.get(channel)
+            if hist is None:
+                hist = self.handshakes[channel] = LatencyHistogram()
+            hist.record(ns)
+            if resumed:
+                self.resumed[channel] = self.resumed.get(channel, 0) + 1
+
+    # a transfer (scheduled open-loop) started ns nanoseconds after it was due
+    def recordLag(self, ns):
+
+        with self.lock:
+            if not self.stageOf(monotonicNs() - ns)[1]:
+                return
+            self.lag.record(ns)
+
+    # one failed transfer (of operation 'op', if given), failed because of 'reason' (if given)
+    def error(self, op=None, reason=None):
+
+        with self.lock:
+            if self.counters is not None:
+                self.counters.add(self.slot, errors=1)
+            stage, headline = self.stageOf(monotonicNs())
+            if stage is not None:
+                stage.error()
+            if not headline:
+                return
+            self.errors = self.errors + 1
+            if reason is not None:
+                self.addReason(reason, 1)
+            if op is not None:
+                self.opStats(op).error()
+
+    # a transfer is starting (only counted in the shared counters, for the files in flight)
+    def begin(self):
+
+        if self.counters is not None:
+            with self.lock:
+                self.counters.add(self.slot, started=1)
+
+    # one more attempt at a transfer (of operation 'op', if given), over a new session
+    def retry(self, op=None):
+
+        with self.lock:
+            if self.counters is not None:
+                self.counters.add(self.slot, retries=1)
+            if not self.stageOf(monotonicNs())[1]:
+                return
+            self.retries = self.retries + 1
+            if op is not None:
+                self.opStats(op).retry()
+
+    # (call with the lock held)
+    def addReason(self, reason, count):
+
+        if (reason not in self.reasons) and (len(self.reasons) >= self.maxReasons):
+            reason = 'other'
+        self.reasons[reason] = self.reasons.get(reason, 0) + count
+
+    def merge(self, other):
+
+        with self.lock:
+            self.hist.merge(other.hist)
+            self.files   = self.files + other.files
+            self.bytes   = self.bytes + other.bytes
+            self.errors  = self.errors + other.errors
+            self.retries = self.retries + other.retries
+            for reason, count in other.reasons.items():
+                self.addReason(reason, count)
+            self.lag.merge(other.lag)
+            for op, stats in other.ops.items():
+                self.opStats(op).merge(stats)
+            for name, stats in other.stages.items():
+                self.stageStats(name).merge(stats)
+            for phase, hist in other.phases.items():
+                if phase not in self.phases:
+                    self.phases[phase] = LatencyHistogram()
+                self.phases[phase].merge(hist)
+            for channel, hist in other.handshakes.items():
+                if channel not in self.handshakes:
+                    self.handshakes[channel] = LatencyHistogram()
+                self.handshakes[channel].merge(hist)
+            for channel, count in other.resumed.items():
+                self.resumed[channel] = self.resumed.get(channel, 0) + count
+
+    # plain (JSON friendly) form of everything recorded, to ship over the network (see
+    # AgentLink). fromDict turns it back into a TransferStats that merges like any other.
+    def toDict(self):
+
+        with self.lock:
+            return { 'hist'    : self.hist.toDict(),
+                     'files'   : self.files,
+                     'bytes'   : self.bytes,
+                     'errors'  : self.errors,
+                     'retries' : self.retries,
+                     'reasons' : self.reasons.copy(),
+                     'phases'  : dict([(phase, hist.toDict()) for phase, hist in self.phases.items()]),
+                     'handshakes' : dict([(channel, hist.toDict()) for channel, hist in self.handshakes.items()]),
+                     'resumed' : self.resumed.copy(),
+                     'lag'     : self.lag.toDict(),
+                     'ops'     : dict([(op, stats.toDict()) for op, stats in self.ops.items()]),
+                     'stages'  : dict([(name, stats.toDict()) for name, stats in self.stages.items()]) }
+
+    @classmethod
+    def fromDict(cls, state):
+
+        stats = cls()
+        stats.hist    = LatencyHistogram.fromDict(state['hist'])
+        stats.files   = state['files']
+        stats.bytes   = state['bytes']
+        stats.errors  = state['errors']
+        stats.retries = state['retries']
+        stats.reasons = dict(state['reasons'])
+        stats.phases  = dict([(str(phase), LatencyHistogram.fromDict(hist)) for phase, hist in state['phases'].items()])
+        stats.handshakes = dict([(str(channel), LatencyHistogram.fromDict(hist))
+                                 for channel, hist in state['handshakes'].items()])
+        stats.resumed = dict([(str(channel), count) for channel, count in state['resumed'].items()])
+        stats.lag     = LatencyHistogram.fromDict(state['lag'])
+        stats.ops     = dict([(str(op), cls.fromDict(ops)) for op, ops in state['ops'].items()])
+        stats.stages  = dict([(str(name), cls.fromDict(stage)) for name, stage in state['stages'].items()])
+        return stats
+
+    # dictionary of the headline numbers (and the histogram itself) for a run of elapsedNs
+    # (less the warm-up, with a profile)
+    def summary(self, elapsedNs):
+
+        runNs = elapsedNs
+        if self.profile is not None:
+            elapsedNs = elapsedNs - self.profile.excludedNs(elapsedNs)
+        seconds = max(elapsedNs, 1) / 1e9
+        latency = {}
+        for percent in self.percentiles:
+            latency['p' + str(percent)] = self.hist.percentile(percent) / 1e6
+        latency['max'] = self.hist.maxNs / 1e6
+        latency['min'] = (self.hist.minNs or 0) / 1e6
+
+        phases = {}
+        for phase, hist in self.phases.items():
+            phases[phase] = { 'count' : hist.total,
+                              'mean'  : hist.mean() / 1e6,
+                              'p50'   : hist.percentile(50) / 1e6,
+                              'p90'   : hist.percentile(90) / 1e6,
+                              'p99'   : hist.percentile(99) / 1e6,
+                              'max'   : hist.maxNs / 1e6 }
+
+        summ = { 'files'         : self.files,
+                 'errors'        : self.errors,
+                 'retries'       : self.retries,
+                 'bytes'         : self.bytes,
+                 'elapsed_sec'   : seconds,
+                 'files_per_sec' : self.files / seconds,
+                 'mb_per_sec'    : self.bytes / seconds / (1024 * 1024),
+                 'latency_ms'    : latency,
+                 'phases_ms'     : phases,
+                 'histogram_ns'  : [[self.hist.bucketHigh(index), self.hist.counts[index]]
+                                    for index in sorted(self.hist.counts)] }
+
+        if self.lag.total:
+            lag = {}
+            for percent in self.percentiles:
+                lag['p' + str(percent)] = self.lag.percentile(percent) / 1e6
+            lag['max']  = self.lag.maxNs / 1e6
+            lag['mean'] = self.lag.mean() / 1e6
+            summ['dispatch_lag_ms'] = lag
+
+        if self.handshakes:
+            tls = {}
+            for channel, hist in self.handshakes.items():
+                tls[channel] = { 'count'     : hist.total,
+                                 'resumed'   : self.resumed.get(channel, 0),
+                                 'mean'      : hist.mean() / 1e6,
+                                 'p50'       : hist.percentile(50) / 1e6,
+                                 'p99'       : hist.percentile(99) / 1e6,
+                                 'max'       : hist.maxNs / 1e6,
+                                 'total_sec' : hist.sumNs / 1e9 }
+            summ['tls_handshakes_ms'] = tls
+
+        if self.reasons:
+            summ['error_reasons'] = self.reasons.copy()
+
+        if self.ops:
+            operations = {}
+            for op, stats in self.ops.items():
+                operations[op] = stats.summary(elapsedNs)
+                del operations[op]['histogram_ns']
+            summ['operations'] = operations
+
+        if self.stages:
+            stages = {}
+            steps = self.profile.stepList(runNs) if self.profile else []
+            for name, stats in self.stages.items():
+                stepNs = [step[1] for step in steps if step[0] == name]
+                stages[name] = stats.summary(stepNs[0] if stepNs else runNs)
+                del stages[name]['histogram_ns']
+            for name, stepNs, level, headline in steps:
+                if name in stages:
+                    stages[name]['level']    = level
+                    stages[name]['headline'] = headline
+            summ['stages'] = stages
+        return summ
+
+    # human readable report lines for a run of elapsedNs. Phases (if any) are listed in the
+    # order given by phaseOrder, any others after them. 'unit' names what was transferred.
+    def report(self, elapsedNs, phaseOrder=(), unit='files'):
+
+        summ = self.summary(elapsedNs)
+        lat  = summ['latency_ms']
+        lines = []
+        if (self.profile is not None) and self.profile.excludedNs(elapsedNs):
+            lines.append("Headline figures leave out the warm-up (%.3f sec)" % (self.profile.excludedNs(elapsedNs) / 1e9))
+        lines.append("Transfers: %d %s, %d errors, %d bytes in %.3f sec" %
+                     (summ['files'], unit, summ['errors'], summ['bytes'], summ['elapsed_sec']))
+        lines.append("Throughput: %.2f %s/s, %.3f MB/s" % (summ['files_per_sec'], unit, summ['mb_per_sec']))
+        if self.lag.total:
+            label = "Latency (ms, from scheduled arrival): "
+        else:
+            label = "Latency (ms): "
+        lines.append(label + "  ".join(["p%s=%.3f" % (percent, lat['p' + str(percent)])
+                                        for percent in self.percentiles]) +
+                     "  max=%.3f" % lat['max'])
+        if self.lag.total:
+            lag = summ['dispatch_lag_ms']
+            lines.append("Dispatch lag (ms): " + "  ".join(["p%s=%.3f" % (percent, lag['p' + str(percent)])
+                                                            for percent in self.percentiles]) +
+                         "  max=%.3f  mean=%.3f" % (lag['max'], lag['mean']))
+        if self.retries:
+            lines.append("Retries: %d (new session after a lost one)" % self.retries)
+        for reason, count in sorted(self.reasons.items(), key=lambda item: -item[1]):
+            lines.append("Errors: %6d x %s" % (count, reason))
+
+        if self.handshakes:
+            lines.append("TLS handshakes (ms):        count    resumed       mean        p50        p99        max    total(s)")
+            for channel in sorted(self.handshakes):
+                tls = summ['tls_handshakes_ms'][channel]
+                lines.append("  %-20s %10d %10d %10.3f %10.3f %10.3f %10.3f %11.3f" %
+                             (channel, tls['count'], tls['resumed'], tls['mean'], tls['p50'], tls['p99'],
+                              tls['max'], tls['total_sec']))
+            if ('data' in self.handshakes) and self.hist.sumNs:
+                lines.append("  (data channel handshakes: %.1f%% of the total transfer time)" %
+                             (100.0 * self.handshakes['data'].sumNs / self.hist.sumNs))
+
+        if self.ops:
+            lines.append("Operations:      count   errors      ops/s       MB/s   p50(ms)   p90(ms)   p99(ms)   max(ms)")
+            for op in sorted(self.ops):
+                ops = summ['operations'][op]
+                oplat = ops['latency_ms']
+                lines.append("  %-8s %10d %8d %10.2f %10.3f %9.3f %9.3f %9.3f %9.3f" %
+                             (op, ops['files'], ops['errors'], ops['files_per_sec'], ops['mb_per_sec'],
+                              oplat['p50'], oplat['p90'], oplat['p99'], oplat['max']))
+
+        if self.stages:
+            if self.profile:
+                names = [step[0] for step in self.profile.stepList(0) if step[0] in self.stages]
+            else:
+                names = sorted(self.stages)
+            lines.append("Stages:              level    files   errors   files/s       MB/s   p50(ms)   p99(ms)   max(ms)")
+            for name in names:
+                stage = summ['stages'][name]
+                stlat = stage['latency_ms']
+                level = self.profile.levelText(stage['level']) if 'level' in stage else ''
+                lines.append("  %-12s %11s %8d %8d %9.2f %10.3f %9.3f %9.3f %9.3f%s" %
+                             (name, level, stage['files'], stage['errors'], stage['files_per_sec'],
+                              stage['mb_per_sec'], stlat['p50'], stlat['p99'], stlat['max'],
+                              "" if stage.get('headline', True) else "  (not in the headline)"))
+
+        if self.phases:
+            lines.append("Phase breakdown (ms):       count       mean        p50        p90        p99        max")
+            names = [phase for phase in phaseOrder if phase in self.phases] + \
+                    sorted([phase for phase in self.phases if phase not in phaseOrder])
+            for phase in names:
+                ph = summ['phases_ms'][phase]
+                lines.append("  %-20s %10d %10.3f %10.3f %10.3f %10.3f %10.3f" %
+                             (phase, ph['count'], ph['mean'], ph['p50'], ph['p90'], ph['p99'], ph['max']))
+        return lines
+
+# ------------------------------------------------------------------------------------------
+# StatsCollector(queue)
+#
+# Thread run by the parent while its workers are busy: receives the TransferStats each worker
+# puts on 'queue' as it exits and merges them into self.stats. Reading while the workers run
+# (rather than after joining them) matters: a process does not exit until what it put on a
+# queue has been read off the pipe. Call finish() once every worker has been joined.
+# ------------------------------------------------------------------------------------------
+
+class StatsCollector(threading.Thread):
+
+    def __init__(self, queue):
+
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.queue  = queue
+        self.stats  = TransferStats()
+        self.start()
+
+    def run(self):
+
+        while True:
+            workerStats = self.queue.get()
+            if workerStats is None:
+                break
+            self.stats.merge(workerStats)
+
+    # all workers have exited: anything they sent is already ahead of this end marker
+    def finish(self):
+
+        self.queue.put(None)
+        self.join()
+        return self.stats
+
+# ------------------------------------------------------------------------------------------
+# WorkerCounters(workers)
+#
+# Live file, byte, error, retry and started transfer counts of every worker (the files in
+# flight being those started and not yet done), in shared memory. The parent
+# creates it before forking its workers; each worker process then claims a row of its own
+# (TransferStats.share) which only that process ever writes - under its TransferStats lock, so
+# there is no lock between processes - and the parent reads all rows whenever it likes
+# (totals, rows) without the workers having to print or send anything. Rows are claimed in
+# turn; should there be more workers than rows (a pool replacing a worker that died) they
+# wrap round.
+# ------------------------------------------------------------------------------------------
+
+class WorkerCounters(object):
+
+    fields = ('files', 'bytes', 'errors', 'retries', 'started')
+
+    def __init__(self, workers):
+
+        self.workers  = max(workers, 1)
+        self.counts   = RawArray(ctypes.c_longlong, self.workers * len(self.fields))
+        self.nextSlot = Value('l', 0)
+
+    # in a worker: the number of the row to write
+    def claim(self):
+
+        with self.nextSlot.get_lock():
+            slot = self.nextSlot.value
+            self.nextSlot.value = slot + 1
+        return slot % self.workers
+
+    # (only ever called by the worker owning row 'slot')
+    def add(self, slot, files=0, nbytes=0, errors=0, retries=0, started=0):
+
+        base = slot * len(self.fields)
+        counts = self.counts
+        counts[base]     = counts[base] + files
+        counts[base + 1] = counts[base + 1] + nbytes
+        counts[base + 2] = counts[base + 2] + errors
+        counts[base + 3] = counts[base + 3] + retries
+        counts[base + 4] = counts[base + 4] + started
+
+    # overwrites row 'slot' with the counts (a dictionary like those of rows) of a worker
+    # that is not a local process (an agent, see Coordinator)
+    def set(self, slot, counts):
+
+        base = slot * len(self.fields)
+        for index, field in enumerate(self.fields):
+            self.counts[base + index] = counts.get(field, 0)
+
+    # one dictionary of counts per worker (row) claimed so far
+    def rows(self):
+
+        width = len(self.fields)
+        counts = self.counts[:]
+        return [dict(zip(self.fields, counts[slot * width:(slot + 1) * width]))
+                for slot in range(min(self.nextSlot.value, self.workers))]
+
+    def totals(self):
+
+        width = len(self.fields)
+        counts = self.counts[:]
+        return dict([(field, sum(counts[index::width])) for index, field in enumerate(self.fields)])
+
+    # end of run report lines: per worker spread and, if some worker never delivered its
+    # TransferStats (it died), what 'stats' (the merged statistics) are missing
+    def report(self, stats, unit='files'):
+
+        rows  = self.rows()
+        lines = []
+        if rows:
+            files = [row['files'] for row in rows]
+            lines.append("Workers: %d  %s per worker: min=%d  max=%d  mean=%.1f" %
+                         (len(rows), unit, min(files), max(files), sum(files) / float(len(rows))))
+        totals = self.totals()
+        files, errors = stats.files, stats.errors
+        if stats.stages:                # (the headline may leave some out: count every step)
+            files  = sum([stage.files for stage in stats.stages.values()])
+            errors = sum([stage.errors for stage in stats.stages.values()])
+        if (totals['files'] > files) or (totals['errors'] > errors):
+            lines.append("Warning: statistics of %d %s (%d errors) never reached the parent (worker lost)" %
+                         (totals['files'] - files, unit, totals['errors'] - errors))
+        return lines
+
+# ------------------------------------------------------------------------------------------
+# ProgressMonitor(counters, total, fast, interval, live, csvFile)
+#
+# Thread run by the parent while its workers are busy. The workers print nothing; instead
+# this samples their WorkerCounters every 'interval' seconds and prints how far the run has
+# got, out of 'total' files: a progress line, or in fast mode just the number of files done
+# (like the serial loop's markers). Call finish() once every worker has been joined.
+#
+# With 'live' the output is one status line instead, rewritten in place at every sample:
+# files done, the current (last interval) and moving average (last 'window' intervals) files/s
+# and MB/s, the transfers in flight, the error rate over the moving window and the ETA at the
+# average rate. With a csvFile every sample is also written to it as one row of a time series.
+# All of it comes from the shared counters, so it costs the transfers nothing.
+# ------------------------------------------------------------------------------------------
+
+class ProgressMonitor(threading.Thread):
+
+    window     = 10             # samples in the moving averages
+    csvColumns = ('elapsed_sec', 'files', 'bytes', 'errors', 'retries', 'in_flight', 'files_per_sec',
+                  'mb_per_sec', 'avg_files_per_sec', 'avg_mb_per_sec', 'error_rate', 'eta_sec')
+
+    def __init__(self, counters, total, fast=False, interval=1.0, live=False, csvFile=''):
+
+        threading.Thread.__init__(self)
+        self.daemon   = True
+        self.counters = counters
+        self.total    = total
+        self.fast     = fast
+        self.interval = interval
+        self.live     = live
+        self.tty      = sys.stdout.isatty()
+        self.width    = 0               # length of the status line last written
+        self.samples  = deque(maxlen=self.window + 1)
+        self.startNs  = monotonicNs()
+        self.samples.append((self.startNs, counters.totals()))
+        self.csv      = None
+        if (csvFile):
+            self.csv = open(csvFile, 'w')
+            self.csv.write(",".join(self.csvColumns) + "\n")
+        self.done     = threading.Event()
+        self.start()
+
+    def run(self):
+
+        last = None
+        while not self.done.wait(self.interval):
+            if (self.live) or (self.csv):
+                self.sample()
+                continue
+            totals = self.counters.totals()
+            if (totals == last):
+                continue
+            last = totals
+            if (self.fast):
+                print str(totals['files'] + totals['errors']) + "m",
+            else:
+                print "Progress: %d/%d files  %d errors  %d retries  %.3f MB" % \
+                      (totals['files'] + totals['errors'], self.total, totals['errors'], totals['retries'],
+                       totals['bytes'] / (1024.0 * 1024))
+            sys.stdout.flush()
+
+    # takes a sample of the counters, then writes the status line and/or the CSV row
+    def sample(self):
+
+        now, totals = monotonicNs(), self.counters.totals()
+        prevNs, prev   = self.samples[-1]
+        firstNs, first = self.samples[0]
+        self.samples.append((now, totals))
+
+        seconds    = max(now - prevNs, 1) / 1e9
+        avgSeconds = max(now - firstNs, 1) / 1e9
+        done       = totals['files'] + totals['errors']
+        inFlight   = max(totals['started'] - done, 0)
+        rate       = (totals['files'] - prev['files']) / seconds
+        mbRate     = (totals['bytes'] - prev['bytes']) / seconds / (1024 * 1024)
+        avgRate    = (totals['files'] - first['files']) / avgSeconds
+        avgMbRate  = (totals['bytes'] - first['bytes']) / avgSeconds / (1024 * 1024)
+        ended      = done - first['files'] - first['errors']      # (successful or not)
+        errorRate  = (totals['errors'] - first['errors']) / float(ended) if ended else 0.0
+        eta        = (self.total - done) / (ended / avgSeconds) if ended else None
+        elapsed    = (now - self.startNs) / 1e9
+
+        if (self.live):
+            if eta is None:
+                etaText = "--:--:--"
+            else:
+                etaText = "%d:%02d:%02d" % (eta // 3600, eta % 3600 // 60, eta % 60)
+            line = "[%6ds] %d/%d files  %.1f files/s (avg %.1f)  %.3f MB/s (avg %.3f)  in flight %d  " \
+                   "errors %.2f%%  ETA %s" % (elapsed, done, self.total, rate, avgRate, mbRate, avgMbRate,
+                                             inFlight, errorRate * 100, etaText)
+            if (self.tty):
+                sys.stdout.write("\r" + line + " " * max(self.width - len(line), 0))
+                self.width = len(line)
+            else:
+                sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+        if (self.csv):
+            self.csv.write("%.3f,%d,%d,%d,%d,%d,%.3f,%.3f,%.3f,%.3f,%.5f,%s\n" %
+                           (elapsed, totals['files'], totals['bytes'], totals['errors'], totals['retries'],
+                            inFlight, rate, mbRate, avgRate, avgMbRate, errorRate,
+                            "" if eta is None else "%.1f" % eta))
+            self.csv.flush()
+
+    # stops sampling; a live status line or CSV gets a last sample of the finished run
+    def finish(self):
+
+        self.done.set()
+        self.join()
+        if (self.live) or (self.csv):
+            self.sample()
+        if (self.live) and (self.tty):
+            print
+        if (self.csv):
+            self.csv.close()
+
+# ------------------------------------------------------------------------------------------
+# Distributed runs
+#
+# A coordinator (see Coordinator) splits one run between several agents, each an ordinary
+# generator run on its own host. They talk over a plain TCP connection, one JSON object per
+# line (sendMessage / MessageReader):
+#
+#   agent       -> coordinator  {"type": "hello", "host", "tool", "version"}
+#   coordinator -> agent        {"type": "slice", "first", "count", "total", "rate", "bytes",
+#                                "poisson", "start"}
+#   agent       -> coordinator  {"type": "snapshot", "counts"}   every second while it runs
+#                               {"type": "final", "elapsed_ns", "stats"}   once, at the end
+#
+# The slice is the range of file numbers (first, count, out of total) the agent is to send,
+# its share of the arrival rate (0 = closed loop) and the wall clock time (time.time()) at
+# which every agent starts, so the hosts' clocks should be synchronized (NTP). The snapshots
+# carry the agent's WorkerCounters totals; the full statistics, histograms included, come
+# with the final message.
+# ------------------------------------------------------------------------------------------
+
+def sendMessage(sock, message):
+
+    sock.sendall(json.dumps(message) + "\n")
+
+class MessageReader(object):
+
+    def __init__(self, sock):
+
+        self.fh = sock.makefile('rb')
+
+    # the next message, None once the other end has gone
+    def read(self):
+
+        try:
+            line = self.fh.readline()
+        except socket.error:
+            return None
+        if not line:
+            return None
+        return json.loads(line)
+
+# ------------------------------------------------------------------------------------------
+# AgentLink(host, port, tool, version, retryFor)
+#
+# Agent side: connects to the coordinator (trying again every second for up to retryFor
+# seconds, so agents can be started first), says hello and waits for its slice (self.slice),
+# which only comes once every agent has joined. Then, once the run has started (see
+# startSnapshots), reports its counters every 'interval' seconds and, at the end (finish),
+# its statistics.
+# ------------------------------------------------------------------------------------------
+
+class AgentLink(object):
+
+    def __init__(self, host, port, tool, version, retryFor=60):
+
+        deadline = time.time() + retryFor
+        while True:
+            try:
+                self.sock = socket.create_connection((host, port))
+                break
+            except socket.error:
+                if (time.time() > deadline):
+                    raise
+                time.sleep(1)
+        self.lock   = threading.Lock()
+        self.done   = threading.Event()
+        self.thread = None
+        self.reader = MessageReader(self.sock)
+        sendMessage(self.sock, { 'type'    : 'hello',
+                                 'host'    : socket.gethostname(),
+                                 'tool'    : tool,
+                                 'version' : version })
+        self.slice = self.reader.read()
+        if (self.slice is None) or (self.slice.get('type') != 'slice'):
+            raise EOFError("coordinator closed the connection before sending a slice")
+
+    # sleeps until the run's start time
+    def waitStart(self):
+
+        delay = self.slice['start'] - time.time()
+        if (delay > 0):
+            time.sleep(delay)
+
+    # countersOf() returns the WorkerCounters the run counts into (None until there are any)
+    def startSnapshots(self, countersOf, interval=1.0):
+
+        self.thread = threading.Thread(target=self.snapshots, args=(countersOf, interval))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def snapshots(self, countersOf, interval):
+
+        while not self.done.wait(interval):
+            counters = countersOf()
+            if counters is not None:
+                self.send({ 'type' : 'snapshot', 'counts' : counters.totals() })
+
+    def send(self, message):
+
+        with self.lock:
+            sendMessage(self.sock, message)
+
+    def finish(self, stats, elapsedNs):
+
+        self.done.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.send({ 'type' : 'final', 'elapsed_ns' : elapsedNs, 'stats' : stats.toDict() })
+        self.sock.close()
+
+# ------------------------------------------------------------------------------------------
+# Coordinator(bindaddr, port, agents, announce, joinTimeout, helloTimeout)
+#
+# Coordinator side: waits for 'agents' agents to connect and say hello (self.agents, one
+# dictionary each), for up to joinTimeout seconds in all (None: for ever), after which it
+# lets go of the agents that did join and raises socket.timeout. A connection that says
+# nothing (or no hello) within helloTimeout seconds is dropped. It then hands out the slices (dispatch) and gathers what the agents send
+# back (collect): their snapshots go to a row each of self.counters, so that a ProgressMonitor
+# can show the cluster-wide progress, and their final statistics are merged.
+# ------------------------------------------------------------------------------------------
+
+class Coordinator(object):
+
+    def __init__(self, bindaddr, port, agents, announce=None, joinTimeout=None, helloTimeout=10):
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((bindaddr, port))
+        listener.listen(agents)
+        deadline = None if joinTimeout is None else time.time() + joinTimeout
+        self.agents = []
+        while len(self.agents) < agents:
+            try:
+                if deadline is not None:
+                    listener.settimeout(max(deadline - time.time(), 0.001))
+                sock, addr = listener.accept()
+            except socket.timeout:
+                listener.close()
+                for agent in self.agents:
+                    agent['sock'].close()
+                raise socket.timeout("only %d of %d agents joined within %s seconds" %
+                                     (len(self.agents), agents, joinTimeout))
+            sock.settimeout(helloTimeout)
+            reader = MessageReader(sock)
+            try:
+                hello = reader.read()
+            except ValueError:
+                hello = None                        # (not one of ours)
+            if (not isinstance(hello, dict)) or (hello.get('type') != 'hello'):
+                sock.close()
+                continue
+            sock.settimeout(None)
+            agent = { 'sock' : sock, 'reader' : reader, 'host' : hello.get('host'), 'addr' : addr[0],
+                      'stats' : None, 'elapsed_ns' : 0 }
+            self.agents.append(agent)
+            if announce is not None:
+                announce(agent)
+        listener.close()
+        self.counters = WorkerCounters(agents)
+        self.counters.nextSlot.value = agents      # every row is in use
+
+    # splits 'total' files (and the arrival rate, if any) evenly between the agents, all to
+    # start 'lead' seconds from now. Returns the start time (time.time()).
+    def dispatch(self, total, rate=0, isBytes=False, poisson=False, lead=2.0):
+
+        start = time.time() + lead
+        count = len(self.agents)
+        for index, agent in enumerate(self.agents):
+            first = total * index / count
+            agent['first'] = first
+            agent['count'] = total * (index + 1) / count - first
+            sendMessage(agent['sock'], { 'type'    : 'slice',
+                                         'first'   : agent['first'],
+                                         'count'   : agent['count'],
+                                         'total'   : total,
+                                         'rate'    : float(rate) / count,
+                                         'bytes'   : isBytes,
+                                         'poisson' : poisson,
+                                         'start'   : start })
+        return start
+
+    # waits for every agent to finish (or go away) and returns their merged TransferStats
+    def collect(self):
+
+        threads = []
+        for index, agent in enumerate(self.agents):
+            thread = threading.Thread(target=self.follow, args=(index, agent))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        stats = TransferStats()
+        for agent in self.agents:
+            if agent['stats'] is not None:
+                stats.merge(agent['stats'])
+        return stats
+
+    def follow(self, index, agent):
+
+        while True:
+            message = agent['reader'].read()
+            if message is None:
+                break
+            if (message['type'] == 'snapshot'):
+                self.counters.set(index, message['counts'])
+            elif (message['type'] == 'final'):
+                agent['stats'] = TransferStats.fromDict(message['stats'])
+                agent['elapsed_ns'] = message['elapsed_ns']
+                self.counters.set(index, { 'files'   : agent['stats'].files,
+                                           'bytes'   : agent['stats'].bytes,
+                                           'errors'  : agent['stats'].errors,
+                                           'retries' : agent['stats'].retries,
+                                           'started' : agent['stats'].files + agent['stats'].errors })
+                break
+        agent['sock'].close()
+
+# ------------------------------------------------------------------------------------------
+# writeJSON(fname, summary)
+#
+# Writes a run summary (see TransferStats.summary) to fname for machine comparison of runs.
+# ------------------------------------------------------------------------------------------
+
+def writeJSON(fname, summary):
+
+    fh = open(fname, 'w')
+    json.dump(summary, fh, indent=2, sort_keys=True)
+    fh.write('\n')
+    fh.close()
@@ -12,23 +12,92 @@
 #  - Will crash if a file being sftp'ed is deleted prior to end of transfer being completed
 #  - currently does not validate remote directory (if one is supplied)
 #
+# History
+#
+# V1.05 : Hybrid mode (-c). -l worker processes each run -c threads, each thread with its own
+#         (persistent) sftp connection.
+# V1.06 : In-memory payload (-i load|mmap, -z size). The source file is loaded (or mmap'ed) once
+#         and every put streams views of that shared buffer (putfo) instead of re-reading the
+#         file. -z sends generated data, no source file needed.
+# V1.07 : Every transfer's duration is recorded on a monotonic nanosecond clock into a log-
+#         bucketed histogram kept by each worker. The workers' histograms are merged at the end
+#         and reported as p50/p90/p99/p99.9/max latency plus files/s and MB/s (-o: as JSON too).
+# V1.08 : Open-loop arrivals (-r, -y). Transfers are due at a fixed (or Poisson distributed)
+#         rate in files/s or bytes/s, however fast the server answers. Latency is measured from
+#         the time a transfer was due and the dispatch lag is reported (no coordinated omission).
+# V1.09 : -t accepts host:port and --insecure-hostkey accepts any host key, eg. to run against
+#         the local sink server (sftp-sink.py, 127.0.0.1:2222) for self-contained benchmarks of
+#         the client side.
+# V1.10 : Worker processes no longer print (per file lines only with -v): they keep live counts
+#         in shared memory, read by the parent to print progress and the spread across workers.
+#         Failed transfers are reported by reason in the final statistics.
+# V1.11 : Live dashboard (-L): one status line, rewritten every second, of the current and moving
+#         average files/s and MB/s, transfers in flight, error rate and ETA; -T logs the samples
+#         to a CSV time series. Both read the shared counters, at no cost to the transfers.
+# V1.12 : Load profiles (-R): stages of concurrent sessions (stepped for a from-to ramp) or of
+#         arrival rates, eg. warmup=30s:2,ramp=2m:2-10,steady=10m:10, instead of all -l
+#         connections at once (no more login storm). Every step is reported on its own and
+#         the warm-up is left out of the headline figures.
+# V1.13 : Saturation search (-K): short trials at more and more connections (or a higher
+#         rate), doubling then bisecting (or golden-section) until p99 latency or the error
+#         rate breaks the given SLO. Prints every trial, the measured curve and the knee.
+# V1.14 : Generated files (-G): unique files named and sized as RandomFileMaker.py makes them,
+#         generated while they are written (putfo straight from the Lorem Ipsum generator),
+#         with no staging directory and no local disk involved. -f sets the name prefix.
+# V1.15 : Integrity-tagged uploads (-H): every upload is hashed (MD5 or any hashlib digest)
+#         block by block as it is written, then renamed to <digest>-<name> as MD5checker.py
+#         expects. An in-memory payload (-i, -z) is hashed once and written under that name.
+# V1.16 : Multi-processing mode hands its files to the pool as they are made, in chunks (up to
+#         taskChunk files per task) with at most taskWindow chunks per worker outstanding, so the
+#         parent's memory no longer grows with -n.
+# V1.17 : Multiplexed channels (-M, hybrid mode): the threads of a worker process share SSH
+#         connections, -M sftp channels over each, instead of a connection (TCP, key exchange
+#         and login) per thread, so hundreds of channels need only a handful of connections.
+# V1.18 : Pipelined writes (-w): uploads keep a sliding window of WRITE requests outstanding
+#         (paramiko's own put waits for all of them every 100) and read the local data in larger
+#         blocks (-w depth,request,block). -W sets the channel window and max packet size. The settings are printed
+#         with the results (and written to the JSON summary) so that runs can be compared.
+# V1.19 : Deferred verification (-V): uploads are no longer stat'ed one by one; the sizes of the
+#         files sent are checked in bulk, one listing per remote directory, at the end of the
+#         run (or every N files). Missing files and size mismatches are reported as errors.
+# V1.20 : SSH algorithms (-E ciphers, -I MACs, -Z compression, in order of preference) and a
+#         benchmark matrix (-X): the same uploads once for every cipher x MAC x compression
+#         combination the server allows, reporting MB/s and the client's CPU seconds per GB.
+# V1.21 : Source directory (-m), optionally a whole tree (-D), sent over the pool (or threads)
+#         of sessions. Remote directories are made as the first file of each is handed out,
+#         parents first, and remembered: one mkdir per directory (a stat only if it fails).
+#
 # ---------------------------------------------------------------------------------------------------
 
 import pysftp    # Note: This is basically a wrapper to Paramiko SSH (not thread safe over a connection)
+import paramiko
+from paramiko.sftp import CMD_WRITE, CMD_STATUS, SFTPError
 import datetime
 import os, sys
+import stat
 import time
 import resource
-from multiprocessing import Process, Pool
+from multiprocessing import Process, Pool, Value, Queue
+from multiprocessing.util import Finalize
+import threading
 import argparse
 import math
+import hashlib
+import posixpath
+import itertools
+import logging
+from genlib import PayloadBuffer, TransferStats, StatsCollector, ArrivalSchedule, WorkerCounters, ProgressMonitor, \
+                   LoadProfile, SaturationSearch, LoremFiles, HashingReader, TaskWindow, chunked, \
+                   digestOf, hashedName, parseRate, parseSize, scanTree, splitHostPort, monotonicNs, writeJSON
 
-ver = "V1.04"
+ver = "V1.21"
 
 # defaults/controls  (Most/all of these can be changed via command line arguments to the program)
 # ---------------------------------------------------------------------------------------------------
 
 targethost    = '192.168.60.44' # sftp server host name or IP (this one is F5 Server VM)
+targetport    = 22              # sftp (ssh) server port
+anyHostKey    = False           # accept any host key (skip the known_hosts check)
 sftpuser      = 'sftpuser'      # sftp destination userid
 sftpuserpw    = 'fractal'       # sftp destination password for userid
 remoteDir     = ''              # sftp session will 'cd' into this directory.
@@ -40,6 +109,46 @@ maxConcurrent = 10              # max number of concurrent (multiprocessing) sft
                                 # Get "SSH protocol banner" errors when over 10, despite higher value
                                 # SSH server "MaxSessions" in sshd_config.
 multiprocess  = True            # Multiprocess flag default
+threadsPerProc = 1              # hybrid mode: threads (each with its own connection) per worker process
+channelsPerConn = 0             # hybrid mode: threads (sftp channels) sharing one ssh connection, 0 = one each
+                                # (keep to the server's MaxSessions, 10 for OpenSSH by default)
+writeDepth    = 0               # -w: WRITE requests kept outstanding per upload, 0 = paramiko's own put
+writeRequest  = 32768           # -w: bytes per WRITE request
+readBlock     = 262144          # -w: bytes read from the local data at a time (pipelined writes)
+windowSize    = 0               # -W: sftp channel window size, 0 = paramiko's default (2MB)
+packetSize    = 0               # -W: sftp channel max packet size, 0 = paramiko's default (32KB)
+verifier      = None            # -V: the BatchVerifier checking uploads in bulk, None = stat each upload
+sshCiphers    = []              # -E: ssh ciphers, in order of preference ([] = paramiko's)
+sshMacs       = []              # -I: ssh MACs, in order of preference ([] = paramiko's)
+sshCompression = []             # -Z: ssh compression (none, zlib, zlib@openssh.com) in order of preference ([] = none)
+matrix        = False           # -X: run the uploads once per cipher x MAC x compression of -E, -I and -Z
+sourcedir     = ''              # -m: directory whose files are sent (instead of 'testfile' over and over)
+recursive     = False           # -D: with sourcedir, the files of all its subdirectories too
+sourceFiles   = []              # with sourcedir: (relative path, size) of the files to send, largest first
+sourceDirs    = []              # with recursive: its subdirectories (relative paths), parents first
+remoteDirs    = None            # with recursive: the RemoteDirs made (or found) so far
+taskChunk     = 32              # multi-processing: most files handed to a pool worker in one task
+taskWindow    = 4               # multi-processing: tasks handed out and not finished, per worker
+payloadMode   = ''              # '' (read source file per transfer), 'load', 'mmap' or 'synthetic'
+payloadSize   = 0               # synthetic payload: bytes per file
+payload       = None            # the shared PayloadBuffer when payloadMode is set
+statsFile     = ''              # write the run summary (JSON) to this file
+arrivalRate   = 0               # open-loop mode: transfers due per second (or bytes per second), 0 = off
+arrivalBytes  = False           # arrivalRate is in bytes per second rather than files per second
+arrivalPoisson = False          # Poisson (exponential gaps) rather than evenly spaced arrivals
+arrivals      = None            # the ArrivalSchedule when arrivalRate is set
+loadProfile   = None            # -R: the LoadProfile (stages of sessions or of rates), None = off
+search        = None            # -K: the SaturationSearch (trials, each run under its own LoadProfile), None = off
+lorem         = None            # -G: the LoremFiles generated while they are sent (RandomFileMaker style), None = off
+hashAlgorithm = ''              # -H: name every upload <digest>-<name> (a hashlib algorithm), '' = off
+payloadDigest = None            # -H with an in-memory payload: its digest, worked out once up front
+
+workerStats   = TransferStats() # transfers made by this process (merged into the parent's at the end)
+workerCounters = None           # multi-processing modes: the workers' live counts (WorkerCounters)
+fileLog       = True            # print a line per transfer (not from worker processes, unless -v)
+liveStatus    = False           # -L: one status line, rewritten every second, instead of progress lines
+seriesFile    = ''              # -T: write the progress samples to this CSV file
+sampleInterval = 1.0            # seconds between progress samples
 
 frontPadLen = int(math.log(filecnt+1,10))+3   # we add three (not 2) to allow for the fractional log return
 #frontPadLen   =       # the length of the entire string to be created (eg "______100_" )
@@ -55,63 +164,631 @@ frontPadLen = int(math.log(filecnt+1,10))+3   # we add three (not 2) to allow fo
 longdescription = "This is a simple prototype program to test sftp servers. It performs a simple " + \
                   "looping sequence of 'puts' of a sample file, appending an incremental numeric new " + \
                   "filename extension to the destination file each time. The program can be used in " + \
-                  "either serial mode or multi-processing mode."
+                  "either serial mode or multi-processing mode. With -c, multi-processing mode becomes " + \
+                  "hybrid: -l processes each running -c threads, each thread with its own connection. " + \
+                  "-i keeps the source file in memory (load or mmap) for all transfers and -z sends " + \
+                  "generated data of the given size instead of a source file (-f then only names the files). " + \
+                  "At the end of a run the latency percentiles and throughput of all transfers are reported; " + \
+                  "-o also writes them to a JSON file. -r switches to open-loop mode: transfers are started " + \
+                  "at the given rate (files/s, or bytes/s with a B/KB/MB/GB suffix; -y for Poisson arrivals) " + \
+                  "no matter how long earlier ones take, latency is measured from when each transfer was due " + \
+                  "and the dispatch lag is reported. Worker processes print nothing (per file lines need " + \
+                  "-v): the parent prints their progress once a second and, at the end, the errors by " + \
+                  "reason and the work done per worker. -L turns the progress into one live status line " + \
+                  "(current and average files/s and MB/s, transfers in flight, error rate, ETA) and -T " + \
+                  "logs it to a CSV file. -R runs a load profile: stages of concurrent connections (they " + \
+                  "set the number of workers, so no -l) or of arrival rates, eg. warmup=30s:2,ramp=2m:2-10,steady=10m:10," + \
+                  "cooldown=30s:2 (or 5/s, 5-50/s@10, 40MB/s), until the last stage ends or -n files are " + \
+                  "sent, so give -n room. Each step is reported on its own; a stage named warmup is left " + \
+                  "out of the headline figures. -K searches for the knee of the server: short trials at " + \
+                  "more and more connections (or a higher rate) until an SLO breaks, eg. p99=250ms," + \
+                  "errors=1,sessions=1-64 (or rate=10-500/s), with trial=, warmup= and method=binary|golden; " + \
+                  "each trial runs until its time is up or -n files are sent (100000 by default with -K). " + \
+                  "Every trial is printed, then the curve and the knee. -G sends unique files generated " + \
+                  "on the fly instead of a source file, as RandomFileMaker.py would write them (-G size, or " + \
+                  "size,step for random multiples of step below size; -f sets the name prefix, LoremFile " + \
+                  "by default): no disk is involved. -H hashes every upload while it is written (md5 by " + \
+                  "default, or sha1, sha256, ...) and renames it to <digest>-<name>, the form MD5checker.py " + \
+                  "checks; an in-memory payload (-i, -z) is hashed once and written under that name directly. " + \
+                  "-M multiplexes hybrid mode: the -c threads of a process open their sftp channels over " + \
+                  "shared ssh connections, -M channels to each, so eg. -l 4 -c 100 -M 10 runs 400 channels " + \
+                  "over 40 connections, with no key exchange or login per channel (keep -M within the " + \
+                  "server's MaxSessions, 10 for OpenSSH by default). -w pipelines the uploads: up to " + \
+                  "depth WRITE requests (of 32KB, or -w depth,size) are kept outstanding, the oldest " + \
+                  "settled as each new one goes out, instead of paramiko's put, which waits for all of " + \
+                  "them every 100; a third field sets how much local data is read at a time (-w " + \
+                  "depth,size,block) and -W the channel window and max packet size (-W window[,packet]), " + \
+                  "eg. -w 64,32KB,1MB -W 8MB on a high " + \
+                  "latency link. The settings are printed with the results, to compare runs. -V drops " + \
+                  "the stat that follows every upload (a round trip per file) and checks the sizes of " + \
+                  "the files sent in bulk instead, one listing per remote directory, at the end (or with " + \
+                  "-V N, every N files a worker sends): missing files and size mismatches count as errors. " + \
+                  "Every listing covers the whole directory, so with many files in one directory keep N " + \
+                  "large (or use -V alone). " + \
+                  "-E, -I and -Z set the ssh ciphers, MACs and compression the client offers, in order of " + \
+                  "preference (eg. -E aes128-ctr,aes256-ctr). -X runs a matrix instead: the same " + \
+                  "uploads once for each combination of one cipher of -E, one MAC of -I and one compression " + \
+                  "of -Z (paramiko's choice for a list not given), skipping those the server refuses, and " + \
+                  "reports MB/s and the client CPU seconds (all processes) per GB of each, cheapest first. " + \
+                  "-m sends the files of a directory instead (-D: of the whole tree below it), largest first " + \
+                  "and under their own relative names; the remote directories are made as they are first " + \
+                  "needed, each once and parents first, before any file in them is handed out. Note that " + \
+                  "ftp-gen.py takes -w for the whole tree (here -w pipelines writes); --recursive works in both."
 
 # NOTE: pysftp.Connection can have argument private_key='/path/to/keyfile'
 
+# failed connections are reported (and counted) here: no "No handlers could be found" from paramiko
+logging.getLogger("paramiko").addHandler(logging.NullHandler())
+
 # ------------------------------------------------------------------------------------------
-# sendFileProc(sourceFile, destFile) 
+# sendFileProc(sourceFile, destFile, dueNs) 
 #
 # Initiates an pysftp connection and calls the generic mysftp sendFile function. 
+# dueNs is the time the transfer was due in open-loop mode (None otherwise).
 #
 # Note that this version is intended to be called as a Child process.
 #
 # ------------------------------------------------------------------------------------------
 
-def sendFileProc(sourceFile, destFile):
+def sendFileProc(sourceFile, destFile, dueNs=None):
 
     if (not fast):
-        print "In sub-process. Source:", sourceFile, " Dest:", destFile
+        vprint("In sub-process. Source:", sourceFile, " Dest:", destFile)
 
+    dispatchLag(dueNs)
     try:
-        sftp = pysftp.Connection( targethost, username=sftpuser, password=sftpuserpw, log="")
-        if remoteDir:
-           sftp.chdir(remoteDir) # change remote directory
-        rc = sendFile(sftp, sourceFile, destFile)
+        sftp = SFTPconnect()
+        rc = sendFile(sftp, sourceFile, destFile, dueNs)
         sftp.close()
 
     except Exception, e:
-        print "Exception encountered while processing file:", destFile, " Exception=", str(e)
+        workerStats.error(None, str(e))
+        vprint("Exception encountered while processing file:", destFile, " Exception=", str(e))
 
 # ------------------------------------------------------------------------------------------
-# sendFile(Connection, sourceFile, destFile) 
+# poolWorkerInit(statsQueue, counters)
 #
-# Initiates an sftp transfer given a pre-existing pysftp Connection.
+# Pool initializer, runs once in each worker process: claims the worker's row of the shared
+# counters and arranges for the worker's statistics to be sent to the parent (statsQueue)
+# when it exits.
 # ------------------------------------------------------------------------------------------
 
-def sendFile(sftp, sourceFile, destFile):
+def poolWorkerInit(statsQueue, counters):
 
-    confirmed = True
+    workerStats.share(counters)
+    Finalize(None, statsQueue.put, args=(workerStats,), exitpriority=5)
+    if (verifier):
+        Finalize(None, finalCheck, exitpriority=10)     # before the statistics go
 
-    if (not fast):
+# ------------------------------------------------------------------------------------------
+# BatchVerifier(every)
+#
+# Deferred verification (-V): remembers the name and size of every file uploaded by this
+# process and checks them in bulk, one listdir_attr per remote directory, when 'every' files
+# are waiting (0: only when told, see finalCheck). Missing files and size mismatches are
+# counted as errors (the names are printed with -v); the listings are timed as the 'verify'
+# phase. A listing that fails counts as one 'verify' error and puts its files back, to be
+# checked the next time. Each listing covers the whole remote directory, files sent by
+# every worker included, so with many files in one directory -V N costs more the further
+# the run gets: keep N large. Shared by the threads of a process.
+# ------------------------------------------------------------------------------------------
+
+class BatchVerifier(object):
+
+    def __init__(self, every=0):
+
+        self.every = every
+        self.expected = {}          # remote name -> size
+        self.lock = threading.Lock()
+
+    def add(self, name, nbytes):
+        # True when it is time to check
+
+        with self.lock:
+            self.expected[name] = nbytes
+            return (self.every > 0) and (len(self.expected) >= self.every)
+
+    def check(self, sftp):
+
+        with self.lock:
+            expected = self.expected
+            self.expected = {}
+        folders = {}
+        for name in expected:
+            folders.setdefault(posixpath.dirname(name), []).append(name)
+
+        listings = {}
+        try:
+            for folder in folders:
+                start = monotonicNs()
+                listings[folder] = dict((attr.filename, attr.st_size) for attr in sftp.listdir_attr(folder or '.'))
+                workerStats.recordPhase('verify', monotonicNs() - start)
+        except Exception, e:
+            with self.lock:
+                for name, nbytes in expected.items():
+                    self.expected.setdefault(name, nbytes)
+            workerStats.error(None, "verify: " + str(e))
+            vprint("Exception encountered while verifying uploads, Exception=", str(e))
+            return False
+
+        for folder, names in folders.items():
+            sizes = listings[folder]
+            for name in names:
+                size = sizes.get(posixpath.basename(name))
+                if (size is None):
+                    workerStats.error(None, "verify: missing")
+                    vprint("Verify: missing file", name)
+                elif (size != expected[name]):
+                    workerStats.error(None, "verify: size mismatch")
+                    vprint("Verify: size mismatch", name, size, "bytes, expected", expected[name])
+        return True
+
+# ------------------------------------------------------------------------------------------
+# finalCheck()
+#
+# Deferred verification: checks whatever uploads of this process are still waiting, over a
+# connection of its own. Called once a process (or serial run) has sent its last file.
+# ------------------------------------------------------------------------------------------
+
+def finalCheck():
+
+    if (not verifier.expected):
+        return
+    try:
+        sftp = SFTPconnect()
+        checked = verifier.check(sftp)
+        sftp.close()
+    except Exception, e:
+        workerStats.error(None, "verify: " + str(e))
+        vprint("Exception encountered while verifying uploads, Exception=", str(e))
+        checked = False
+    if (not checked):
+        print "Verify:", len(verifier.expected), "uploads could not be checked"
+
+# ------------------------------------------------------------------------------------------
+# SFTPconnect()
+#
+# Returns a connected pysftp Connection, already in remoteDir if one was given.
+# ------------------------------------------------------------------------------------------
+
+def SFTPconnect():
+
+    # a channel of its own size or chosen algorithms need the connection made here (pysftp
+    # takes the defaults)
+    if (windowSize) or (packetSize) or (sshCiphers) or (sshMacs) or (sshCompression):
+        return SFTPchannel(SSHconnect(), OwnSFTPClient)
+
+    cnopts = pysftp.CnOpts()
+    if (anyHostKey):
+        cnopts.hostkeys = None
+    sftp = pysftp.Connection( targethost, port=targetport, username=sftpuser, password=sftpuserpw, log="", cnopts=cnopts)
+    if remoteDir:
+       sftp.chdir(remoteDir) # change remote directory
+    return sftp
+
+# ------------------------------------------------------------------------------------------
+# SSHconnect()
+#
+# Returns a connected (logged in) paramiko Transport, with no channel open yet. The host key
+# is checked against known_hosts as pysftp does, unless --insecure-hostkey. Only the ciphers, MACs and
+# compression of -E, -I and -Z are offered, if given.
+# ------------------------------------------------------------------------------------------
+
+def SSHconnect():
+
+    hostkey = None
+    if (not anyHostKey):
+        hostkey = pysftp.CnOpts().get_hostkey(targethost)
+    transport = paramiko.Transport((targethost, targetport))
+    options = transport.get_security_options()
+    try:
+        if (sshCiphers):
+            options.ciphers = sshCiphers
+        if (sshMacs):
+            options.digests = sshMacs
+        if (sshCompression):
+            options.compression = sshCompression
+        transport.connect(hostkey=hostkey, username=sftpuser, password=sftpuserpw)
+    except Exception:
+        transport.packetizer.complete_handshake()   # a refused key exchange leaves its timer running
+        transport.close()
+        raise
+    return transport
+
+# ------------------------------------------------------------------------------------------
+# SFTPchannel(transport, client)
+#
+# Opens an sftp channel over a connected Transport, of -W's window and packet sizes if given,
+# and returns its client (an SFTPClient, or the 'client' class given), already in remoteDir.
+# The calls sendFile makes are the same as a pysftp Connection's.
+# ------------------------------------------------------------------------------------------
+
+def SFTPchannel(transport, client=paramiko.SFTPClient):
+
+    sftp = client.from_transport(transport, window_size=windowSize or None, max_packet_size=packetSize or None)
+    if remoteDir:
+        sftp.chdir(remoteDir)
+    return sftp
+
+# ------------------------------------------------------------------------------------------
+# OwnSFTPClient
+#
+# An SFTPClient that is the only channel over its connection: closing it closes that too.
+# ------------------------------------------------------------------------------------------
+
+class OwnSFTPClient(paramiko.SFTPClient):
+
+    def close(self):
+
+        transport = self.get_channel().get_transport()
+        paramiko.SFTPClient.close(self)
+        transport.close()
+
+# ------------------------------------------------------------------------------------------
+# SharedTransport
+#
+# Multiplexed mode (-M): one ssh connection shared by the threads of a worker process, each
+# with an sftp channel of its own over it (a paramiko Transport is thread safe, an
+# SFTPClient is not). Connects when the first channel is asked for and again if the
+# connection has been lost.
+# ------------------------------------------------------------------------------------------
+
+class SharedTransport(object):
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.transport = None
+
+    def channel(self):
+        # a new SFTPClient (same calls as a pysftp Connection), already in remoteDir
+
+        with self.lock:
+            if (self.transport is None) or (not self.transport.is_active()):
+                self.transport = SSHconnect()
+            transport = self.transport
+        return SFTPchannel(transport)
+
+    def close(self):
+
+        with self.lock:
+            if self.transport is not None:
+                self.transport.close()
+            self.transport = None
+
+# ------------------------------------------------------------------------------------------
+# RemoteDirs
+#
+# -m with -D: the remote directories of the tree (relative to remoteDir), made over a session
+# of their own as they are asked for, parents first, and remembered, so that each gets one
+# mkdir (and a stat, only if that fails: it may be there already). A directory that cannot be
+# made is reported and not tried again (its files then fail on their own).
+# ------------------------------------------------------------------------------------------
+
+class RemoteDirs(object):
+
+    def __init__(self):
+
+        self.known = set([''])      # made or found: the top (remoteDir) is there
+        self.made = 0
+        self.found = 0
+        self.sftp = None
+
+    def ensure(self, path):
+
+        if path in self.known:
+            return
+        self.ensure(posixpath.dirname(path))
+        try:
+            if self.sftp is None:
+                self.sftp = SFTPconnect()
+            try:
+                self.sftp.mkdir(path)
+                self.made += 1
+                vprint("Created remote directory: " + path)
+            except IOError:
+                if not stat.S_ISDIR(self.sftp.stat(path).st_mode):
+                    raise IOError("not a directory")
+                self.found += 1
+        except Exception, e:
+            print "Remote directory " + path + ":", str(e)
+            if self.sftp is not None:
+                self.sftp.close()
+            self.sftp = None
+        self.known.add(path)
+
+    def close(self):
+
+        if self.sftp is not None:
+            self.sftp.close()
+        self.sftp = None
+
+# ------------------------------------------------------------------------------------------
+# taskFor(loop)
+#
+# The source and (remote) destination of file number 'loop' (0 based) of a multi-processing
+# run: a file of the source directory, a generated file or testfile under a numbered name.
+# ------------------------------------------------------------------------------------------
+
+def taskFor(loop):
+
+    if (sourcedir):
+        relpath = sourceFiles[loop][0]
+        return os.path.join(sourcedir, relpath), relpath.replace(os.sep, '/')
+    if (lorem):
+        return testfile, lorem.name(loop)
+    return testfile, testfile + "." + makePadExt(loop+1)
+
+# ------------------------------------------------------------------------------------------
+# hybridProc(procNum, nextFileNum, statsQueue, counters)
+#
+# Hybrid mode (-c): worker process procNum (0 based) of the -l. Runs threadsPerProc threads
+# and waits for them to run out of files. paramiko's socket I/O releases the GIL, so the threads of one
+# process really do send concurrently. The process's statistics (shared by its threads, as
+# is its row of the shared counters) go back to the parent on statsQueue. With -M, every
+# channelsPerConn threads share one ssh connection (SharedTransport).
+# ------------------------------------------------------------------------------------------
+
+def hybridProc(procNum, nextFileNum, statsQueue, counters):
+
+    workerStats.share(counters)
+    threads = []
+    shared = []
+    for loop in range(0, threadsPerProc):
+        transport = None
+        if (channelsPerConn):
+            if (loop % channelsPerConn == 0):
+                shared.append(SharedTransport())
+            transport = shared[-1]
+        # connections are numbered across the processes first, so a profile's first levels
+        # spread over them
+        thread = threading.Thread(target=hybridThread, args=(nextFileNum, loop * maxConcurrent + procNum, transport))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    for transport in shared:
+        transport.close()
+    if (verifier):
+        finalCheck()
+
+    statsQueue.put(workerStats)
+
+# ------------------------------------------------------------------------------------------
+# hybridThread(nextFileNum, sessionNum, transport)
+#
+# Hybrid mode: takes the next file number from the counter shared by every thread of every
+# worker process and sends it, until filecnt files have been handed out. File naming is the
+# same as the multi-processing loop. Each thread keeps its own connection (a pysftp
+# Connection must not be shared between threads), or with -M its own channel over the
+# SharedTransport given, and opens a new one if it fails. With a load profile of sessions,
+# connection number sessionNum only runs while the profile's level is above it (closed while
+# it is not) and stops with the profile.
+# ------------------------------------------------------------------------------------------
+
+def hybridThread(nextFileNum, sessionNum, transport=None):
+
+    sftp = None
+    while True:
+        if (loadProfile) and (not loadProfile.isRate):
+            if (sftp is not None) and (not loadProfile.active(sessionNum)):
+                sftp.close()
+                sftp = None
+            if not loadProfile.waitActive(sessionNum):
+                break
+        with nextFileNum.get_lock():
+            loop = nextFileNum.value
+            if (loop >= filecnt):
+                break
+            nextFileNum.value = loop + 1
+
+        srcfile, destfile = taskFor(loop)
+        dueNs = arrivals.wait(loop) if arrivals else None
+
+        dispatchLag(dueNs)
+        try:
+            if sftp is None:
+                sftp = transport.channel() if transport else SFTPconnect()
+            rc = sendFile(sftp, srcfile, destfile, dueNs)
+
+        except Exception, e:
+            workerStats.error(None, str(e))
+            vprint("Exception encountered while processing file:", destfile, " Exception=", str(e))
+            if sftp is not None:
+                sftp.close()
+            sftp = None
+
+    if sftp is not None:
+        sftp.close()
+
+# ------------------------------------------------------------------------------------------
+# dispatchLag(dueNs)
+#
+# Called as every transfer starts: counts it as in flight (see ProgressMonitor) and, in
+# open-loop mode, records how late the transfer that was due at dueNs is being started
+# (closed-loop transfers have dueNs None).
+# ------------------------------------------------------------------------------------------
+
+def dispatchLag(dueNs):
+
+    workerStats.begin()
+    if dueNs is not None:
+        workerStats.recordLag(monotonicNs() - dueNs)
+
+# ------------------------------------------------------------------------------------------
+# sendFile(Connection, sourceFile, destFile, dueNs) 
+#
+# Initiates an sftp transfer given a pre-existing pysftp Connection. In open-loop mode (dueNs
+# given) the latency recorded runs from the time the transfer was due, not from now. With -G
+# the file is generated as it is written (sourceFile is not used). With -H the data is hashed
+# as it is written and the file then renamed to <digest>-<name> (an in-memory payload, whose
+# digest is known up front, is written under that name straight away). With -V the upload is
+# not stat'ed: it is left to the BatchVerifier (which may check a batch now, off the clock).
+# ------------------------------------------------------------------------------------------
+
+def sendFile(sftp, sourceFile, destFile, dueNs=None):
+
+    confirmed = verifier is None
+
+    if (fileLog):
 
         begintime = datetime.datetime.now()
         begintimestr =  (begintime.strftime("%d/%m/%Y") + ' ' + begintime.strftime("%H:%M:%S"))
         print " > Initiating transfer of file: ", destFile, "Timestamp:[", begintimestr , "]"
 
-    rc = sftp.put(sourceFile, destFile, None, confirmed)  # upload file to public/ on remote
+    starttime = monotonicNs() if dueNs is None else dueNs
+    if (payload is not None):
+        nbytes = payload.size
+        storeName = hashedName(destFile, payloadDigest) if payloadDigest else destFile
+        rc = putData(sftp, payload.reader(), storeName, payload.size, confirmed)
+    elif (lorem is not None) or (hashAlgorithm):
+        if (lorem is not None):
+            reader = lorem.open(destFile)
+            nbytes = reader.size
+        else:
+            reader = open(sourceFile, 'rb')
+            nbytes = os.fstat(reader.fileno()).st_size
+        if (hashAlgorithm):
+            reader = HashingReader(reader, hashAlgorithm)
+        rc = putData(sftp, reader, destFile, nbytes, confirmed)
+        reader.close()
+        storeName = destFile
+        if (hashAlgorithm):
+            storeName = hashedName(destFile, reader.hexdigest())
+            sftp.rename(destFile, storeName)
+    elif (writeDepth):
+        storeName = destFile
+        with open(sourceFile, 'rb') as reader:
+            nbytes = os.fstat(reader.fileno()).st_size
+            rc = putData(sftp, reader, destFile, nbytes, confirmed)
+    else:
+        storeName = destFile
+        nbytes = os.path.getsize(sourceFile)
+        rc = sftp.put(sourceFile, destFile, None, confirmed)  # upload file to public/ on remote
+    workerStats.record(monotonicNs() - starttime, nbytes)
+    if (verifier) and verifier.add(storeName, nbytes):
+        verifier.check(sftp)
 
-    if (not fast):
+    if (fileLog):
         curtime = datetime.datetime.now()
         curtimestr = (curtime.strftime("%d/%m/%Y") + ' ' + curtime.strftime("%H:%M:%S"))
         #proctime = (str(curtime - begintime)).split(".")[0] #truncate the fractional seconds
         proctime = (str(curtime - begintime))
 
         # rc will be in the format "-rw-r--r--   1 500      500      104862458 26 Nov 01:26 ?"
-        # the following returns timestamp on the remote (destination) file created
-        print " < Completed File ", destFile, " [", ("Remote Timestamp: {}".format(datetime.datetime.fromtimestamp(rc.st_mtime))), "] Duration:", proctime
+        # the following returns timestamp on the remote (destination) file created (not stat'ed with -V)
+        if (rc.st_mtime is None):
+            stamp = "Remote Timestamp: deferred"
+        else:
+            stamp = "Remote Timestamp: {}".format(datetime.datetime.fromtimestamp(rc.st_mtime))
+        print " < Completed File ", destFile, " [", stamp, "] Duration:", proctime
     return rc
 
+# ------------------------------------------------------------------------------------------
+# putData(sftp, reader, destFile, nbytes, confirm)
+#
+# Uploads nbytes from the file-like reader to destFile: with pysftp/paramiko's putfo, or with
+# -w through a PipelinedWriter, reading readBlock bytes at a time. Like putfo, confirm stats
+# the file afterwards (and fails if its size is not nbytes) and returns its attributes.
+# ------------------------------------------------------------------------------------------
+
+def putData(sftp, reader, destFile, nbytes, confirm):
+
+    if (not writeDepth):
+        return sftp.putfo(reader, destFile, nbytes, None, confirm)
+
+    if isinstance(sftp, pysftp.Connection):
+        sftp = sftp.sftp_client         # the paramiko SFTPClient it wraps
+    writer = PipelinedWriter(sftp, destFile, writeDepth, writeRequest)
+    try:
+        while True:
+            data = reader.read(readBlock)
+            if not data:
+                break
+            writer.write(data)
+    finally:
+        writer.close()
+    if (not confirm):
+        return paramiko.SFTPAttributes()
+    attrs = sftp.stat(destFile)
+    if (attrs.st_size != nbytes):
+        raise IOError("size mismatch in put!  {} != {}".format(attrs.st_size, nbytes))
+    return attrs
+
+# ------------------------------------------------------------------------------------------
+# PipelinedWriter(sftp, destFile, depth, request)
+#
+# A remote file written with up to 'depth' WRITE requests of up to 'request' bytes each
+# outstanding. The oldest answers are settled one at a time as new requests go out, so the
+# link never runs dry (paramiko's SFTPFile lets up to 100 build up, then waits for every
+# one of them). Answers are taken in any order; a failed write fails the upload.
+# It goes through SFTPClient internals (_async_request, _read_response, _convert_status),
+# unchanged from paramiko 1.x to 2.12 (tested with 2.12.0): unsupported() says why another
+# paramiko cannot be used, and -w then falls back to paramiko's put.
+# ------------------------------------------------------------------------------------------
+
+class PipelinedWriter(object):
+
+    internals = ('_async_request', '_read_response', '_convert_status')
+    versions  = ('1', '2')          # paramiko major versions with those internals as used here
+
+    # why pipelined writes cannot be used with this paramiko (None if they can)
+    @classmethod
+    def unsupported(cls):
+
+        missing = [name for name in cls.internals if not hasattr(paramiko.SFTPClient, name)]
+        if missing:
+            return "paramiko " + paramiko.__version__ + " has no SFTPClient." + ", ".join(missing)
+        if paramiko.__version__.split('.')[0] not in cls.versions:
+            return "paramiko " + paramiko.__version__ + " is untested (1.x and 2.x are)"
+        return None
+
+    def __init__(self, sftp, destFile, depth, request):
+
+        self.sftp = sftp
+        self.file = sftp.open(destFile, 'wb')
+        self.depth = depth
+        self.request = request
+        self.offset = 0
+        self.pending = set()        # request numbers not answered yet
+        self.failure = None
+
+    def write(self, data):
+
+        for start in xrange(0, len(data), self.request):
+            while len(self.pending) >= self.depth:
+                self.settle()
+            piece = data[start:start + self.request]
+            num = self.sftp._async_request(self, CMD_WRITE, self.file.handle, long(self.offset), piece)
+            self.pending.add(num)
+            self.offset += len(piece)
+
+    def settle(self):
+        # reads one answer (paramiko hands it to _async_response)
+
+        self.sftp._read_response()
+        if self.failure is not None:
+            raise self.failure
+
+    def _async_response(self, t, msg, num):
+
+        self.pending.discard(num)
+        if (t != CMD_STATUS):
+            self.failure = SFTPError("Expected status")
+            return
+        try:
+            self.sftp._convert_status(msg)
+        except (IOError, EOFError), e:
+            self.failure = e
+
+    def close(self):
+
+        try:
+            while self.pending and (self.failure is None):
+                self.settle()
+        finally:
+            self.file.close()
+
 # ------------------------------------------------------------------------------------------
 # makePadExt(numToEmbed)
 #
@@ -156,12 +833,548 @@ def makePadExt(numToEmbed):
 
    return fname
 
+# ------------------------------------------------------------------------------------------
+# hybridMain()
+#
+# Hybrid mode: starts maxConcurrent worker processes of threadsPerProc threads each, all
+# drawing file numbers from one shared counter, waits for them to finish (printing their
+# progress) and returns their merged statistics.
+# ------------------------------------------------------------------------------------------
+
+def hybridMain():
+
+    global workerCounters
+
+    if (not fast) and (not search) and (not matrix):
+        print "SFTP sessions throttled to ", maxConcurrent, " processes x ", threadsPerProc, " threads = ", \
+              maxConcurrent * threadsPerProc, " concurrent channels" if channelsPerConn else " concurrent connections"
+        if (channelsPerConn):
+            print "Multiplexed: ", channelsPerConn, " channels per ssh connection, ", \
+                  maxConcurrent * ((threadsPerProc + channelsPerConn - 1) // channelsPerConn), " ssh connections"
+
+    nextFileNum = Value('l', 0)
+    workerCounters = WorkerCounters(maxConcurrent)
+    statsQueue = Queue()
+    collector = StatsCollector(statsQueue)
+    procs = []
+    for loop in range(0, maxConcurrent):
+        proc = Process(target=hybridProc, args=(loop, nextFileNum, statsQueue, workerCounters))
+        proc.start()
+        procs.append(proc)
+    monitor = startMonitor(workerCounters, filecnt)
+    for proc in procs:
+        proc.join()
+    if (monitor):
+        monitor.finish()
+
+    return collector.finish()
+
+# ------------------------------------------------------------------------------------------
+# poolMain()
+#
+# Multi-processing mode: a pool of maxConcurrent worker processes, handed one upload per
+# file. A load profile of sessions only lets as many transfers run at once as its current
+# level, until it ends. Returns the workers' merged statistics.
+# ------------------------------------------------------------------------------------------
+
+def poolMain():
+
+    global workerCounters
+
+    workerCounters = WorkerCounters(maxConcurrent)
+    statsQueue = Queue()
+    collector = StatsCollector(statsQueue)
+    pool = Pool(processes=maxConcurrent, initializer=poolWorkerInit, initargs=(statsQueue, workerCounters))
+    if (not fast) and (not search) and (not matrix):
+        print "SFTP sessions throttled to ", maxConcurrent, " concurrent connections"
+
+    # tasks are made as they are handed out and only so many are out at a time (a load profile
+    # of sessions: as many as its level), so the parent's memory does not grow with filecnt
+    monitor = startMonitor(workerCounters, filecnt)
+    if (loadProfile is not None) and (not loadProfile.isRate):
+        window = loadProfile
+    else:
+        window = TaskWindow(taskWindow * maxConcurrent)
+    for tasks in chunked(taskStream(), taskChunkSize()):
+        if not window.enter():
+            break
+        res = pool.apply_async(runTasks, (tasks,), callback=window.leave)
+
+    pool.close()
+    pool.join()
+    if (monitor):
+        monitor.finish()
+    return collector.finish()
+
+# ------------------------------------------------------------------------------------------
+# taskStream()
+#
+# Multi-processing mode: the files of the run, (source, destination, dueNs) each, made one at
+# a time as they are asked for. In open-loop mode a file is only made once it is due. A tree's
+# remote directories are made as they are first needed, before their first file goes (the
+# empty ones at the end).
+# ------------------------------------------------------------------------------------------
+
+def taskStream():
+
+    for loop in xrange(filecnt):
+        srcfile, destfile = taskFor(loop)
+        if (remoteDirs):
+            remoteDirs.ensure(posixpath.dirname(destfile))
+        dueNs = arrivals.wait(loop) if arrivals else None
+        vprint("Starting process for ", destfile)
+        yield srcfile, destfile, dueNs
+    if (remoteDirs):
+        for dirname in sourceDirs:
+            remoteDirs.ensure(dirname.replace(os.sep, '/'))
+        remoteDirs.close()
+
+# ------------------------------------------------------------------------------------------
+# taskChunkSize()
+#
+# Files per pool task: one when every file has to start at its own time (open-loop arrivals)
+# or be let in by a load profile, otherwise up to taskChunk, but few enough that every worker
+# gets several chunks.
+# ------------------------------------------------------------------------------------------
+
+def taskChunkSize():
+
+    if (arrivals) or (loadProfile is not None):
+        return 1
+    return max(1, min(taskChunk, filecnt // (maxConcurrent * taskWindow * 2)))
+
+# ------------------------------------------------------------------------------------------
+# runTasks(tasks)
+#
+# Pool task: sends a chunk of files, (source, destination, dueNs) each, one after the other,
+# each over a connection of its own as before (sendFileProc). Whatever escapes sendFileProc is
+# counted against that file: the pool task must always return, or its callback never gives
+# its place in the task window (or load profile) back.
+# ------------------------------------------------------------------------------------------
+
+def runTasks(tasks):
+
+    for sourceFile, destFile, dueNs in tasks:
+        try:
+            sendFileProc(sourceFile, destFile, dueNs)
+        except Exception, e:
+            workerStats.error(None, str(e))
+            vprint("Exception encountered while processing file:", destFile, " Exception=", str(e))
+
+# ------------------------------------------------------------------------------------------
+# searchMain()
+#
+# Saturation search (-K): runs one short trial after the other (in hybrid mode with -c, pool
+# mode otherwise), each under a load profile of its own (a warm-up, then the trial at the
+# level the search asks for), until the search has found the knee. Prints a line per trial,
+# then the measured curve and the knee (and writes them to statsFile as JSON if -o was given).
+# ------------------------------------------------------------------------------------------
+
+def searchMain():
+
+    global loadProfile, arrivals, filecnt, maxConcurrent
+
+    print "Saturation search:", search.describe()
+    cap = filecnt
+    while True:
+        level = search.next()
+        if level is None:
+            break
+
+        # a fresh profile (and pool) for every trial, set before the workers are forked
+        loadProfile = search.profile(level)
+        TransferStats.profile = loadProfile
+        if (search.isRate):
+            filecnt = cap
+            arrivals = makeArrivals(filecnt, fileSizes())
+            filecnt = arrivals.count
+        else:
+            maxConcurrent = (level + threadsPerProc - 1) // threadsPerProc
+        loadProfile.start(arrivals.startNs if arrivals else None)
+
+        starttime = monotonicNs()
+        if (threadsPerProc > 1):
+            trialStats = hybridMain()
+        else:
+            trialStats = poolMain()
+        print search.result(level, trialStats.summary(monotonicNs() - starttime))
+        sys.stdout.flush()
+
+    print
+    for line in search.report():
+        print line
+
+    if (statsFile):
+        summary = { 'tool'    : os.path.basename(__file__),
+                    'version' : ver,
+                    'target'  : targethost + ":" + str(targetport),
+                    'engine'  : 'hybrid' if threadsPerProc > 1 else 'pool',
+                    'threads' : threadsPerProc,
+                    'channelsPerConnection': channelsPerConn or 1,
+                    'uploads' : uploadSettings()[0],
+                    'payload' : payloadMode or ('generated' if lorem else 'file'),
+                    'search'  : search.toDict() }
+        writeJSON(statsFile, summary)
+        print "Summary written to", statsFile
+
+# ------------------------------------------------------------------------------------------
+# serialMain()
+#
+# Serial mode: sends the files one after the other over one connection, in this process,
+# and returns the statistics (workerStats).
+# ------------------------------------------------------------------------------------------
+
+def serialMain():
+
+    # the dashboard reads this process's own counters
+    monitor = None
+    if (liveStatus or seriesFile):
+        workerStats.share(WorkerCounters(1))
+        monitor = startMonitor(workerStats.counters, filecnt)
+
+    destfile = None
+    try:
+        sftp = SFTPconnect()
+        for loop in xrange(filecnt):
+            if (sourcedir) or (lorem):
+                srcfile, destfile = taskFor(loop)
+            else:
+                srcfile, destfile = testfile, testfile + "." + makePadExt(loop)
+            if (remoteDirs):
+                remoteDirs.ensure(posixpath.dirname(destfile))
+            dueNs = arrivals.wait(loop) if arrivals else None
+            dispatchLag(dueNs)
+            rc = sendFile(sftp, srcfile, destfile, dueNs)
+            if ( fast ) and ( not monitor ) and ( not matrix ): # THIS IS THE MINIMAL PRINT IN FAST MODE SO THAT USER KNOWS AT LEAST SOMETHING IS GOING ON!
+                print str(loop)+"s" ,
+                sys.stdout.flush()
+        sftp.close()
+
+    except Exception, e:
+        workerStats.error(None, str(e))
+        print "Exception encountered while processing file:", destfile, " Exception=", str(e)
+
+    if (remoteDirs):
+        for dirname in sourceDirs:
+            remoteDirs.ensure(dirname.replace(os.sep, '/'))
+        remoteDirs.close()
+    if (verifier):
+        finalCheck()
+
+    if (monitor):
+        monitor.finish()
+    return workerStats
+
+# ------------------------------------------------------------------------------------------
+# matrixMain()
+#
+# Benchmark matrix (-X): for every combination of one cipher of -E, one MAC of -I and one
+# compression of -Z (paramiko's own choice for a list not given), checks with one
+# connection that the server allows it, then sends the files as a normal run would (serial,
+# pool or hybrid) and measures MB/s and the CPU time of the client, this process and all its
+# workers. Prints a line per combination, then the lot from the cheapest CPU per GB (and
+# writes them to statsFile as JSON if -o was given).
+# ------------------------------------------------------------------------------------------
+
+def matrixMain():
+
+    global sshCiphers, sshMacs, sshCompression, workerStats
+
+    axes = (sshCiphers or [None], sshMacs or [None], sshCompression or [None])
+    combinations = list(itertools.product(*axes))
+    print "Matrix:", len(combinations), "combinations (cipher x MAC x compression),", filecnt, "files each"
+    print "  %-24s %-16s %-16s %8s %7s %10s %10s %10s" % \
+          ('cipher', 'mac', 'compression', 'files', 'errors', 'MB/s', 'CPU(s)', 'CPU s/GB')
+    # first what the server agrees to (it may refuse a combination)
+    rows = []
+    allowed = []
+    for cipher, mac, compression in combinations:
+        sshCiphers = [cipher] if cipher else []
+        sshMacs = [mac] if mac else []
+        sshCompression = [compression] if compression else []
+        try:
+            transport = SSHconnect()
+            row = { 'cipher'      : transport.local_cipher,
+                    'mac'         : transport.local_mac,
+                    'compression' : transport.local_compression }
+            transport.close()
+            allowed.append((row, sshCiphers, sshMacs, sshCompression))
+        except Exception, e:
+            row = { 'cipher' : cipher or 'default', 'mac' : mac or 'default',
+                    'compression' : compression or 'default', 'refused' : str(e) }
+            print "  %-24s %-16s %-16s refused: %s" % (row['cipher'], row['mac'], row['compression'], str(e))
+        rows.append(row)
+    sys.stdout.flush()
+
+    for row, sshCiphers, sshMacs, sshCompression in allowed:
+        workerStats = TransferStats()       # serial runs account in this process
+        cpu = cpuSeconds()
+        starttime = monotonicNs()
+        if (not multiprocess):
+            runStats = serialMain()
+        elif (threadsPerProc > 1):
+            runStats = hybridMain()
+        else:
+            runStats = poolMain()
+        summary = runStats.summary(monotonicNs() - starttime)
+        cpu = cpuSeconds() - cpu
+        gigabytes = summary['bytes'] / float(1024 ** 3)
+        row.update({ 'files'          : summary['files'],
+                     'errors'         : summary['errors'],
+                     'mb_per_sec'     : summary['mb_per_sec'],
+                     'cpu_sec'        : cpu,
+                     'cpu_sec_per_gb' : cpu / gigabytes if gigabytes else None })
+        print matrixLine(row)
+        sys.stdout.flush()
+
+    ranked = sorted([row for row in rows if row.get('cpu_sec_per_gb') is not None],
+                    key=lambda row: row['cpu_sec_per_gb'])
+    print
+    print "Cheapest first (client CPU s/GB):"
+    for row in ranked:
+        print matrixLine(row)
+
+    if (statsFile):
+        summary = { 'tool'      : os.path.basename(__file__),
+                    'version'   : ver,
+                    'target'    : targethost + ":" + str(targetport),
+                    'engine'    : 'serial' if not multiprocess else ('hybrid' if threadsPerProc > 1 else 'pool'),
+                    'processes' : maxConcurrent,
+                    'threads'   : threadsPerProc,
+                    'channelsPerConnection': channelsPerConn or 1,
+                    'uploads'   : uploadSettings()[0],
+                    'payload'   : payloadMode or ('generated' if lorem else 'file'),
+                    'files'     : filecnt,
+                    'matrix'    : rows }
+        writeJSON(statsFile, summary)
+        print "Summary written to", statsFile
+
+# ------------------------------------------------------------------------------------------
+# matrixLine(row)
+#
+# A matrix row (see matrixMain) as a line of the table.
+# ------------------------------------------------------------------------------------------
+
+def matrixLine(row):
+
+    perGB = row['cpu_sec_per_gb']
+    return "  %-24s %-16s %-16s %8d %7d %10.3f %10.2f %10s" % \
+           (row['cipher'], row['mac'], row['compression'], row['files'], row['errors'],
+            row['mb_per_sec'], row['cpu_sec'], "%.2f" % perGB if perGB is not None else "-")
+
+# ------------------------------------------------------------------------------------------
+# cpuSeconds()
+#
+# CPU time (user + system) used so far by this process and by its workers that have ended.
+# ------------------------------------------------------------------------------------------
+
+def cpuSeconds():
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + workers.ru_utime + workers.ru_stime
+
+# ------------------------------------------------------------------------------------------
+# startMonitor(counters, total)
+#
+# Starts the ProgressMonitor of a run of 'total' transfers counted in 'counters': progress
+# lines (or fast mode markers), or the -L status line, and the -T time series. None during
+# the trials of a saturation search or the runs of a matrix (unless -L).
+# ------------------------------------------------------------------------------------------
+
+def startMonitor(counters, total):
+
+    if (search or matrix) and (not liveStatus):
+        return None                 # saturation search, matrix: a line per trial (run) is enough
+    return ProgressMonitor(counters, total, fast, sampleInterval, liveStatus, seriesFile)
+
+# ------------------------------------------------------------------------------------------
+# fileSizes()
+#
+# The size makeArrivals needs for a bytes/s rate: of every file, or a list of the size of each
+# generated file (-G) or file of the source directory (-m).
+# ------------------------------------------------------------------------------------------
+
+def fileSizes():
+
+    if (sourcedir):
+        return [size for name, size in sourceFiles] if arrivalBytes else 0
+    if (lorem):
+        return [lorem.size(loop) for loop in xrange(filecnt)] if arrivalBytes else 0
+    return payload.size if payload else os.path.getsize(testfile)
+
+# ------------------------------------------------------------------------------------------
+# makeArrivals(count, size)
+#
+# Open-loop mode: returns the (started) ArrivalSchedule of 'count' transfers at arrivalRate,
+# or at the rates of the load profile (then fewer, if the profile ends before). 'size'
+# (bytes per file, or a list of them) is only used for a bytes/s rate.
+# ------------------------------------------------------------------------------------------
+
+def makeArrivals(count, size):
+
+    schedule = ArrivalSchedule(arrivalRate, count, arrivalPoisson, size if arrivalBytes else None,
+                               profile=loadProfile)
+    if (not search):
+        print "Open-loop arrivals:", schedule.describe()
+    schedule.start()
+    return schedule
+
+# ------------------------------------------------------------------------------------------
+# uploadSettings()
+#
+# How uploads are written (-w, -W): as a dict for the JSON summary and as a line of text.
+# ------------------------------------------------------------------------------------------
+
+def uploadSettings():
+
+    settings = { 'pipelineDepth' : writeDepth,
+                 'writeRequest'  : writeRequest if writeDepth else paramiko.SFTPFile.MAX_REQUEST_SIZE,
+                 'readBlock'     : readBlock if writeDepth else 32768,
+                 'windowSize'    : windowSize or paramiko.common.DEFAULT_WINDOW_SIZE,
+                 'packetSize'    : packetSize or paramiko.common.DEFAULT_MAX_PACKET_SIZE }
+    if (writeDepth):
+        text = "pipelined, " + str(writeDepth) + " x " + str(writeRequest) + " byte writes outstanding"
+    else:
+        text = "paramiko put"
+    text += ", " + str(settings['readBlock']) + " byte reads, window " + str(settings['windowSize']) + \
+            ", max packet " + str(settings['packetSize'])
+    return settings, text
+
+# ------------------------------------------------------------------------------------------
+# verifyText()
+#
+# How uploads are verified: a stat each, or in bulk (-V) at the end or every N files.
+# ------------------------------------------------------------------------------------------
+
+def verifyText():
+
+    if (not verifier):
+        return "stat per file"
+    if (verifier.every):
+        return "in bulk every " + str(verifier.every) + " files"
+    return "in bulk at the end"
+
+# ------------------------------------------------------------------------------------------
+# reportStats(runStats, starttime)
+#
+# Prints the latency percentiles and throughput of the run (and writes them to statsFile as
+# JSON if -o was given). starttime is the monotonicNs() at which the run began.
+# ------------------------------------------------------------------------------------------
+
+def reportStats(runStats, starttime):
+
+    elapsed = monotonicNs() - starttime
+    settings, text = uploadSettings()
+    print
+    for line in runStats.report(elapsed):
+        print line
+    print "Uploads:", text + ", verified", verifyText()
+    if (remoteDirs):
+        print "Remote directories: %d made, %d there already" % (remoteDirs.made, remoteDirs.found)
+    if (workerCounters):
+        for line in workerCounters.report(runStats):
+            print line
+
+    if (statsFile):
+        if (not multiprocess):
+            engine = 'serial'
+        elif (threadsPerProc > 1):
+            engine = 'hybrid'
+        else:
+            engine = 'pool'
+        summary = runStats.summary(elapsed)
+        summary.update({ 'tool'        : os.path.basename(__file__),
+                         'version'     : ver,
+                         'target'      : targethost + ":" + str(targetport),
+                         'engine'      : engine,
+                         'processes'   : maxConcurrent,
+                         'threads'     : threadsPerProc,
+                         'channelsPerConnection' : channelsPerConn or 1,
+                         'payload'     : payloadMode or ('generated' if lorem else 'file'),
+                         'arrivals'    : arrivals.describe() if arrivals else 'closed-loop',
+                         'profile'     : loadProfile.describe() if loadProfile else 'none',
+                         'hash'        : hashAlgorithm or 'none',
+                         'verify'      : verifyText(),
+                         'source'      : sourcedir or testfile,
+                         'uploads'     : settings })
+        if (workerCounters):
+            summary['workers'] = workerCounters.rows()
+        writeJSON(statsFile, summary)
+        print "Summary written to", statsFile
+
 # ------------------------------------------------------------------------------------------
 # main
 # ------------------------------------------------------------------------------------------
 
 def main():
     
+    global payload, arrivals, workerCounters, fileLog, filecnt, payloadDigest, sourceFiles, sourceDirs, remoteDirs
+
+    # worker processes keep quiet (unless -v): the parent prints their progress instead (and
+    # a matrix, a line per run)
+    fileLog = (not fast) and (verbose or not (multiprocess or matrix))
+
+    # load the payload once, before any worker is forked, so that they all share it
+    if (payloadMode):
+        payload = PayloadBuffer(testfile, payloadMode, payloadSize)
+        print "Payload:", payload.size, "bytes held in memory (" + payloadMode + ")"
+    if (lorem):
+        print "Generated files:", lorem.describe()
+
+    # source directory: scanned once, up front, so the workers forked below inherit the list.
+    # Hybrid mode's threads take their files straight from a shared counter: the remote
+    # directories are made here, before them
+    if (sourcedir):
+        vprint("Acquiring files from directory " + sourcedir)
+        sourceFiles, sourceDirs = scanTree(sourcedir, recursive)
+        if not sourceFiles:
+            print "Abort: No files found in source directory: " + sourcedir
+            sys.exit(2)
+        filecnt = len(sourceFiles)
+        print "Source directory:", filecnt, "files,", sum([size for name, size in sourceFiles]), "bytes,", \
+              len(sourceDirs), "subdirectories"
+        if (sourceDirs):
+            remoteDirs = RemoteDirs()
+            if (multiprocess) and (threadsPerProc > 1):
+                for dirname in sourceDirs:
+                    remoteDirs.ensure(dirname.replace(os.sep, '/'))
+                remoteDirs.close()
+
+    # hashed names: the payload is the same for every file, so its digest is worked out once
+    if (hashAlgorithm):
+        if (payload):
+            payloadDigest = digestOf(payload.reader(), hashAlgorithm)
+            print "Payload " + hashAlgorithm + ":", payloadDigest + ", files stored as", hashedName("<name>", payloadDigest)
+        else:
+            print "Uploads are hashed (" + hashAlgorithm + ") as they are written and renamed to <digest>-<name>"
+
+    # saturation search: a run of its own, trial after trial
+    if (search):
+        searchMain()
+        print "All done!"
+        return
+
+    # benchmark matrix: a run per combination of ssh algorithms
+    if (matrix):
+        matrixMain()
+        print "All done!"
+        return
+
+    # open-loop mode: fix the arrival times before any worker is forked
+    if (arrivalRate) or (loadProfile and loadProfile.isRate):
+        arrivals = makeArrivals(filecnt, fileSizes())
+        filecnt = arrivals.count
+
+    # load profile: its clock starts with the arrivals (or now) and the workers forked below
+    # account their transfers per step
+    if (loadProfile):
+        loadProfile.start(arrivals.startNs if arrivals else None)
+        TransferStats.profile = loadProfile
+        print "Load profile:", loadProfile.describe()
+
+    starttime = monotonicNs()
+
     print "Current process spawn limit: ", resource.getrlimit(resource.RLIMIT_NPROC)
 
     print "Multi processing is ",
@@ -173,21 +1386,13 @@ def main():
 
         print "ON"
 
-        pool = Pool(processes=maxConcurrent)
-        if (not fast):
-            print "SFTP sessions throttled to ", maxConcurrent, " concurrent connections"
-   
-        for loop in range (0, filecnt):
-            destfile = testfile + "." + makePadExt(loop+1)
+        if (threadsPerProc > 1):
+            runStats = hybridMain()
+            reportStats(runStats, starttime)
+            print "All done!"
+            return
 
-            vprint("Starting process for ", destfile)
-            if ( fast ): # THIS IS THE MINIMAL PRINT IN FAST MODE SO THAT USER KNOWS AT LEAST SOMETHING IS GOING ON!
-                print str(loop)+"m" ,
-                sys.stdout.flush()
-            res = pool.apply_async(sendFileProc, (testfile, destfile))
-        
-        pool.close()
-        pool.join()
+        runStats = poolMain()
        
     else:
 
@@ -197,22 +1402,9 @@ def main():
 
         print "OFF"
 
-        try:
-            sftp = pysftp.Connection( targethost, username=sftpuser, password=sftpuserpw, log="")
-            if remoteDir:
-                sftp.chdir(remoteDir) # change remote directory
-            for loop in range (0, filecnt):
-                destfile = testfile + "." + makePadExt(loop)
-                rc = sendFile(sftp, testfile, destfile)
-                if ( fast ): # THIS IS THE MINIMAL PRINT IN FAST MODE SO THAT USER KNOWS AT LEAST SOMETHING IS GOING ON!
-                    print str(loop)+"s" ,
-                    sys.stdout.flush()
-            sftp.close()
-
-        except Exception, e:
-            print "Exception encountered while processing file:", destFile, " Exception=", str(e)
-
+        runStats = serialMain()
 
+    reportStats(runStats, starttime)
     print "All done!"
 
 
@@ -239,7 +1431,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(epilog=longdescription)
 #    Note that '-h'is automatically applied by argparse
     parser.add_argument('-v', help='verbose mode [Default: False]', action="store_true") # make it a True/False flag
-    parser.add_argument('-t', help='target sftp server: IP or hostname. [Default: ' + targethost + "]")
+    parser.add_argument('-t', help='target sftp server: IP or hostname, optionally :port. [Default: ' + targethost + "]")
+    parser.add_argument('--insecure-hostkey', help='Accept any host key (no known_hosts check, eg. for sftp-sink.py) [Default: False]', action="store_true")
     parser.add_argument('-u', help='remote sftp username. [Default: ' + sftpuser + "]")
     parser.add_argument('-p', help='remote sftp password. [Default: ' + sftpuserpw + "]")
     parser.add_argument('-f', help='Source file to be sent (with numerical incrementing extension). [Default:  ' + testfile + "]")
@@ -247,7 +1440,29 @@ if __name__ == "__main__":
     parser.add_argument('-d', help='Remote directory [Default: none ]')
     parser.add_argument('-s', help='Serial-processing mode [Default: Multiprocessing]', action="store_true") # 
     parser.add_argument('-l', help='Maximum concurrent process limit [Default: ' + str(maxConcurrent) + ']')      # 
+    parser.add_argument('-c', help='Threads (connections) per process in multi-processing mode [Default: ' + str(threadsPerProc) + ']')
+    parser.add_argument('-M', help='Multiplexed hybrid mode: threads (sftp channels) per ssh connection, within the server\'s MaxSessions [Default: one connection per thread]')
+    parser.add_argument('-w', help='Pipelined writes: keep up to depth WRITE requests outstanding per upload, depth (a count), depth,request size or depth,request size,read block (bytes read from the local data at a time), eg. 64,64KB,1MB [Default: paramiko put; ' + str(writeRequest) + ',' + str(readBlock) + ' with -w]')
+    parser.add_argument('-W', help='sftp channel window and max packet size: window or window,packet, eg. 8MB,32KB [Default: paramiko\'s, 2MB,32KB]')
+    parser.add_argument('-V', help='Deferred verification: no stat per upload, check the sizes in bulk (one listing per remote directory) at the end, or every V files a worker sends [Default: stat every upload]', nargs='?', const='0')
+    parser.add_argument('-E', '--ciphers', help='ssh ciphers to offer, in order of preference, eg. aes128-ctr,aes256-ctr [Default: paramiko\'s]')
+    parser.add_argument('-I', help='ssh MACs to offer, in order of preference, eg. hmac-sha2-256,hmac-sha1 [Default: paramiko\'s]')
+    parser.add_argument('-Z', help='ssh compression to offer, in order of preference: none, zlib, zlib@openssh.com [Default: none]')
+    parser.add_argument('-X', help='Benchmark matrix: the uploads once per combination of one cipher (-E), MAC (-I) and compression (-Z), reporting MB/s and client CPU s/GB [Default: off]', action="store_true")
+    parser.add_argument('-m', help='Source directory: send its files (largest first) instead of -f [Default: none]')
+    parser.add_argument('-D', '--recursive', help='Recursive: with -m, the files of the whole tree, remote directories made as needed (-w in ftp-gen.py) [Default: False]', action="store_true")
+    parser.add_argument('-i', help='In-memory payload: read the source file once (load) or map it (mmap) [Default: read per transfer]', choices=['load', 'mmap'])
+    parser.add_argument('-z', help='Send Z bytes of generated data per file instead of a source file [Default: none]')
+    parser.add_argument('-H', help='Hash every upload while it is written and name it <digest>-<name> (rename, or directly for -i/-z), as MD5checker.py expects: md5, sha1, sha256, ... [Default: off, md5 if no algorithm given]', nargs='?', const='md5')
+    parser.add_argument('-G', help='Send unique Lorem Ipsum files generated on the fly, as RandomFileMaker.py makes them: size, or size,step for random multiples of step below size; -f is the name prefix [Default: none]')
+    parser.add_argument('-o', help='Write the run summary (throughput, latency percentiles, histogram) to this JSON file [Default: none]')
+    parser.add_argument('-r', help='Open-loop arrival rate: files/s (eg 2.5) or bytes/s with a B/KB/MB/GB suffix (eg 40MB) [Default: none, send as fast as possible]')
+    parser.add_argument('-y', help='Poisson arrivals (exponentially distributed gaps) at the -r rate [Default: evenly spaced]', action="store_true")
+    parser.add_argument('-R', help='Load profile: stages of concurrent connections or of rates (/s), eg. warmup=30s:2,ramp=2m:2-10,steady=10m:10, or a file of them, one per line; the run ends with it [Default: none]')
+    parser.add_argument('-K', help='Saturation search: trials at more and more connections (or a higher rate) until an SLO breaks, eg. p99=250ms,errors=1,sessions=1-64 (or rate=10-500/s), trial=10s, warmup=2s, method=binary|golden; reports the knee and the curve [Default: none]')
     parser.add_argument('-q', help='Quick (fast) mode. Less info than non-verbose mode. No timestamping calculations. [Default: False]', action="store_true") # make it a True/False flag
+    parser.add_argument('-L', help='Live status line: files/s, MB/s, in flight, error rate and ETA, every second [Default: progress lines]', action="store_true")
+    parser.add_argument('-T', help='Write the progress samples (every second) to this CSV file [Default: none]')
 
     args = parser.parse_args()
 
@@ -258,8 +1473,13 @@ if __name__ == "__main__":
 
     # target Host/IP?
     if args.t:
-        targethost = args.t
-        vprint("Target host: ", targethost)
+        targethost, targetport = splitHostPort(args.t, targetport)
+        vprint("Target host: ", targethost, " port: ", targetport)
+
+    # any host key?
+    if args.insecure_hostkey:
+        anyHostKey = True
+        vprint("Host key check: OFF")
 
     # destination userid?
     if args.u:
@@ -299,19 +1519,227 @@ if __name__ == "__main__":
         maxConcurrent = int(args.l)
         vprint("Maximum concurrent process: " + args.l)
 
+    # Threads per process (hybrid mode)
+    if args.c:
+        threadsPerProc = int(args.c)
+        vprint("Threads per process: " + args.c)
+
+    # multiplexed channels?
+    if args.M:
+        channelsPerConn = int(args.M)
+        if (channelsPerConn < 1) or (threadsPerProc < 2):
+            print "-M (channels per ssh connection) must be 1 or more and needs hybrid mode (-c 2 or more)"
+            exit(1)
+        vprint("Channels per ssh connection: " + args.M)
+
+    # pipelined writes? channel window/packet sizes?
+    try:
+        if args.w:
+            sizes = args.w.split(',')
+            try:
+                writeDepth = int(sizes[0])
+            except ValueError:
+                writeDepth = 0
+            if (writeDepth < 1):
+                print "Pipeline depth (-w) must be a number of requests, 1 or more:", sizes[0]
+                exit(1)
+            if (len(sizes) > 1) and sizes[1]:
+                writeRequest = parseSize(sizes[1])
+            if (len(sizes) > 2):
+                readBlock = parseSize(sizes[2])
+            vprint("Pipelined writes: " + args.w)
+        if args.W:
+            sizes = args.W.split(',')
+            windowSize = parseSize(sizes[0])
+            if (len(sizes) > 1):
+                packetSize = parseSize(sizes[1])
+            vprint("Channel window, packet size: " + args.W)
+    except ValueError, e:
+        print "Invalid size (-w or -W):", str(e)
+        exit(1)
+    if (writeDepth) and PipelinedWriter.unsupported():
+        print "Pipelined writes (-w) not available,", PipelinedWriter.unsupported() + ": using paramiko's put"
+        writeDepth = 0
+
+    # ssh algorithms? (checked against those paramiko knows)
+    for arg, known, name in ((args.ciphers, paramiko.Transport._cipher_info, 'cipher (-E)'),
+                             (args.I, paramiko.Transport._mac_info, 'MAC (-I)'),
+                             (args.Z, paramiko.Transport._compression_info, 'compression (-Z)')):
+        if arg:
+            for algorithm in arg.split(','):
+                if algorithm not in known:
+                    print "Unknown ssh", name + ":", algorithm, " Choose from:", ", ".join(sorted(known))
+                    exit(1)
+    if args.ciphers:
+        sshCiphers = args.ciphers.split(',')
+        vprint("ssh ciphers: " + args.ciphers)
+    if args.I:
+        sshMacs = args.I.split(',')
+        vprint("ssh MACs: " + args.I)
+    if args.Z:
+        sshCompression = args.Z.split(',')
+        vprint("ssh compression: " + args.Z)
+
+    # benchmark matrix?
+    if args.X:
+        if not (args.ciphers or args.I or args.Z):
+            print "-X (benchmark matrix) needs the ciphers (-E), MACs (-I) or compression (-Z) to try"
+            exit(1)
+        if args.K or args.R or args.r or args.T:
+            print "Cannot use -X (benchmark matrix) with -K, -R, -r (every run sends the same files as fast as it can) or -T"
+            exit(1)
+        matrix = True
+        vprint("Benchmark matrix: ON")
+
+    # deferred (bulk) verification?
+    if args.V:
+        try:
+            verifier = BatchVerifier(int(args.V))
+            if (verifier.every < 0):
+                raise ValueError(args.V)
+        except ValueError, e:
+            print "Invalid verification batch (-V), expected a number of files:", args.V
+            exit(1)
+        vprint("Deferred verification: " + verifyText())
+
+    # source directory (tree)?
+    if args.m:
+        if args.f or args.n or args.i or args.z or args.G or args.K:
+            print "Cannot use -f, -n, -i, -z, -G or -K with -m (source directory)"
+            exit(1)
+        if not os.path.isdir(args.m) or not os.listdir(args.m):
+            print "Source directory " + args.m + " (-m) is empty or not a directory"
+            exit(1)
+        sourcedir = args.m
+        vprint("Source directory: " + sourcedir)
+        if args.recursive:
+            recursive = True
+            vprint("Recursive: ON")
+    elif args.recursive:
+        print "-D (recursive) requires a source directory (-m)"
+        exit(1)
+
+    # in-memory payload?
+    if args.z:
+        payloadMode = 'synthetic'
+        payloadSize = int(args.z)
+        vprint("Synthetic payload (bytes): " + args.z)
+    elif args.i:
+        payloadMode = args.i
+        vprint("In-memory payload: " + payloadMode)
+
+    # generated (Lorem Ipsum) files?
+    if args.G:
+        if args.i or args.z:
+           print "Cannot use -G (generated files) with -i or -z"
+           exit(1)
+        try:
+            sizes = [int(part) for part in args.G.split(',')]
+            if (min(sizes) < 1):
+                raise ValueError(args.G)
+            lorem = LoremFiles(filecnt, sizes[0], sizes[1] if len(sizes) > 1 else None, args.f or 'LoremFile')
+        except (ValueError, IndexError), e:
+            print "Invalid generated file size (-G), expected size or size,step:", args.G
+            exit(1)
+        vprint("Generated files: " + lorem.describe())
+
+    # hashed (integrity-tagged) names?
+    if args.H:
+        if args.H not in hashlib.algorithms:
+           print "Unknown digest (-H):", args.H, " Choose from:", ", ".join(hashlib.algorithms)
+           exit(1)
+        hashAlgorithm = args.H
+        if (lorem):
+            lorem.marked = True         # as RandomFileMaker.py -j: the pad first, for distinct digests
+        vprint("Hashed names: " + hashAlgorithm)
+
+    # JSON summary?
+    if args.o:
+        statsFile = args.o
+        vprint("JSON summary file: " + statsFile)
+
+    # open-loop arrival rate?
+    if args.r:
+        try:
+            arrivalRate, arrivalBytes = parseRate(args.r)
+        except ValueError, e:
+            print "Invalid arrival rate (-r):", args.r
+            exit(1)
+        vprint("Arrival rate: " + args.r)
+    # load profile?
+    if args.R:
+        if args.r:
+            print "Cannot use -R (load profile) with -r (its rates are in the profile)"
+            exit(1)
+        try:
+            loadProfile = LoadProfile(args.R)
+        except ValueError, e:
+            print "Invalid load profile (-R):", str(e)
+            exit(1)
+        if (loadProfile.isRate):
+            arrivalBytes = loadProfile.isBytes
+        else:
+            if args.s:
+                print "A load profile of sessions cannot be used with -s (serial)"
+                exit(1)
+            if args.l:
+                print "Cannot use -l with a load profile of sessions (-R): its highest level sets the number of workers"
+                exit(1)
+            # enough connections for the highest level
+            maxConcurrent = (loadProfile.maxLevel() + threadsPerProc - 1) // threadsPerProc
+        vprint("Load profile: " + loadProfile.describe())
+
+    # saturation search?
+    if args.K:
+        if args.s or args.R or args.r or args.T:
+            print "Cannot use -K (saturation search) with -s, -R, -r (the trials set the load) or -T"
+            exit(1)
+        try:
+            search = SaturationSearch(args.K, maxConcurrent * threadsPerProc)
+        except ValueError, e:
+            print "Invalid saturation search (-K):", str(e)
+            exit(1)
+        if (search.isRate):
+            arrivalBytes = search.isBytes
+        # each trial ends with its time, unless it runs out of files first
+        if not args.n:
+            filecnt = 100000
+            frontPadLen = int(math.log(filecnt+1,10))+3
+            if (lorem):
+                lorem.setCount(filecnt)
+        vprint("Saturation search: " + search.describe())
+
+    if args.y:
+        if not (args.r or (loadProfile and loadProfile.isRate) or (search and search.isRate)):
+            print "-y (Poisson arrivals) requires an arrival rate (-r, or -R or -K with rates)"
+            exit(1)
+        arrivalPoisson = True
+        vprint("Poisson arrivals: ON")
+
     # fast mode?
     if args.q:
         fast = True
         vprint("Fast mode: ON")
 
+    # live status line?
+    if args.L:
+        liveStatus = True
+        vprint("Live status line: ON")
+
+    # progress time series?
+    if args.T:
+        seriesFile = args.T
+        vprint("Progress CSV file: " + seriesFile)
+
     #
     #  Some quick sanity checks.
     #
 
-    # make sure source file exists and is readable
-    if ( not os.access(testfile, os.R_OK)) or (os.stat(testfile).st_size == 0):
-       print "Source file not valid, unreadable, or empty:" + testfile
-       sys.exit(2)
+    # make sure source file exists and is readable (unless sending generated data)
+    if (not args.z) and (not args.G) and (not args.m):
+       if ( not os.access(testfile, os.R_OK)) or (os.stat(testfile).st_size == 0):
+          print "Source file not valid, unreadable, or empty:" + testfile
+          sys.exit(2)
 
     main()
 
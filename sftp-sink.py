@@ -0,0 +1,459 @@
+#!/usr/bin/env python
+
+# sftp-sink.py
+#
+#  see 'longdescription' string which appears with help (-h)
+#
+# Notes:
+#  - python 2.x compatible (not 3.x)
+#  - requires paramiko (already needed by sftp-gen.py, through pysftp)
+#  - a stand-in for the real sftp server (192.168.60.44) so that sftp-gen.py can be run, and
+#    its modes compared, on a single box:   sftp-sink.py -x &   sftp-gen.py -t 127.0.0.1:2222 --insecure-hostkey ...
+#
+# History
+#
+# V1.00 : Loopback sftp sink: disk or discard mode, transfer counters.
+#
+# ---------------------------------------------------------------------------------------------------
+
+import paramiko
+from paramiko import ServerInterface, SFTPServerInterface, SFTPServer, SFTPAttributes, SFTPHandle, \
+                     SFTP_OK, SFTP_NO_SUCH_FILE, AUTH_SUCCESSFUL, AUTH_FAILED, OPEN_SUCCEEDED, \
+                     OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+import os, sys
+import stat
+import time
+import socket
+import signal
+import resource
+import threading
+import argparse
+from genlib import SinkStore
+
+ver = "V1.00"
+
+# defaults/controls  (Most/all of these can be changed via command line arguments to the program)
+# ---------------------------------------------------------------------------------------------------
+
+bindaddr      = '127.0.0.1'     # address to listen on (loopback only by default)
+port          = 2222            # ssh port
+sftpuser      = 'sftpuser'      # the login accepted (same default as sftp-gen.py)
+sftpuserpw    = 'fractal'       # its password (same default as sftp-gen.py)
+rootdir       = 'sftpsink'      # files (and, in discard mode, directories only) go under this directory
+hostKeyFile   = 'sftpsink_rsa.key'  # host key, generated on first use
+discard       = False           # discard the data received instead of writing it to disk
+reportInterval = 0              # print the counters every so many seconds (0 = only on exit)
+verbose       = False           # verbose mode toggle. default off
+
+fillBlock     = os.urandom(65536)  # discard mode: the data sent back for a download
+sinkStore     = None            # the SinkStore (counters, discarded files)
+hostKey       = None            # the loaded paramiko host key
+
+# used as 'help' by argparse:
+longdescription = "This is a minimal local sftp server to run sftp-gen.py against (with " + \
+                  "--insecure-hostkey, or after adding the host key it prints to known_hosts), so that the client side can be measured and " + \
+                  "regression tested without the remote test server and its disk. It listens on 127.0.0.1 " + \
+                  "and accepts the same login as sftp-gen.py's defaults. Uploads are written under the root " + \
+                  "directory (-r) unless -x (discard) is given, in which case only their names and sizes " + \
+                  "are kept (enough for stat, listing, remove and downloads, which then get generated data) " + \
+                  "and the data itself is thrown away. Files and bytes received and sent are counted and " + \
+                  "reported on exit (Ctrl-C or SIGTERM) and, with -i, periodically."
+
+# ------------------------------------------------------------------------------------------
+# SinkServer
+#
+# ssh side: password logins for sftpuser, session channels only.
+# ------------------------------------------------------------------------------------------
+
+class SinkServer(ServerInterface):
+
+    def get_allowed_auths(self, username):
+
+        return 'password'
+
+    def check_auth_password(self, username, password):
+
+        if (username == sftpuser) and (password == sftpuserpw):
+            return AUTH_SUCCESSFUL
+        return AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+
+        if (kind == 'session'):
+            return OPEN_SUCCEEDED
+        return OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+# ------------------------------------------------------------------------------------------
+# SinkHandle(path, flags, size)
+#
+# An open file. On disk (readfile/writefile set, see SinkSFTP.open) reads and writes go to the
+# file; in discard mode (no file) writes only move the size on and reads return fillBlock
+# data. Either way the bytes are counted, and the file when it is closed.
+# ------------------------------------------------------------------------------------------
+
+class SinkHandle(SFTPHandle):
+
+    def __init__(self, path, flags, size=0):
+
+        SFTPHandle.__init__(self, flags)
+        self.path    = path
+        self.size    = size
+        self.moved   = 0               # bytes written or read through this handle
+        self.writing = bool(flags & (os.O_WRONLY | os.O_RDWR))
+
+    def write(self, offset, data):
+
+        self.moved = self.moved + len(data)
+        if getattr(self, 'writefile', None) is not None:
+            return SFTPHandle.write(self, offset, data)
+        self.size = max(self.size, offset + len(data))
+        return SFTP_OK
+
+    def read(self, offset, length):
+
+        if getattr(self, 'readfile', None) is not None:
+            data = SFTPHandle.read(self, offset, length)
+        else:
+            length = min(length, self.size - offset, len(fillBlock))
+            data = fillBlock[:max(length, 0)]
+        if isinstance(data, str):
+            self.moved = self.moved + len(data)
+        return data
+
+    def stat(self):
+
+        if getattr(self, 'readfile', None) is not None:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        return virtualAttributes(self.size)
+
+    def chattr(self, attr):
+
+        return SFTP_OK
+
+    def close(self):
+
+        SFTPHandle.close(self)
+        if (self.writing):
+            if getattr(self, 'writefile', None) is None:
+                sinkStore.setSize(self.path, self.size)
+            sinkStore.received(self.moved)
+        else:
+            sinkStore.sent(self.moved)
+
+# ------------------------------------------------------------------------------------------
+# virtualAttributes(size, name)
+#
+# Discard mode: the attributes (stat) of a discarded file.
+# ------------------------------------------------------------------------------------------
+
+def virtualAttributes(size, name=None):
+
+    now = int(time.time())
+    attr = SFTPAttributes.from_stat(os.stat_result((stat.S_IFREG | 0644, 0, 0, 1, os.getuid(), os.getgid(),
+                                                    size, now, now, now)))
+    if name is not None:
+        attr.filename = name
+    return attr
+
+# ------------------------------------------------------------------------------------------
+# SinkSFTP
+#
+# sftp side: every path is taken relative to rootdir. In discard mode directories are real,
+# files are the ones remembered by sinkStore (files that really exist are still served).
+# ------------------------------------------------------------------------------------------
+
+class SinkSFTP(SFTPServerInterface):
+
+    def realPath(self, path):
+
+        return os.path.normpath(os.path.join(rootdir, self.canonicalize(path).lstrip('/')))
+
+    def canonicalize(self, path):
+
+        return os.path.normpath('/' + path)
+
+    def list_folder(self, path):
+
+        realpath = self.realPath(path)
+        try:
+            listing = []
+            for name in os.listdir(realpath):
+                attr = SFTPAttributes.from_stat(os.lstat(os.path.join(realpath, name)))
+                attr.filename = name
+                listing.append(attr)
+        except OSError, e:
+            return SFTPServer.convert_errno(e.errno)
+        if (discard):
+            for name in sinkStore.names(realpath):
+                listing.append(virtualAttributes(sinkStore.getSize(os.path.join(realpath, name)) or 0, name))
+        return listing
+
+    def stat(self, path):
+
+        realpath = self.realPath(path)
+        if (discard):
+            size = sinkStore.getSize(realpath)
+            if size is not None:
+                return virtualAttributes(size)
+        try:
+            return SFTPAttributes.from_stat(os.stat(realpath))
+        except OSError, e:
+            return SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+
+        realpath = self.realPath(path)
+        writing = bool(flags & (os.O_WRONLY | os.O_RDWR))
+
+        if (discard):
+            size = sinkStore.getSize(realpath)
+            if (writing):
+                if (flags & os.O_TRUNC) or (size is None):
+                    size = 0
+                if not os.path.isdir(os.path.dirname(realpath)):
+                    return SFTP_NO_SUCH_FILE
+                sinkStore.setSize(realpath, size)       # visible from the start, like a file on disk
+                return SinkHandle(realpath, flags, size)
+            if size is not None:
+                return SinkHandle(realpath, flags, size)
+
+        try:
+            fd = os.open(realpath, flags, 0644)
+        except OSError, e:
+            return SFTPServer.convert_errno(e.errno)
+        if (flags & os.O_WRONLY):
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif (flags & os.O_RDWR):
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = SinkHandle(realpath, flags)
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+
+        realpath = self.realPath(path)
+        if (discard) and sinkStore.remove(realpath):
+            return SFTP_OK
+        try:
+            os.remove(realpath)
+        except OSError, e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+
+        oldreal = self.realPath(oldpath)
+        newreal = self.realPath(newpath)
+        if (discard) and sinkStore.rename(oldreal, newreal):
+            return SFTP_OK
+        try:
+            os.rename(oldreal, newreal)
+        except OSError, e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    posix_rename = rename
+
+    def mkdir(self, path, attr):
+
+        try:
+            os.mkdir(self.realPath(path))
+        except OSError, e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rmdir(self, path):
+
+        try:
+            os.rmdir(self.realPath(path))
+        except OSError, e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def chattr(self, path, attr):
+
+        return SFTP_OK
+
+# ------------------------------------------------------------------------------------------
+# serveConnection(sock)
+#
+# Runs the ssh transport (paramiko starts its own thread for it) of one accepted connection.
+# ------------------------------------------------------------------------------------------
+
+def serveConnection(sock):
+
+    try:
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(hostKey)
+        transport.set_subsystem_handler('sftp', SFTPServer, SinkSFTP)
+        transport.start_server(server=SinkServer())
+    except Exception, e:
+        vprint("Connection failed:", str(e))
+        sock.close()
+
+# ------------------------------------------------------------------------------------------
+# loadHostKey()
+#
+# Loads the host key from hostKeyFile, generating (and saving) one the first time, so that a
+# known_hosts entry stays valid from one run to the next.
+# ------------------------------------------------------------------------------------------
+
+def loadHostKey():
+
+    if os.path.exists(hostKeyFile):
+        return paramiko.RSAKey(filename=hostKeyFile)
+    print "Generating host key:", hostKeyFile
+    key = paramiko.RSAKey.generate(2048)
+    key.write_private_key_file(hostKeyFile)
+    return key
+
+# ------------------------------------------------------------------------------------------
+# reporter()
+#
+# Prints the counters every reportInterval seconds (runs as a daemon thread).
+# ------------------------------------------------------------------------------------------
+
+def reporter():
+
+    while True:
+        time.sleep(reportInterval)
+        print sinkStore.report()
+        sys.stdout.flush()
+
+# ------------------------------------------------------------------------------------------
+# sigterm(signum, frame)
+#
+# Treats SIGTERM like Ctrl-C, so that the counters still get printed.
+# ------------------------------------------------------------------------------------------
+
+def sigterm(signum, frame):
+
+    raise KeyboardInterrupt
+
+# ------------------------------------------------------------------------------------------
+# main
+# ------------------------------------------------------------------------------------------
+
+def main():
+
+    global sinkStore, hostKey
+
+    sinkStore = SinkStore(discard)
+    if not os.path.isdir(rootdir):
+        os.makedirs(rootdir)
+    hostKey = loadHostKey()
+
+    softlimit, hardlimit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if (softlimit < hardlimit):
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hardlimit, hardlimit))
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((bindaddr, port))
+    listener.listen(1024)
+    print "SFTP sink listening on", bindaddr + ":" + str(port), " User:", sftpuser, " Root:", rootdir, \
+          " Mode:", "discard" if discard else "disk"
+    print "Host key (known_hosts entry): [" + bindaddr + "]:" + str(port), hostKey.get_name(), hostKey.get_base64()
+    sys.stdout.flush()
+
+    if (reportInterval > 0):
+        thread = threading.Thread(target=reporter)
+        thread.daemon = True
+        thread.start()
+
+    signal.signal(signal.SIGTERM, sigterm)
+    try:
+        while True:
+            sock, addr = listener.accept()
+            vprint("Connection from", addr)
+            serveConnection(sock)
+    except KeyboardInterrupt:
+        pass
+    listener.close()
+    print
+    print sinkStore.report()
+
+# ------------------------------------------------------------------------------------------
+# vprint(args)
+#
+# prints args only if verbose mode is ON
+# ------------------------------------------------------------------------------------------
+
+def vprint(*args):
+
+    if verbose:
+       for arg in args:
+           print arg,
+       print
+
+# ------------------------------------------------------------------------------------------
+# Main
+# ------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    print "Running", os.path.basename(__file__), ver
+    parser = argparse.ArgumentParser(epilog=longdescription)
+#    Note that '-h'is automatically applied by argparse
+    parser.add_argument('-v', help='verbose mode [Default: False]', action="store_true")
+    parser.add_argument('-a', help='Address to listen on [Default: ' + bindaddr + ']')
+    parser.add_argument('-l', help='Port to listen on [Default: ' + str(port) + ']')
+    parser.add_argument('-u', help='sftp username accepted [Default: ' + sftpuser + ']')
+    parser.add_argument('-p', help='sftp password accepted [Default: ' + sftpuserpw + ']')
+    parser.add_argument('-r', help='Root directory [Default: ' + rootdir + ']')
+    parser.add_argument('-k', help='Host key file, generated if it does not exist [Default: ' + hostKeyFile + ']')
+    parser.add_argument('-x', help='Discard mode: keep only the names and sizes of uploaded files, not their data [Default: False]', action="store_true")
+    parser.add_argument('-i', help='Print the transfer counters every I seconds [Default: only on exit]')
+
+    args = parser.parse_args()
+
+    # verbose?
+    if args.v:
+        verbose = True
+        vprint("Verbose mode ON")
+
+    # listen address?
+    if args.a:
+        bindaddr = args.a
+        vprint("Listen address: " + bindaddr)
+
+    # listen port?
+    if args.l:
+        port = int(args.l)
+        vprint("Listen port: " + args.l)
+
+    # userid?
+    if args.u:
+        sftpuser = args.u
+        vprint("sftp userid: " + sftpuser)
+
+    # password?
+    if args.p:
+        sftpuserpw = args.p
+        vprint("sftp password: " + sftpuserpw)
+
+    # root directory?
+    if args.r:
+        rootdir = args.r
+        vprint("Root directory: " + rootdir)
+
+    # host key?
+    if args.k:
+        hostKeyFile = args.k
+        vprint("Host key file: " + hostKeyFile)
+
+    # discard mode?
+    if args.x:
+        discard = True
+        vprint("Discard mode: ON")
+
+    # periodic report?
+    if args.i:
+        reportInterval = int(args.i)
+        vprint("Report interval (sec): " + args.i)
+
+    main()